@@ -1,8 +1,20 @@
-from fastapi import APIRouter
-
-from .star import router as star_router
-from .exoplanet import router as exoplanet_router
-
-router = APIRouter()
-router.include_router(star_router, prefix="/star")
-router.include_router(exoplanet_router, prefix="/exoplanet")
\ No newline at end of file
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from . import metrics
+from .star import router as star_router
+from .exoplanet import router as exoplanet_router
+from .constellation import router as constellation_router
+
+router = APIRouter()
+router.include_router(star_router, prefix="/star")
+router.include_router(exoplanet_router, prefix="/exoplanet")
+router.include_router(constellation_router, prefix="/constellations")
+
+
+@router.get("/metrics")
+async def get_metrics():
+    """
+    Metrics of this worker in the Prometheus text format (see api/metrics.py).
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,332 @@
+import gzip
+import io
+import logging
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import httpx
+
+from api import config, metrics
+
+# Client of the Gaia archive TAP service.
+# One client per archive URL (GAIA_TAP_URL, the ESA archive when empty, or a local
+# stand-in such as benchmark/fake_gaia.py) owns a persistent HTTP connection pool and
+# sends synchronous ADQL queries with:
+# - a concurrency budget (ARCHIVE_MAX_CONCURRENCY queries in flight per process) and a
+#   rate budget (ARCHIVE_RATE queries per second),
+# - retries of connection errors, 429 and 5xx answers with jittered exponential backoff,
+# - query merging: box queries submitted within ARCHIVE_MERGE_WINDOW seconds that only
+#   differ by their box, and whose boxes are identical or sit side by side in RA, are
+#   sent as one query over the union box with a proportionally larger TOP. The rows are
+#   split back per box; a box the merged TOP cut short is queried again on its own.
+
+ESA_URL = "https://gea.esac.esa.int/"
+SYNC_PATH = "tap-server/tap/sync"
+STATS = ("queries", "requests", "merged", "retries", "errors")
+
+logger = logging.getLogger(__name__)
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+class ArchiveError(Exception):
+    pass
+
+
+class BoxQuery:
+    """
+    SELECT TOP `top` `select` FROM `table` WHERE `where` AND <box> ORDER BY `order_by`.
+    The box is ra_min <= ra < ra_max and dec_min <= dec < dec_max (no RA wrap), `where`
+    may be None.
+    """
+
+    def __init__(self, select, table, where, order_by, top, box):
+        self.select = select
+        self.table = table
+        self.where = where
+        self.order_by = order_by
+        self.top = top
+        self.box = tuple(float(bound) for bound in box)
+
+    @property
+    def shape(self):
+        """
+        Everything but the box: queries of the same shape can be merged.
+        """
+        return self.select, self.table, self.where, self.order_by, self.top
+
+    def adql(self, box=None, top=None):
+        ra_min, ra_max, dec_min, dec_max = box or self.box
+        where = f"{self.where} AND " if self.where else ""
+        return (f"SELECT TOP {top or self.top} {self.select} FROM {self.table} "
+                f"WHERE {where}ra >= {ra_min} AND ra < {ra_max} "
+                f"AND dec >= {dec_min} AND dec < {dec_max} ORDER BY {self.order_by}")
+
+
+def merge_groups(queries, max_boxes=None):
+    """
+    Group queries that can be sent as one: same shape and boxes that are identical or
+    adjacent in RA with the same declination range.
+    Returns:
+        list of (box, [query, ...]) with the union box of every group
+    """
+    max_boxes = max_boxes or config.ARCHIVE_MERGE_MAX
+    rows = {}
+    for query in queries:
+        ra_min, ra_max, dec_min, dec_max = query.box
+        rows.setdefault((query.shape, dec_min, dec_max), {}).setdefault((ra_min, ra_max), []).append(query)
+
+    groups = []
+    for (_, dec_min, dec_max), boxes in rows.items():
+        run, run_box = [], None
+        for ra_min, ra_max in sorted(boxes):
+            members = boxes[(ra_min, ra_max)]
+            distinct = len({query.box for query in run})
+            if run and run_box[1] == ra_min and distinct < max_boxes:
+                run += members
+                run_box = (run_box[0], ra_max)
+                continue
+            if run:
+                groups.append(((run_box[0], run_box[1], dec_min, dec_max), run))
+            run, run_box = list(members), (ra_min, ra_max)
+        groups.append(((run_box[0], run_box[1], dec_min, dec_max), run))
+    return groups
+
+
+def split_rows(columns, box):
+    """
+    The rows of `columns` inside a box (ra_min <= ra < ra_max, dec_min <= dec < dec_max).
+    """
+    ra_min, ra_max, dec_min, dec_max = box
+    ra = columns["ra"]
+    dec = columns["dec"]
+    mask = (ra >= ra_min) & (ra < ra_max) & (dec >= dec_min) & (dec < dec_max)
+    return {name: values[mask] for name, values in columns.items()}
+
+
+class _Pending:
+    def __init__(self, query):
+        self.query = query
+        self.future = Future()
+
+
+class ArchiveClient:
+    """
+    Pooled, rate limited TAP client of one archive.
+    Args:
+        url: base URL of the archive, the TAP service is under tap-server/tap
+        parse: function turning a VOTable (bytes) into the result returned to callers
+    """
+
+    def __init__(self, url, parse=None):
+        self.url = url.rstrip("/") + "/"
+        self.parse = parse or parse_votable
+        self.stats = dict.fromkeys(STATS, 0)
+        self._http = httpx.Client(
+            timeout=httpx.Timeout(config.ARCHIVE_TIMEOUT, connect=min(10.0, config.ARCHIVE_TIMEOUT)),
+            limits=httpx.Limits(max_connections=config.ARCHIVE_MAX_CONCURRENCY,
+                                max_keepalive_connections=config.ARCHIVE_MAX_CONCURRENCY))
+        self._pool = ThreadPoolExecutor(max_workers=max(config.ARCHIVE_MAX_CONCURRENCY, 1),
+                                        thread_name_prefix="archive")
+        self._lock = threading.Lock()
+        self._pending = []
+        self._queued = {}
+        self._collecting = False
+        self._closed = threading.Event()
+        self._next_slot = 0.0
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.stats[name] += n
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats)
+
+    def close(self):
+        """
+        Stop the client. Queries still waiting for the merge window or for a worker fail
+        with ArchiveError, so do the queries submitted afterwards.
+        """
+        with self._lock:
+            self._closed.set()
+            waiting, self._pending = self._pending, []
+            for group in self._queued.values():
+                waiting.extend(group)
+            self._queued.clear()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        _fail(waiting, ArchiveError("archive client closed"))
+        self._http.close()
+
+    def _wait_rate(self):
+        """
+        Block until the rate budget allows the next request.
+        """
+        if config.ARCHIVE_RATE <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + 1 / config.ARCHIVE_RATE
+        if slot > now:
+            time.sleep(slot - now)
+
+    def _backoff(self, attempt, retry_after=None):
+        if retry_after is not None:
+            return retry_after
+        # full jitter: anywhere between no wait and the exponential bound
+        return random.uniform(0, config.ARCHIVE_BACKOFF * 2 ** attempt)
+
+    def request(self, adql):
+        """
+        Send one synchronous ADQL query and return the parsed result.
+        Connection errors, 429 and 5xx answers are retried ARCHIVE_RETRIES times.
+        """
+        data = {"REQUEST": "doQuery", "LANG": "ADQL", "FORMAT": "votable_gzip", "PHASE": "RUN", "QUERY": adql}
+        for attempt in range(config.ARCHIVE_RETRIES + 1):
+            self._wait_rate()
+            self._count("requests")
+            retry_after = None
+            try:
+                response = self._http.post(self.url + SYNC_PATH, data=data)
+            except httpx.TransportError as error:
+                metrics.archive_requests.inc("error")
+                failure = "{}: {}".format(type(error).__name__, error)
+            else:
+                metrics.archive_requests.inc(str(response.status_code))
+                if response.status_code == 200:
+                    return self.parse(response.content)
+                failure = "HTTP {}".format(response.status_code)
+                if response.status_code != 429 and response.status_code < 500:
+                    break
+                try:
+                    retry_after = min(float(response.headers.get("Retry-After", "")), 60.0)
+                except ValueError:
+                    pass
+            if attempt < config.ARCHIVE_RETRIES:
+                self._count("retries")
+                logger.info("archive query failed (%s), retrying", failure)
+                time.sleep(self._backoff(attempt, retry_after))
+        self._count("errors")
+        raise ArchiveError("Gaia archive query failed: {}".format(failure))
+
+    def query(self, query):
+        """
+        Run a BoxQuery and return its rows, merged with the concurrent queries of other
+        threads where possible (see merge_groups).
+        """
+        pending = _Pending(query)
+        self._count("queries")
+        with self._lock:
+            if self._closed.is_set():
+                raise ArchiveError("archive client closed")
+            self._pending.append(pending)
+            leader = not self._collecting
+            self._collecting = True
+        if leader:
+            # the first caller waits for the merge window, then sends the whole batch
+            self._closed.wait(config.ARCHIVE_MERGE_WINDOW)
+            with self._lock:
+                batch, self._pending = self._pending, []
+                self._collecting = False
+            by_query = {}
+            for item in batch:
+                by_query.setdefault(id(item.query), []).append(item)
+            for box, queries in merge_groups([item.query for item in batch]):
+                waiting = [item for query in queries for item in by_query.pop(id(query), [])]
+                self._submit(box, waiting)
+        return pending.future.result()
+
+    def _submit(self, box, waiting):
+        with self._lock:
+            if not self._closed.is_set():
+                # queued until a worker picks the group up, close() fails it before that
+                self._queued[id(waiting)] = waiting
+                self._pool.submit(metrics.copy_context().run, self._run_group, box, waiting)
+                return
+        _fail(waiting, ArchiveError("archive client closed"))
+
+    def _run_group(self, box, waiting):
+        with self._lock:
+            if self._queued.pop(id(waiting), None) is None:
+                return
+        try:
+            boxes = list(dict.fromkeys(item.query.box for item in waiting))
+            query = waiting[0].query
+            if len(boxes) == 1:
+                rows = self.request(query.adql(box))
+                for item in waiting:
+                    item.future.set_result(rows)
+                return
+
+            top = query.top * len(boxes)
+            rows = self.request(query.adql(box, top))
+            self._count("merged", len(waiting))
+            truncated = len(rows["ra"]) >= top
+            results = {}
+            for member in boxes:
+                part = split_rows(rows, member)
+                if len(part["ra"]) > query.top:
+                    part = {name: values[:query.top] for name, values in part.items()}
+                elif truncated and len(part["ra"]) < query.top:
+                    # the merged TOP was filled by the other boxes, this one may miss stars
+                    part = self.request(query.adql(member))
+                results[member] = part
+            for item in waiting:
+                item.future.set_result(results[item.query.box])
+        except BaseException as error:
+            _fail(waiting, error)
+
+
+def _fail(waiting, error):
+    for item in waiting:
+        if not item.future.done():
+            item.future.set_exception(error)
+
+
+def parse_votable(content):
+    """
+    Columns of a (possibly gzip compressed) VOTable, see tile_cache.table_to_columns.
+    """
+    from astropy.io.votable import parse_single_table
+
+    from api.tile_cache import table_to_columns
+
+    if content[:2] == b"\x1f\x8b":
+        content = gzip.decompress(content)
+    return table_to_columns(parse_single_table(io.BytesIO(content)).to_table())
+
+
+def get_client():
+    """
+    The client of GAIA_TAP_URL (the ESA archive when empty), created on first use.
+    """
+    url = config.GAIA_TAP_URL or ESA_URL
+    with _clients_lock:
+        client = _clients.get(url)
+        if client is None:
+            client = ArchiveClient(url)
+            _clients[url] = client
+        return client
+
+
+def get_stats():
+    """
+    Counters of the client of GAIA_TAP_URL: box queries, HTTP requests, queries
+    answered by a merged request, retries and failed requests.
+    """
+    with _clients_lock:
+        client = _clients.get(config.GAIA_TAP_URL or ESA_URL)
+    if client is None:
+        return dict.fromkeys(STATS, 0)
+    return client.get_stats()
+
+
+def close_clients():
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
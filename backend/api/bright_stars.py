@@ -0,0 +1,224 @@
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+
+from api import config, tile_cache
+from api.catalog import heliocentric_xyz
+from api.spatial_index import SkyIndex, unit_vectors
+
+# Bright star tier.
+# The frontend bundles the Yale Bright Star Catalogue (frontend/public/stars_catalog.json,
+# every naked-eye star down to about V = 6.5, RA/Dec as sexagesimal strings, vmag/bv as
+# padded strings). It is parsed once into numeric columns in the Gaia layout of
+# tile_cache.COLUMNS plus heliocentric x, y, z, and compiled to an .npz file in CACHE_DIR
+# that later starts load directly. The tier needs no archive, so skyviews always have
+# their brightest stars: star queries are merged with it (stars with a Gaia counterpart
+# keep the Gaia row) and they fall back to it when the archive cannot be reached.
+#
+# The catalogue has no parallaxes. Stars without a Gaia counterpart are placed at the
+# distance where BRIGHT_STARS_ABS_MAG would look like their V magnitude, V stands in for
+# the G magnitude and B-V is stored as BP and RP magnitudes that data_api.bv_color_index
+# turns back into B-V. Without proper motions, bright stars without a Gaia counterpart
+# stand still in epoch propagation.
+
+COMPILED_VERSION = 2
+
+logger = logging.getLogger(__name__)
+
+_bright = None
+_lock = threading.Lock()
+
+
+def _parse_field(value):
+    value = value.strip()
+    return float(value) if value else np.nan
+
+
+def parse_catalog(stars):
+    """
+    Convert the entries of stars_catalog.json to star columns (see tile_cache.COLUMNS).
+    The Harvard Revised number (position in the catalogue) becomes the designation and
+    the negated source id. Entries without a position or V magnitude are dropped.
+    """
+    rows = []
+    for number, star in enumerate(stars, start=1):
+        try:
+            hours, minutes, seconds = (float(part) for part in star["RA"])
+            sign, degrees, arcmin, arcsec = star["DE"]
+            dec = float(degrees) + float(arcmin) / 60 + float(arcsec) / 3600
+            vmag = float(star["vmag"])
+        except ValueError:
+            continue
+        rows.append((number, (hours + minutes / 60 + seconds / 3600) * 15,
+                     -dec if sign.strip() == "-" else dec, vmag, _parse_field(star["bv"])))
+
+    number, ra, dec, vmag, bv = (np.array(values) for values in zip(*rows)) if rows else [np.empty(0)] * 5
+    distance = 10 ** ((vmag - config.BRIGHT_STARS_ABS_MAG + 5) / 5)
+    return {
+        "source_id": -number.astype(np.int64),
+        "DESIGNATION": np.array(["HR {}".format(n) for n in number.astype(np.int64)], dtype=str),
+        "ra": ra.astype(np.float64),
+        "dec": dec.astype(np.float64),
+        "parallax": 1000 / distance,
+        "phot_g_mean_mag": vmag.astype(np.float64),
+        "phot_bp_mean_mag": vmag.astype(np.float64),
+        "phot_rp_mean_mag": vmag - bv / 0.751,
+        "pmra": np.full(len(vmag), np.nan),
+        "pmdec": np.full(len(vmag), np.nan),
+        "radial_velocity": np.full(len(vmag), np.nan),
+    }
+
+
+def compiled_path():
+    return os.path.join(config.CACHE_DIR, "bright_stars.npz")
+
+
+def _source_stamp(path):
+    st = os.stat(path)
+    return np.array([COMPILED_VERSION, st.st_size, st.st_mtime, config.BRIGHT_STARS_ABS_MAG])
+
+
+def compile_catalog(path=None, out=None):
+    """
+    Parse stars_catalog.json and write the compiled tier (columns and xyz) to `out`.
+    """
+    path = path or config.BRIGHT_STARS_PATH
+    out = out or compiled_path()
+    with open(path) as f:
+        columns = parse_catalog(json.load(f)["stars"])
+    xyz = heliocentric_xyz(columns["ra"], columns["dec"], columns["parallax"])
+
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    tmp_path = "{}.{}.{}.tmp".format(out, os.getpid(), threading.get_ident())
+    with open(tmp_path, "wb") as f:
+        np.savez(f, stamp=_source_stamp(path), xyz=xyz, **columns)
+    os.replace(tmp_path, out)
+    return columns, xyz
+
+
+def _load_compiled(path):
+    """
+    Return (columns, xyz) of the compiled tier, or None if it is missing or stale.
+    """
+    try:
+        with np.load(compiled_path()) as data:
+            if not np.array_equal(data["stamp"], _source_stamp(path)):
+                return None
+            return {name: data[name] for name in tile_cache.COLUMNS}, data["xyz"]
+    except (FileNotFoundError, EOFError, ValueError, KeyError):
+        return None
+
+
+class BrightStars:
+    """
+    The bright star tier.
+    Args:
+        columns: star columns in the layout of tile_cache.COLUMNS
+        xyz: (n, 3) heliocentric positions in parsecs
+    """
+
+    def __init__(self, columns, xyz):
+        self.columns = columns
+        self.xyz = xyz
+        self.index = SkyIndex.build(columns)
+
+    def __len__(self):
+        return len(self.xyz)
+
+    def query_box(self, ra_min, ra_max, dec_min, dec_max, parallax_min=None, n_stars=None, mag_max=None):
+        return self.index.query_box(ra_min, ra_max, dec_min, dec_max, parallax_min, n_stars, mag_max)
+
+    def unmatched(self, columns, rows=None):
+        """
+        Indices (into `rows` of the tier, all rows by default) of the bright stars
+        without a counterpart among the Gaia `columns`: a star within
+        BRIGHT_STARS_MATCH_ARCSEC whose G magnitude is within BRIGHT_STARS_MATCH_MAG.
+        """
+        bright = self.columns if rows is None else rows
+        if not len(bright["ra"]):
+            return np.empty(0, dtype=np.int64)
+        matched = match(bright["ra"], bright["dec"], bright["phot_g_mean_mag"],
+                        columns["ra"], columns["dec"], columns["phot_g_mean_mag"])
+        return np.flatnonzero(~matched)
+
+
+def match(ra, dec, mag, other_ra, other_dec, other_mag):
+    """
+    For every star of the first set, whether the second set has a star within
+    BRIGHT_STARS_MATCH_ARCSEC of it and BRIGHT_STARS_MATCH_MAG magnitudes of it.
+    """
+    radius = config.BRIGHT_STARS_MATCH_ARCSEC / 3600
+    mag = np.asarray(mag, dtype=np.float64)
+    other_dec = np.asarray(other_dec, dtype=np.float64)
+    other_mag = np.asarray(other_mag, dtype=np.float64)
+    # only stars about as bright as the faintest of the first set can match
+    bright_enough = np.flatnonzero(other_mag <= np.nanmax(mag, initial=-np.inf) + config.BRIGHT_STARS_MATCH_MAG)
+    order = bright_enough[np.argsort(other_dec[bright_enough], kind="stable")]
+    sorted_dec = other_dec[order]
+    dec = np.asarray(dec, dtype=np.float64)
+    lo = np.searchsorted(sorted_dec, dec - radius, side="left")
+    hi = np.searchsorted(sorted_dec, dec + radius, side="right")
+
+    vectors = unit_vectors(ra, dec)
+    other_vectors = unit_vectors(np.asarray(other_ra)[order], sorted_dec)
+    other_mag = other_mag[order]
+    cos_radius = np.cos(np.radians(radius))
+    matched = np.zeros(len(dec), dtype=bool)
+    # walk the declination windows in step, they hold very few stars each
+    for step in range(int((hi - lo).max(initial=0))):
+        stars = np.flatnonzero(~matched & (lo + step < hi))
+        candidates = lo[stars] + step
+        close = np.einsum("ij,ij->i", vectors[stars], other_vectors[candidates]) >= cos_radius
+        close &= np.abs(other_mag[candidates] - mag[stars]) <= config.BRIGHT_STARS_MATCH_MAG
+        matched[stars[close]] = True
+    return matched
+
+
+def _load():
+    path = config.BRIGHT_STARS_PATH
+    if not os.path.exists(path):
+        logger.warning("bright star catalog %s not found, the bright star tier is empty", path)
+        return BrightStars(tile_cache.empty_columns(), np.empty((0, 3), dtype=np.float32))
+    compiled = _load_compiled(path)
+    if compiled is None:
+        compiled = compile_catalog(path)
+    return BrightStars(*compiled)
+
+
+def get_bright_stars():
+    """
+    Return the process wide bright star tier, compiling it on first use.
+    """
+    global _bright
+    with _lock:
+        if _bright is None:
+            _bright = _load()
+        return _bright
+
+
+def reset():
+    global _bright
+    with _lock:
+        _bright = None
+
+
+def merge_box(columns, ra_min, ra_max, dec_min, dec_max, parallax_min=None, n_stars=None, mag_max=None):
+    """
+    Merge the bright stars of an RA/Dec box into the star columns a star backend returned
+    for the same query (bright stars with a Gaia counterpart among them are dropped).
+    Returns:
+        columns: the union sorted by G magnitude, at most n_stars rows
+    """
+    bright = get_bright_stars()
+    rows = bright.query_box(ra_min, ra_max, dec_min, dec_max, parallax_min, n_stars, mag_max)
+    extra = bright.unmatched(columns, rows)
+    if not len(extra):
+        return columns
+    merged = tile_cache.concat_columns([columns, tile_cache.take_columns(rows, extra)])
+    order = np.argsort(merged["phot_g_mean_mag"], kind="stable")
+    if n_stars is not None:
+        order = order[:n_stars]
+    return tile_cache.take_columns(merged, order)
@@ -0,0 +1,225 @@
+import logging
+import threading
+
+import numpy as np
+
+from api import config, tile_cache
+
+# Heliocentric cartesian star catalog.
+# Every catalog star keeps its position as x, y, z in parsecs (ICRS axes, sun at the
+# origin), so the sky seen from any exoplanet is one vectorized subtraction away.
+# With the offline store the positions are precomputed at ingest time (xyz.npy) and
+# memory-mapped; with the tile cache the catalog is assembled once from all tiles and
+# the bright star tier (see api/bright_stars.py).
+# Stars are looked up by Gaia source id through the permutation that sorts the source
+# ids (source_order.npy in the store, computed on first use otherwise): a batch of ids
+# is resolved with one binary search over the sorted ids.
+#
+# Building from the tile cache reads every tile of the sky. When all of them are cached
+# the catalog is built on first use; otherwise the build, which queries the archive for
+# the missing tiles, runs in a background thread (started on startup, see main.py) and
+# requests get CatalogLoading (a 503) until it has finished.
+
+logger = logging.getLogger(__name__)
+
+_catalog = None
+_catalog_lock = threading.Lock()
+_build_thread = None
+_build_error = None
+_generation = 0
+
+
+class CatalogLoading(Exception):
+    """
+    The catalog is still being built from the Gaia archive, try again later.
+    """
+
+
+def heliocentric_xyz(ra, dec, parallax):
+    """
+    Return an (n, 3) float32 array of heliocentric positions in parsecs.
+    Stars without a positive parallax get NaN positions.
+    """
+    parallax = np.asarray(parallax, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        distance = np.where(parallax > 0, 1000 / parallax, np.nan)
+    ra = np.radians(ra)
+    dec = np.radians(dec)
+    xyz = np.stack([np.cos(dec) * np.cos(ra), np.cos(dec) * np.sin(ra), np.sin(dec)], axis=1)
+    return (xyz * distance[:, None]).astype(np.float32)
+
+
+class Catalog:
+    """
+    Star columns together with their heliocentric positions.
+    Args:
+        columns: dictionary of arrays keyed by Gaia column name (may be memory-mapped)
+        xyz: (n, 3) heliocentric positions in parsecs
+        rows: function returning in-memory columns for row indices
+        source_order: permutation sorting the source ids, computed on first use if omitted
+    """
+
+    def __init__(self, columns, xyz, rows=None, source_order=None):
+        self.columns = columns
+        self.xyz = xyz
+        self._rows = rows
+        self._source_order = source_order
+        self._sorted_ids = None
+
+    def __len__(self):
+        return len(self.xyz)
+
+    def rows(self, index):
+        if self._rows is not None:
+            return self._rows(index)
+        return tile_cache.take_columns(self.columns, index)
+
+    @property
+    def source_order(self):
+        if self._source_order is None:
+            self._source_order = np.argsort(self.columns["source_id"], kind="stable")
+        return self._source_order
+
+    def find(self, source_ids):
+        """
+        Return the rows of stars given by Gaia source id, -1 for ids not in the catalog.
+        """
+        source_ids = np.asarray(source_ids, dtype=np.int64)
+        order = self.source_order
+        if self._sorted_ids is None:
+            self._sorted_ids = np.asarray(self.columns["source_id"])[order]
+        if not len(order):
+            return np.full(len(source_ids), -1, dtype=np.int64)
+        position = np.minimum(np.searchsorted(self._sorted_ids, source_ids), len(order) - 1)
+        return np.where(self._sorted_ids[position] == source_ids, order[position], -1).astype(np.int64)
+
+    def view_from(self, position, rows=slice(None)):
+        """
+        Return the sky seen from `position` (heliocentric x, y, z in parsecs), of every
+        star or of a slice of rows.
+        Returns:
+            ra, dec: sky positions in degrees
+            distance: distance from `position` in parsecs
+            mag: apparent G magnitude at `position`
+        """
+        rel = self.xyz[rows] - np.asarray(position, dtype=np.float32)
+        x, y, z = rel[:, 0].astype(np.float64), rel[:, 1].astype(np.float64), rel[:, 2].astype(np.float64)
+        distance = np.sqrt(x**2 + y**2 + z**2)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ra = np.degrees(np.arctan2(y, x)) % 360
+            dec = np.degrees(np.arcsin(z / distance))
+            sun_distance = 1000 / np.asarray(self.columns["parallax"][rows], dtype=np.float64)
+            mag = np.asarray(self.columns["phot_g_mean_mag"][rows], dtype=np.float64) + \
+                5 * np.log10(np.maximum(distance, 1e-6) / sun_distance)
+        return ra, dec, distance, mag
+
+
+def _build_catalog():
+    if config.STAR_BACKEND == "store":
+        from api import star_store
+
+        store = star_store.get_store()
+        return Catalog(store.columns, store.xyz, store.rows, store.source_order)
+
+    columns = tile_cache.query_box(0, 360, -90, 90)
+    xyz = heliocentric_xyz(columns["ra"], columns["dec"], columns["parallax"])
+    if config.BRIGHT_STARS:
+        from api import bright_stars
+
+        bright = bright_stars.get_bright_stars()
+        extra = bright.unmatched(columns)
+        columns = tile_cache.concat_columns([columns, tile_cache.take_columns(bright.columns, extra)])
+        xyz = np.concatenate([xyz, bright.xyz[extra]])
+    return Catalog(columns, xyz)
+
+
+def cached_locally():
+    """
+    Whether the catalog can be built without querying the archive.
+    """
+    if config.STAR_BACKEND == "store":
+        return True
+    return all(tile_cache.is_cached(key) for key in tile_cache.tiles_for_box(0, 360, -90, 90))
+
+
+def _build_in_background(generation):
+    global _catalog, _build_thread, _build_error
+    try:
+        built, error = _build_catalog(), None
+    except Exception as exception:
+        logger.exception("building the star catalog failed")
+        built, error = None, exception
+    with _catalog_lock:
+        if generation == _generation:
+            _catalog = built
+            _build_error = error
+        if _build_thread is threading.current_thread():
+            _build_thread = None
+
+
+def _start_build():
+    """
+    Start the background build unless one is running. Must be called with _catalog_lock held.
+    """
+    global _build_thread
+    if _build_thread is None:
+        _build_thread = threading.Thread(target=_build_in_background, args=(_generation,),
+                                         name="catalog-build", daemon=True)
+        _build_thread.start()
+    return _build_thread
+
+
+def get_catalog(wait=False):
+    """
+    Return the process wide cartesian catalog of the configured star backend.
+    Args:
+        wait: wait for a build that needs the archive instead of raising CatalogLoading
+    Raises:
+        CatalogLoading while the catalog is built from the archive in the background
+    """
+    global _catalog
+    with _catalog_lock:
+        if _catalog is not None:
+            return _catalog
+        if _build_thread is None and cached_locally():
+            _catalog = _build_catalog()
+            return _catalog
+        thread = _start_build()
+    if not wait:
+        raise CatalogLoading()
+    thread.join()
+    with _catalog_lock:
+        if _catalog is None:
+            raise _build_error or CatalogLoading()
+        return _catalog
+
+
+def preload():
+    """
+    Start building the catalog in the background if it needs the archive.
+    """
+    with _catalog_lock:
+        if _catalog is None and not cached_locally():
+            _start_build()
+
+
+def install(catalog):
+    """
+    Use a catalog built elsewhere, e.g. attached from shared memory (see api/shared_memory.py).
+    """
+    global _catalog
+    with _catalog_lock:
+        _catalog = catalog
+
+
+def reset():
+    """
+    Forget the cached catalog, e.g. after the backend configuration changed.
+    A build still running in the background is discarded when it finishes.
+    """
+    global _catalog, _build_thread, _build_error, _generation
+    with _catalog_lock:
+        _catalog = None
+        _build_thread = None
+        _build_error = None
+        _generation += 1
@@ -0,0 +1,139 @@
+import asyncio
+import gzip
+
+from api import config
+from api.metrics import span
+
+# Response compression middleware.
+# Bodies of at least COMPRESSION_MIN_SIZE bytes are compressed with the best encoding
+# the client accepts: brotli and zstd when their packages are installed, gzip always.
+# Bodies of COMPRESSION_THREAD_MIN_SIZE bytes or more are compressed on a worker thread
+# so the event loop keeps serving other requests. Responses that are already encoded
+# (e.g. the precompressed /exoplanet/all), streamed responses and binary formats that do
+# not compress well are passed through unchanged.
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# skipped content types (prefix match)
+EXCLUDED_TYPES = ("image/", "audio/", "video/", "font/woff", "application/zip", "application/gzip",
+                  "application/x-gzip", "text/event-stream")
+
+
+def available_encodings():
+    """
+    Encodings this process can produce, in order of preference.
+    """
+    encodings = []
+    for name in config.COMPRESSION_ENCODINGS:
+        if name == "br" and brotli is None or name == "zstd" and zstandard is None:
+            continue
+        encodings.append(name)
+    return encodings
+
+
+def choose_encoding(accept_encoding, encodings):
+    """
+    Return the first of `encodings` that an Accept-Encoding header allows, or None.
+    """
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    for name in encodings:
+        if accepted.get(name, accepted.get("*", 0)) > 0:
+            return name
+    return None
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=config.BROTLI_QUALITY)
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=config.ZSTD_LEVEL).compress(body)
+    return gzip.compress(body, compresslevel=config.COMPRESSION_LEVEL, mtime=0)
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing HTTP responses (see module comment).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not config.COMPRESSION_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict((name.lower(), value) for name, value in scope["headers"])
+        encoding = choose_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"), available_encodings())
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            if start is not None and not self._compressible(start, body, message.get("more_body", False)):
+                passthrough = True
+                await send(start)
+                start = None
+                await send(message)
+                return
+            if start is None:
+                await send(message)
+                return
+
+            with span("compress"):
+                if len(body) >= config.COMPRESSION_THREAD_MIN_SIZE:
+                    body = await asyncio.get_running_loop().run_in_executor(None, compress, body, encoding)
+                else:
+                    body = compress(body, encoding)
+            response_headers = [(name, value) for name, value in start["headers"]
+                                if name.lower() not in (b"content-length", b"vary")]
+            vary = [value for name, value in start["headers"] if name.lower() == b"vary"]
+            vary = b", ".join(vary + [b"Accept-Encoding"])
+            response_headers += [(b"content-encoding", encoding.encode("ascii")),
+                                 (b"content-length", str(len(body)).encode("ascii")),
+                                 (b"vary", vary)]
+            await send(dict(start, headers=response_headers))
+            start = None
+            await send({"type": "http.response.body", "body": body, "more_body": False})
+
+        await self.app(scope, receive, send_compressed)
+
+    @staticmethod
+    def _compressible(start, body, more_body):
+        if more_body or len(body) < config.COMPRESSION_MIN_SIZE:
+            return False
+        headers = dict((name.lower(), value) for name, value in start["headers"])
+        if b"content-encoding" in headers:
+            return False
+        content_type = headers.get(b"content-type", b"").decode("latin-1").lower()
+        return not content_type.startswith(EXCLUDED_TYPES)
@@ -0,0 +1,160 @@
+import os
+
+# Runtime configuration for the backend.
+# Every setting can be overridden with an environment variable of the same name
+# prefixed by EXOSKY_, e.g. EXOSKY_TILE_CACHE_DIR=/data/tiles.
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATIC_DIR = os.path.join(BACKEND_DIR, "static")
+CACHE_DIR = os.environ.get("EXOSKY_CACHE_DIR", os.path.join(BACKEND_DIR, "cache"))
+
+# Mount the /api/v1/test/run-tests/ route (development only, it imports matplotlib)
+ENABLE_TEST_ROUTES = os.environ.get("EXOSKY_ENABLE_TEST_ROUTES", "0") == "1"
+
+# Gaia table used for every star query
+GAIA_TABLE = os.environ.get("EXOSKY_GAIA_TABLE", "gaiadr2.gaia_source")
+
+# Base URL of the Gaia archive (TAP service under tap-server/tap), empty for the ESA
+# archive. Benchmarks point it to a local stand-in (see benchmark/fake_gaia.py).
+GAIA_TAP_URL = os.environ.get("EXOSKY_GAIA_TAP_URL", "")
+
+# Gaia archive client (see api/archive.py): queries in flight and per second (0 for no
+# rate limit), HTTP timeout and retries with jittered backoff (seconds, doubled on every
+# retry), how long box queries wait to be merged and how many boxes one query may cover
+ARCHIVE_MAX_CONCURRENCY = int(os.environ.get("EXOSKY_ARCHIVE_MAX_CONCURRENCY", 4))
+ARCHIVE_RATE = float(os.environ.get("EXOSKY_ARCHIVE_RATE", 5))
+ARCHIVE_TIMEOUT = float(os.environ.get("EXOSKY_ARCHIVE_TIMEOUT", 120))
+ARCHIVE_RETRIES = int(os.environ.get("EXOSKY_ARCHIVE_RETRIES", 3))
+ARCHIVE_BACKOFF = float(os.environ.get("EXOSKY_ARCHIVE_BACKOFF", 1.0))
+ARCHIVE_MERGE_WINDOW = float(os.environ.get("EXOSKY_ARCHIVE_MERGE_WINDOW", 0.02))
+ARCHIVE_MERGE_MAX = int(os.environ.get("EXOSKY_ARCHIVE_MERGE_MAX", 8))
+
+# Where star data comes from: "tiles" (Gaia archive behind the tile cache)
+# or "store" (offline memory-mapped store, see api/star_store.py)
+STAR_BACKEND = os.environ.get("EXOSKY_STAR_BACKEND", "tiles")
+STAR_STORE_DIR = os.environ.get("EXOSKY_STAR_STORE_DIR", os.path.join(CACHE_DIR, "store"))
+
+# How get_skyview_from_exoplanet builds the view: "proxy" (earth view approximation)
+# or "cartesian" (re-center the heliocentric catalog on the exoplanet, see api/catalog.py)
+SKYVIEW_MODES = ("proxy", "cartesian")
+SKYVIEW_MODE = os.environ.get("EXOSKY_SKYVIEW_MODE", "proxy")
+
+# Skyview executor (see api/executor.py), 0 workers runs skyviews on the event loop
+SKYVIEW_WORKERS = int(os.environ.get("EXOSKY_SKYVIEW_WORKERS", 4))
+SKYVIEW_MAX_PENDING = int(os.environ.get("EXOSKY_SKYVIEW_MAX_PENDING", 64))
+SKYVIEW_TIMEOUT = float(os.environ.get("EXOSKY_SKYVIEW_TIMEOUT", 30))
+
+# Skyview request coalescing and result cache (see api/singleflight.py)
+# ra/dec and field of view of skyview requests are snapped to a grid of SKYVIEW_GRID_DEG degrees
+SKYVIEW_GRID_DEG = float(os.environ.get("EXOSKY_SKYVIEW_GRID_DEG", 0.5))
+SKYVIEW_CACHE_TTL = float(os.environ.get("EXOSKY_SKYVIEW_CACHE_TTL", 30))
+SKYVIEW_CACHE_ENTRIES = int(os.environ.get("EXOSKY_SKYVIEW_CACHE_ENTRIES", 256))
+
+# Largest star count a skyview request may ask for
+SKYVIEW_MAX_STARS = int(os.environ.get("EXOSKY_SKYVIEW_MAX_STARS", 50000))
+
+# Largest number of views in one batch skyview request
+SKYVIEW_BATCH_MAX_VIEWS = int(os.environ.get("EXOSKY_SKYVIEW_BATCH_MAX_VIEWS", 64))
+
+# Streaming skyview endpoints: stars per chunk and upper bound on stars per stream
+SKYVIEW_STREAM_CHUNK = int(os.environ.get("EXOSKY_SKYVIEW_STREAM_CHUNK", 2000))
+SKYVIEW_STREAM_MAX_STARS = int(os.environ.get("EXOSKY_SKYVIEW_STREAM_MAX_STARS", 200000))
+
+# Time-lapse frames (see api/epoch.py): reference epoch of GAIA_TABLE (Julian year, 2015.5
+# for Gaia DR2, 2016.0 for DR3), most frames, frames x stars and years from the reference
+# epoch per request, and how many results are cached
+GAIA_EPOCH = float(os.environ.get("EXOSKY_GAIA_EPOCH", 2015.5))
+FRAMES_MAX = int(os.environ.get("EXOSKY_FRAMES_MAX", 1000))
+FRAMES_MAX_VALUES = int(os.environ.get("EXOSKY_FRAMES_MAX_VALUES", 10000000))
+FRAMES_MAX_YEARS = float(os.environ.get("EXOSKY_FRAMES_MAX_YEARS", 1000000))
+FRAMES_CACHE_ENTRIES = int(os.environ.get("EXOSKY_FRAMES_CACHE_ENTRIES", 4))
+
+# User constellations (see api/constellation_store.py): SQLite database, most edges per
+# constellation and most constellations per page
+CONSTELLATION_DB = os.environ.get("EXOSKY_CONSTELLATION_DB", os.path.join(CACHE_DIR, "constellations.sqlite3"))
+CONSTELLATION_MAX_EDGES = int(os.environ.get("EXOSKY_CONSTELLATION_MAX_EDGES", 2000))
+CONSTELLATION_PAGE_MAX = int(os.environ.get("EXOSKY_CONSTELLATION_PAGE_MAX", 100))
+
+# Viewing sessions (see api/session.py): open sessions per worker, seconds without a
+# camera update before a session is closed, exoplanets whose catalog view is kept
+SESSION_MAX = int(os.environ.get("EXOSKY_SESSION_MAX", 256))
+SESSION_IDLE_TIMEOUT = float(os.environ.get("EXOSKY_SESSION_IDLE_TIMEOUT", 300))
+SESSION_CATALOG_VIEWS = int(os.environ.get("EXOSKY_SESSION_CATALOG_VIEWS", 4))
+
+# Worker processes started by serve.py. With more than one, SHARED_MEMORY has the parent
+# load the star data once into a shared memory segment the workers attach to (see
+# api/shared_memory.py). SHARED_MEMORY_NAME is set by serve.py for its workers.
+WORKERS = int(os.environ.get("EXOSKY_WORKERS", 1))
+SHARED_MEMORY = os.environ.get("EXOSKY_SHARED_MEMORY", "1") == "1"
+SHARED_MEMORY_NAME = os.environ.get("EXOSKY_SHARED_MEMORY_NAME", "")
+
+# Build the cartesian catalog (see api/catalog.py) on startup when it needs the archive,
+# requests that need it get a 503 until the build has finished
+CATALOG_PRELOAD = os.environ.get("EXOSKY_CATALOG_PRELOAD", "1") == "1"
+
+# Precomputed sky per exoplanet (see api/planet_sky.py)
+PLANET_SKY_STARS = int(os.environ.get("EXOSKY_PLANET_SKY_STARS", 200000))
+PLANET_SKY_WARM = os.environ.get("EXOSKY_PLANET_SKY_WARM", "0") == "1"
+# Skies kept per process, least recently used ones are dropped
+PLANET_SKY_ENTRIES = int(os.environ.get("EXOSKY_PLANET_SKY_ENTRIES", 8))
+
+# Bright star tier (see api/bright_stars.py): the catalog bundled with the frontend, the
+# absolute magnitude that places stars without a Gaia counterpart, and how close (arcsec,
+# magnitudes) a Gaia star must be to count as the same star
+BRIGHT_STARS = os.environ.get("EXOSKY_BRIGHT_STARS", "1") == "1"
+BRIGHT_STARS_PATH = os.environ.get("EXOSKY_BRIGHT_STARS_PATH", os.path.join(
+    os.path.dirname(BACKEND_DIR), "frontend", "public", "stars_catalog.json"))
+BRIGHT_STARS_ABS_MAG = float(os.environ.get("EXOSKY_BRIGHT_STARS_ABS_MAG", 0.5))
+BRIGHT_STARS_MATCH_ARCSEC = float(os.environ.get("EXOSKY_BRIGHT_STARS_MATCH_ARCSEC", 60))
+BRIGHT_STARS_MATCH_MAG = float(os.environ.get("EXOSKY_BRIGHT_STARS_MATCH_MAG", 1.5))
+# How long (seconds) a skyview waits for tiles missing from the cache before it answers with
+# the bright star tier alone while the fetches go on (0 waits for the archive)
+ARCHIVE_DEADLINE = float(os.environ.get("EXOSKY_ARCHIVE_DEADLINE", 2))
+
+# Sky tile cache (see api/tile_cache.py)
+TILE_CACHE_DIR = os.environ.get("EXOSKY_TILE_CACHE_DIR", os.path.join(CACHE_DIR, "tiles"))
+TILE_SIZE_DEG = float(os.environ.get("EXOSKY_TILE_SIZE_DEG", 30))
+TILE_STAR_LIMIT = int(os.environ.get("EXOSKY_TILE_STAR_LIMIT", 5000))
+# Parallax floor (mas) of cached stars, 0 keeps every star like a plain archive query.
+# Callers pass their own parallax limit; a floor drops every star beyond 1000 / floor
+# parsecs from every view, including the earth view.
+TILE_MIN_PARALLAX = float(os.environ.get("EXOSKY_TILE_MIN_PARALLAX", 0))
+# Parallax floors (mas) of the tile layouts read by queries with a parallax limit, see
+# tile_cache.layout_floor
+TILE_PARALLAX_FLOORS = tuple(float(floor) for floor in
+                             os.environ.get("EXOSKY_TILE_PARALLAX_FLOORS", "1,2,4,8,16,32").split(","))
+TILE_CACHE_MAX_BYTES = int(os.environ.get("EXOSKY_TILE_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+TILE_MEMORY_TILES = int(os.environ.get("EXOSKY_TILE_MEMORY_TILES", 128))
+# Tiles of one query fetched from the archive in parallel
+TILE_FETCH_WORKERS = int(os.environ.get("EXOSKY_TILE_FETCH_WORKERS", 16))
+
+# Server-side sky images (see api/render.py): stars drawn per image, largest width or
+# height in pixels, default horizontal field of view in degrees, result cache, encoders
+RENDER_MAX_STARS = int(os.environ.get("EXOSKY_RENDER_MAX_STARS", 20000))
+RENDER_MAX_SIZE = int(os.environ.get("EXOSKY_RENDER_MAX_SIZE", 2048))
+RENDER_DEFAULT_FOV = float(os.environ.get("EXOSKY_RENDER_DEFAULT_FOV", 60))
+RENDER_CACHE_TTL = float(os.environ.get("EXOSKY_RENDER_CACHE_TTL", 600))
+RENDER_CACHE_ENTRIES = int(os.environ.get("EXOSKY_RENDER_CACHE_ENTRIES", 64))
+RENDER_PNG_LEVEL = int(os.environ.get("EXOSKY_RENDER_PNG_LEVEL", 6))
+RENDER_WEBP_QUALITY = int(os.environ.get("EXOSKY_RENDER_WEBP_QUALITY", 80))
+
+# Response compression (see api/compression.py): encodings in order of preference
+# (br and zstd need the brotli / zstandard packages), smallest body to compress, gzip
+# level, brotli quality, zstd level and body size from which compression runs on a thread
+COMPRESSION_ENABLED = os.environ.get("EXOSKY_COMPRESSION_ENABLED", "1") == "1"
+COMPRESSION_ENCODINGS = tuple(os.environ.get("EXOSKY_COMPRESSION_ENCODINGS", "br,zstd,gzip").split(","))
+COMPRESSION_MIN_SIZE = int(os.environ.get("EXOSKY_COMPRESSION_MIN_SIZE", 1024))
+COMPRESSION_LEVEL = int(os.environ.get("EXOSKY_COMPRESSION_LEVEL", 1))
+BROTLI_QUALITY = int(os.environ.get("EXOSKY_BROTLI_QUALITY", 5))
+ZSTD_LEVEL = int(os.environ.get("EXOSKY_ZSTD_LEVEL", 3))
+COMPRESSION_THREAD_MIN_SIZE = int(os.environ.get("EXOSKY_COMPRESSION_THREAD_MIN_SIZE", 256 * 1024))
+
+# Add a Server-Timing header with the skyview pipeline stages to every response (see api/metrics.py)
+SERVER_TIMING = os.environ.get("EXOSKY_SERVER_TIMING", "0") == "1"
+
+# Level of detail tiers (see api/lod.py): magnitude limits for the spatial indexes and
+# tile sizes for the tile cache, every tile holding TILE_STAR_LIMIT stars
+LOD_MAG_TIERS = tuple(float(mag) for mag in
+                      os.environ.get("EXOSKY_LOD_MAG_TIERS", "6,8,10,12,14,16").split(","))
+LOD_TILE_SIZES = tuple(float(size) for size in
+                       os.environ.get("EXOSKY_LOD_TILE_SIZES", "90,{:g},10".format(TILE_SIZE_DEG)).split(","))
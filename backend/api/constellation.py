@@ -0,0 +1,124 @@
+import json
+from typing import List, Optional, Union
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel
+
+from api import config
+from api.constellation_store import UnknownStars, get_store
+from api.executor import ClientDisconnected, run_blocking
+
+router = APIRouter()
+
+NDJSON = "application/x-ndjson"
+
+
+class ConstellationParams(BaseModel):
+    planet: str
+    name: str
+    author: Optional[str] = None
+    shared: bool = True
+    edges: List[List[Union[int, str]]]
+
+
+def _json(text, status_code=200):
+    return Response(content=text.encode("utf-8"), status_code=status_code, media_type="application/json")
+
+
+@router.post("/")
+async def save_constellation(params: ConstellationParams, request: Request):
+    """
+    Save a constellation drawn on the sky of an exoplanet (planet: its name).
+    edges are pairs of stars given by Gaia source id, Gaia designation or bright star name
+    ("HR <number>"); all of them are looked up in one batch. Unknown stars are a 400.
+    Returns the stored constellation (see api/constellation_store.py).
+    """
+    if (not params.planet or not params.name or not 0 < len(params.edges) <= config.CONSTELLATION_MAX_EDGES or
+        any(len(edge) != 2 for edge in params.edges)):
+        raise HTTPException(status_code=400, detail="Invalid parameters")
+
+    def save():
+        store = get_store()
+        constellation_id = store.save(params.planet, params.name, params.edges, params.author, params.shared)
+        return store.get(constellation_id)
+
+    try:
+        record = await run_blocking(request, save)
+    except UnknownStars as error:
+        return JSONResponse(status_code=400, content={"detail": "Unknown stars", "stars": error.stars})
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+    except ClientDisconnected:
+        return Response(status_code=499)
+    return _json(record, 201)
+
+
+@router.get("/")
+async def list_constellations(request: Request, planet: str, offset: int = 0, limit: int = 50):
+    """
+    Shared constellations of an exoplanet, newest first.
+    Example: /constellations/?planet=TRAPPIST-1%20e&limit=20
+    """
+    if offset < 0 or not 0 < limit <= config.CONSTELLATION_PAGE_MAX:
+        raise HTTPException(status_code=400, detail="Invalid parameters")
+    try:
+        records = await run_blocking(request, lambda: get_store().for_planet(planet, offset, limit))
+    except ClientDisconnected:
+        return Response(status_code=499)
+    return _json('{{"planet":{},"constellations":[{}]}}'.format(json.dumps(planet), ",".join(records)))
+
+
+@router.get("/export")
+async def export_constellations(request: Request, planet: Optional[str] = None):
+    """
+    Every constellation (of one exoplanet) as JSON lines, for backups and transfers.
+    """
+    try:
+        records = await run_blocking(request, lambda: list(get_store().export(planet)))
+    except ClientDisconnected:
+        return Response(status_code=499)
+    return StreamingResponse((record + "\n" for record in records), media_type=NDJSON)
+
+
+@router.post("/import")
+async def import_constellations(request: Request):
+    """
+    Add the constellations of an export (JSON lines) under new ids.
+    """
+    try:
+        lines = (await request.body()).decode("utf-8").splitlines()
+        count = await run_blocking(request, lambda: get_store().import_lines(lines))
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid constellation records")
+    except ClientDisconnected:
+        return Response(status_code=499)
+    return JSONResponse(status_code=200, content={"imported": count})
+
+
+@router.get("/{constellation_id}")
+async def get_constellation(constellation_id: int, request: Request):
+    """
+    One constellation with its stars and edges.
+    """
+    try:
+        record = await run_blocking(request, lambda: get_store().get(constellation_id))
+    except ClientDisconnected:
+        return Response(status_code=499)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Constellation not found")
+    return _json(record)
+
+
+@router.delete("/{constellation_id}")
+async def delete_constellation(constellation_id: int, request: Request):
+    """
+    Delete a constellation.
+    """
+    try:
+        deleted = await run_blocking(request, lambda: get_store().delete(constellation_id))
+    except ClientDisconnected:
+        return Response(status_code=499)
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Constellation not found")
+    return Response(status_code=204)
@@ -0,0 +1,277 @@
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+import numpy as np
+
+from api import config
+
+# Persistent store of the constellations users draw on exoplanet skies.
+# A constellation joins pairs of stars. When it is saved, all of its star references
+# (Gaia source ids or designations) are resolved at once against the cartesian catalog
+# (see catalog.Catalog.find) and the stars are stored with the constellation: their
+# source id, designation, heliocentric position and G magnitude as columnar JSON, and
+# the edges as index pairs into them. Loading therefore never touches the star data.
+# Constellations live in an SQLite database (CONSTELLATION_DB) in WAL mode, so every
+# uvicorn worker can open it; the shared constellations of an exoplanet are one range
+# read of the (planet, shared, created) index.
+#
+# Bulk export and import use JSON lines, one constellation per line:
+#     python -m api.constellation_store export constellations.jsonl [--planet "TRAPPIST-1 e"]
+#     python -m api.constellation_store import constellations.jsonl
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS constellations (
+    id INTEGER PRIMARY KEY,
+    planet TEXT NOT NULL,
+    name TEXT NOT NULL,
+    author TEXT,
+    shared INTEGER NOT NULL,
+    created REAL NOT NULL,
+    stars TEXT NOT NULL,
+    edges TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS constellations_planet ON constellations (planet, shared, created);
+"""
+FIELDS = "id, planet, name, author, shared, created, stars, edges"
+STAR_COLUMNS = (("source_id", "source_id"), ("name", "DESIGNATION"), ("ra", "ra"), ("dec", "dec"),
+                ("parallax", "parallax"), ("vmag", "phot_g_mean_mag"))
+
+_store = None
+_store_lock = threading.Lock()
+
+
+class UnknownStars(ValueError):
+    """
+    Star references that are not in the catalog.
+    """
+
+    def __init__(self, stars):
+        super().__init__("Unknown stars: {}".format(", ".join(str(star) for star in stars)))
+        self.stars = stars
+
+
+def source_id_of(star):
+    """
+    Gaia source id of a star reference: a source id, a Gaia designation
+    ("Gaia DR2 <source id>") or a bright star ("HR <number>", see api/bright_stars.py).
+    Raises ValueError for anything else.
+    """
+    if isinstance(star, bool):
+        raise ValueError("Invalid star: {}".format(star))
+    if isinstance(star, int):
+        return star
+    if isinstance(star, str):
+        prefix, _, number = star.strip().rpartition(" ")
+        if number.isdigit() and (prefix.startswith("Gaia ") or prefix in ("", "HR")):
+            return -int(number) if prefix == "HR" else int(number)
+    raise ValueError("Invalid star: {}".format(star))
+
+
+def resolve_stars(stars, star_catalog=None):
+    """
+    Look up star references (see source_id_of) in the catalog in one batch.
+    Returns:
+        columns: the distinct stars in the layout of STAR_COLUMNS, in order of first use
+        index: position of every reference in `columns`
+    Raises:
+        UnknownStars for references that are not in the catalog
+    """
+    from api import catalog
+
+    star_catalog = star_catalog or catalog.get_catalog()
+    source_ids = np.array([source_id_of(star) for star in stars], dtype=np.int64)
+    distinct, first, index = np.unique(source_ids, return_index=True, return_inverse=True)
+    # keep the stars in order of first use
+    order = np.argsort(first, kind="stable")
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    rows = star_catalog.find(distinct[order])
+    if np.any(rows < 0):
+        raise UnknownStars([stars[first[order][i]] for i in np.flatnonzero(rows < 0)])
+
+    r = star_catalog.rows(rows)
+    columns = {}
+    for column, name in STAR_COLUMNS:
+        values = np.asarray(r[name])
+        if values.dtype.kind == "f":
+            values = np.round(values.astype(np.float64), 8)
+            column_values = values.tolist()
+            for i in np.flatnonzero(~np.isfinite(values)):
+                column_values[i] = None
+        else:
+            column_values = values.tolist()
+        columns[column] = column_values
+    columns["name"] = [str(name) for name in columns["name"]]
+    return columns, rank[index].reshape(-1)
+
+
+def _record(row):
+    """
+    A database row as the JSON text of its constellation, the stored star and edge JSON
+    is spliced in as is.
+    """
+    constellation_id, planet, name, author, shared, created, stars, edges = row
+    head = json.dumps({"id": constellation_id, "planet": planet, "name": name, "author": author,
+                       "shared": bool(shared), "created": created}, separators=(",", ":"))
+    return head[:-1] + ',"stars":' + stars + ',"edges":' + edges + "}"
+
+
+class ConstellationStore:
+    """
+    Constellations in an SQLite database at `path`, created on first use.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def save(self, planet, name, edges, author=None, shared=True, star_catalog=None):
+        """
+        Resolve the endpoints of `edges` (pairs of star references) and store a new
+        constellation. Returns its id.
+        Raises:
+            UnknownStars, ValueError for invalid star references
+        """
+        endpoints = [star for edge in edges for star in edge]
+        stars, index = resolve_stars(endpoints, star_catalog)
+        record = {"planet": planet, "name": name, "author": author, "shared": shared, "created": time.time(),
+                  "stars": stars, "edges": index.reshape(-1, 2).tolist()}
+        return self.insert([record])[0]
+
+    def insert(self, records):
+        """
+        Store constellations with resolved stars (see get) in one transaction.
+        Returns their new ids.
+        """
+        rows = [(record["planet"], record["name"], record.get("author"), int(bool(record.get("shared", True))),
+                 float(record.get("created") or time.time()),
+                 json.dumps(record["stars"], separators=(",", ":")),
+                 json.dumps(record["edges"], separators=(",", ":"))) for record in records]
+        with self._lock:
+            cursor = self._db.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                ids = []
+                for row in rows:
+                    cursor.execute("INSERT INTO constellations (planet, name, author, shared, created, stars, edges) "
+                                   "VALUES (?, ?, ?, ?, ?, ?, ?)", row)
+                    ids.append(cursor.lastrowid)
+                cursor.execute("COMMIT")
+            except BaseException:
+                cursor.execute("ROLLBACK")
+                raise
+        return ids
+
+    def get(self, constellation_id):
+        """
+        The JSON text of one constellation, or None:
+            {"id", "planet", "name", "author", "shared", "created",
+             "stars": {"source_id": [...], "name": [...], "ra": [...], "dec": [...],
+                       "parallax": [...], "vmag": [...]},
+             "edges": [[i, j], ...]}  (indices into the stars)
+        """
+        with self._lock:
+            row = self._db.execute("SELECT {} FROM constellations WHERE id = ?".format(FIELDS),
+                                   (constellation_id,)).fetchone()
+        return None if row is None else _record(row)
+
+    def for_planet(self, planet, offset=0, limit=100, shared_only=True):
+        """
+        The JSON texts of the constellations of one exoplanet, newest first.
+        """
+        query = "SELECT {} FROM constellations WHERE planet = ?{} ORDER BY created DESC LIMIT ? OFFSET ?".format(
+            FIELDS, " AND shared = 1" if shared_only else "")
+        with self._lock:
+            rows = self._db.execute(query, (planet, limit, offset)).fetchall()
+        return [_record(row) for row in rows]
+
+    def delete(self, constellation_id):
+        with self._lock:
+            cursor = self._db.execute("DELETE FROM constellations WHERE id = ?", (constellation_id,))
+        return cursor.rowcount > 0
+
+    def export(self, planet=None):
+        """
+        Yield the JSON text of every constellation (of one exoplanet), oldest first.
+        """
+        query = "SELECT {} FROM constellations{} ORDER BY id".format(FIELDS, " WHERE planet = ?" if planet else "")
+        with self._lock:
+            rows = self._db.execute(query, (planet,) if planet else ()).fetchall()
+        for row in rows:
+            yield _record(row)
+
+    def import_lines(self, lines):
+        """
+        Store the constellations of exported JSON lines under new ids, in one transaction.
+        Returns the number of constellations imported.
+        """
+        records = []
+        for line in lines:
+            if line.strip():
+                record = json.loads(line)
+                if not isinstance(record.get("planet"), str) or not isinstance(record.get("name"), str) or \
+                        not isinstance(record.get("stars"), dict) or not isinstance(record.get("edges"), list):
+                    raise ValueError("Invalid constellation record")
+                records.append(record)
+        return len(self.insert(records))
+
+
+def get_store():
+    """
+    Return the process wide store of config.CONSTELLATION_DB.
+    """
+    global _store
+    with _store_lock:
+        if _store is None or _store.path != config.CONSTELLATION_DB:
+            _store = ConstellationStore(config.CONSTELLATION_DB)
+        return _store
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Exosky constellation store tools")
+    parser.add_argument("--db", default=config.CONSTELLATION_DB)
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="write constellations as JSON lines")
+    export_parser.add_argument("path", help="output file, - for stdout")
+    export_parser.add_argument("--planet", default=None)
+    import_parser = commands.add_parser("import", help="add constellations from JSON lines")
+    import_parser.add_argument("path", help="input file, - for stdin")
+    args = parser.parse_args(argv)
+
+    store = ConstellationStore(args.db)
+    if args.command == "export":
+        out = sys.stdout if args.path == "-" else open(args.path, "w")
+        n = 0
+        for record in store.export(args.planet):
+            out.write(record + "\n")
+            n += 1
+        if out is not sys.stdout:
+            out.close()
+        print("Exported {} constellations".format(n), file=sys.stderr)
+    elif args.command == "import":
+        source = sys.stdin if args.path == "-" else open(args.path)
+        n = store.import_lines(source)
+        if source is not sys.stdin:
+            source.close()
+        print("Imported {} constellations".format(n), file=sys.stderr)
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
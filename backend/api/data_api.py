@@ -1,13 +1,116 @@
-from astroquery.gaia import Gaia
-from astropy.coordinates import SkyCoord
-import astropy.units as u
+import logging
+import threading
 import numpy as np
 import math
 
+import httpx
+
+from api import archive, bright_stars, catalog, config, epoch, lod, planet_sky, star_store, tile_cache
+from api.metrics import span
+from api.spatial_index import in_ra_range, normalize_box
+
 # Data api for accessing gaia data from NASA
-# Api official documentation and examples: https://astroquery.readthedocs.io/en/latest/gaia/gaia.html
+# Archive queries go through api/archive.py (TAP service: https://gea.esac.esa.int/tap-server/tap)
 # https://gea.esac.esa.int/archive/documentation/GDR2/Gaia_archive/chap_datamodel/sec_dm_main_tables/ssec_dm_gaia_source.html
 
+logger = logging.getLogger(__name__)
+
+# set on the thread whose query fell back to the bright star tier (see with_bright_stars)
+_fallback = threading.local()
+
+
+
+'''
+Return the stars inside an RA/Dec box from the configured star backend.
+Args:
+    ra_min, ra_max: right ascension range in degrees
+    dec_min, dec_max: declination range in degrees
+    parallax_min: only keep stars with a larger parallax (mas)
+    n_stars: maximum number of stars, the brightest are kept
+    mag_max: only keep stars brighter than this G magnitude
+The box may wrap around RA 0/360 and reach over the poles.
+The bright star tier (api/bright_stars.py) is merged in, unless the store already holds it.
+Returns:
+    columns: dictionary of numpy arrays keyed by Gaia column name
+'''
+def query_stars(ra_min, ra_max, dec_min, dec_max, parallax_min=None, n_stars=None, mag_max=None):
+    if config.STAR_BACKEND == "store":
+        store = star_store.get_store()
+        r = store.query_box(ra_min, ra_max, dec_min, dec_max, parallax_min, n_stars, mag_max)
+        if config.BRIGHT_STARS and not store.meta.get("bright_stars"):
+            r = bright_stars.merge_box(r, ra_min, ra_max, dec_min, dec_max, parallax_min, n_stars, mag_max)
+        return r
+    return with_bright_stars(
+        lambda timeout: tile_cache.query_box(ra_min, ra_max, dec_min, dec_max, parallax_min, n_stars, mag_max,
+                                             timeout=timeout),
+        ra_min, ra_max, dec_min, dec_max, parallax_min, n_stars, mag_max)
+
+
+'''
+Return the brightest n_stars stars inside an RA/Dec box, read from the level of detail
+tier that matches the size of the box (see api/lod.py).
+Wide boxes read a shallow tier, narrow boxes get full depth.
+Args:
+    ra_min, ra_max, dec_min, dec_max, parallax_min: same as query_stars
+    n_stars: number of stars wanted
+Returns:
+    columns: dictionary of numpy arrays keyed by Gaia column name, sorted by G magnitude
+'''
+def query_stars_lod(ra_min, ra_max, dec_min, dec_max, n_stars, parallax_min=None):
+    if config.STAR_BACKEND == "store":
+        store = star_store.get_store()
+        r = lod.query_index(store.index, ra_min, ra_max, dec_min, dec_max, n_stars, parallax_min)
+        if config.BRIGHT_STARS and not store.meta.get("bright_stars"):
+            r = bright_stars.merge_box(r, ra_min, ra_max, dec_min, dec_max, parallax_min, n_stars)
+        return r
+    return with_bright_stars(
+        lambda timeout: lod.query_tiles(ra_min, ra_max, dec_min, dec_max, n_stars, parallax_min, timeout),
+        ra_min, ra_max, dec_min, dec_max, parallax_min, n_stars)
+
+
+'''
+Run a tile cache query and merge the bright star tier into its result.
+Bright stars with a Gaia counterpart in the result are dropped (see api/bright_stars.py).
+When the archive behind the tile cache cannot be reached (archive or transport errors),
+or the missing tiles are not fetched within ARCHIVE_DEADLINE seconds, the bright stars
+alone are returned, so a skyview always shows the brightest stars of the sky right away.
+Tiles still being fetched go on filling the cache for later queries. Such a fallback is
+recorded for track_fallback, so the result is not cached.
+Args:
+    query: function running the tile cache query, called with the timeout for missing tiles
+    ra_min, ra_max, dec_min, dec_max, parallax_min, n_stars, mag_max: the query's box and limits
+Returns:
+    columns: dictionary of numpy arrays keyed by Gaia column name, sorted by G magnitude
+'''
+def with_bright_stars(query, ra_min, ra_max, dec_min, dec_max, parallax_min=None, n_stars=None, mag_max=None):
+    if not config.BRIGHT_STARS:
+        return query(None)
+    try:
+        r = query(config.ARCHIVE_DEADLINE or None)
+    except tile_cache.TilesPending as e:
+        logger.info("%s, serving the bright star tier for now", e)
+        _fallback.used = True
+        r = tile_cache.empty_columns()
+    except (archive.ArchiveError, httpx.HTTPError):
+        logger.warning("star archive query failed, serving the bright star tier only", exc_info=True)
+        _fallback.used = True
+        r = tile_cache.empty_columns()
+    return bright_stars.merge_box(r, ra_min, ra_max, dec_min, dec_max, parallax_min, n_stars, mag_max)
+
+
+'''
+Run a skyview function and tell whether any of its star queries fell back to the bright
+star tier because the archive could not be reached in time (see with_bright_stars).
+Returns:
+    result, fallback: the function's result and whether it is a fallback result
+'''
+def track_fallback(func, *args, **kwargs):
+    _fallback.used = False
+    try:
+        result = func(*args, **kwargs)
+        return result, _fallback.used
+    finally:
+        _fallback.used = False
 
 
 '''
@@ -20,8 +123,14 @@ Args:
     dec: observed declination in degrees
     fovy_w: field of view width in degrees
     fovy_h: field of view height in degrees
+    n_stars: maximum number of stars, the brightest are kept; together with the field
+        of view it picks the level of detail tier that is read (see api/lod.py)
+    mode: "proxy" (earth view approximation) or "cartesian" (true 3D re-centering),
+        defaults to config.SKYVIEW_MODE. Exoplanets listed in Exoplanet.csv use their
+        precomputed sky (api/planet_sky.py) in both modes; in proxy mode the earth view
+        approximation is the fallback while the catalog behind the skies is loading.
 Returns:
-    data_dict: dictionary containing stars' positional information
+    data_dict: dictionary containing stars' positional information (numpy arrays)
         "name": star names (Gaia designation)
         "ra": right ascension in degrees
         "dec": declination in degrees
@@ -29,9 +138,20 @@ Returns:
         "brightness": star brightness
         "distance": star distance from the earth
 '''
-def get_skyview_from_exoplanet(ex_ra, ex_dec, ex_distance, ra, dec, fovy_w=400, fovy_h=400, n_stars=3000):
+def get_skyview_from_exoplanet(ex_ra, ex_dec, ex_distance, ra, dec, fovy_w=400, fovy_h=400, n_stars=3000, mode=None):
+    if (mode or config.SKYVIEW_MODE) == "cartesian":
+        return get_skyview_from_exoplanet_cartesian(ex_ra, ex_dec, ex_distance, ra, dec, fovy_w, fovy_h, n_stars)
+
+    planet = planet_sky.find_planet(ex_ra, ex_dec, ex_distance)
+    if planet is not None:
+        try:
+            return planet_skyview(planet, ra, dec, fovy_w, fovy_h, n_stars)
+        except catalog.CatalogLoading:
+            pass
+
     # get view approximation from earth
-    proxy_ra, proxy_dec = view_transform(ex_ra, ex_dec, ra, dec, ex_distance)
+    with span("view_transform"):
+        proxy_ra, proxy_dec = view_transform(ex_ra, ex_dec, ra, dec, ex_distance)
 
     ra_min = proxy_ra - fovy_w / 2
     ra_max = proxy_ra + fovy_w / 2
@@ -41,67 +161,217 @@ def get_skyview_from_exoplanet(ex_ra, ex_dec, ex_distance, ra, dec, fovy_w=400,
     ra_distance = math.sqrt(ex_distance**2 + 10000 - 2 * ex_distance * math.cos(math.pi-math.radians(ra)))
     distance_limit = math.sqrt(ra_distance**2 + 10000 - 2 * ra_distance * math.cos(math.pi-math.radians(dec)))
     parallax_limit = 1000 / distance_limit
-    # print("distance limit: ", distance_limit)
-    # print("parallax limit: ", parallax_limit)
-
-    # Get the star data from Gaia #TODO: change parallax limit
-    query2 = f"""
-            SELECT 
-            TOP {n_stars}
-            source_id, DESIGNATION, ra, dec, parallax, phot_g_mean_mag,
-            phot_bp_mean_mag, phot_rp_mean_mag
-            FROM gaiadr2.gaia_source
-            WHERE parallax > {parallax_limit}
-            AND ra BETWEEN {ra_min} AND {ra_max}
-            AND dec BETWEEN {dec_min} AND {dec_max}
-            """
-    r = Gaia.launch_job(query2).get_results()
-
-    l = len(r[['ra']])
+
+    # Get the star data
+    with span("query"):
+        r = query_stars_lod(ra_min, ra_max, dec_min, dec_max, n_stars, parallax_min=parallax_limit)
+
     name = r['DESIGNATION']
-    ra_values = r['ra']
-    dec_values = r['dec']
     parallex_values = r['parallax']
-    distance = 1000 / parallex_values    
-    mag_values = r['phot_g_mean_mag']  
-    bv_colors = []
-    ra_mean = np.mean(ra_values)
-    dec_mean = np.mean(dec_values)
-    bp_mag = r['phot_bp_mean_mag']
-    rp_mag = r['phot_rp_mean_mag']
-    
-    
+    distance = 1000 / parallex_values
+    mag_values = r['phot_g_mean_mag']
+
     # calculate relative position of the stars from the exoplanet
-    for i in range(l):
-        x, y, z = get_relative_pos(ex_ra, ex_dec, ex_distance, ra_values[i], dec_values[i], distance[i])
-        distance[i] = math.sqrt(x**2 + y**2 + z**2)
-        ra_values[i] = ra + ra_values[i] - ra_mean
-        dec_values[i] = dec + dec_values[i] - dec_mean
-        # ra_values[i], dec_values[i] = xyz_to_ra_dec(x, y, z)
-        # print(ra_values[i], dec_values[i], distance[i])
-        
-        bm = bp_mag[i]
-        rm = rp_mag[i]
-        # Calculate an approximate B-V color index
-        bv_color_index = 0.751 * (bm - rm)
-        bv_colors.append(bv_color_index)
+    with span("exoplanet_view"):
+        ra_values, dec_values, distance = exoplanet_view(ex_ra, ex_dec, ex_distance, ra, dec,
+                                                         r['ra'], r['dec'], distance)
+        bv_colors = bv_color_index(r['phot_bp_mean_mag'], r['phot_rp_mean_mag'])
 
-    # Size proxy (lower magnitude = brighter)
-    size_normalized = (np.max(mag_values) - mag_values) / (np.max(mag_values) - np.min(mag_values)) * 20 # Scale to 20
-    
-    # only extract useful data
-    data_dict = {
-        "name": name.tolist(),
-        "ra": ra_values.tolist(),
-        "dec": dec_values.tolist(),
-        "size": size_normalized.tolist(),
-        "brightness": mag_values.tolist(),
-        "bv": bv_colors,
-        "distance": distance.tolist(),
-        "parallax": parallex_values.tolist()
+    with span("skyview_dict"):
+        return skyview_dict(name, ra_values, dec_values, mag_values, bv_colors, distance, parallex_values)
+
+
+'''
+Return stars' positional information, observed from the exoplanet, by re-centering the
+heliocentric cartesian catalog (api/catalog.py) on the exoplanet.
+Every catalog star is moved into the exoplanet's frame in one vectorized operation, the
+stars inside the field of view are selected there and the brightest are kept.
+Exoplanets listed in Exoplanet.csv use their precomputed sky (api/planet_sky.py).
+Args:
+    same as get_skyview_from_exoplanet
+    catalog_view: result of catalog_view_from for this exoplanet, to share it between views
+Returns:
+    data_dict: same keys as get_skyview_from_exoplanet, with
+        "brightness": apparent G magnitude seen from the exoplanet
+        "distance": star distance from the exoplanet in parsecs
+        "parallax": star parallax seen from the exoplanet in mas
+'''
+def get_skyview_from_exoplanet_cartesian(ex_ra, ex_dec, ex_distance, ra, dec, fovy_w=400, fovy_h=400, n_stars=3000,
+                                         catalog_view=None):
+    planet = planet_sky.find_planet(ex_ra, ex_dec, ex_distance)
+    if planet is not None:
+        return planet_skyview(planet, ra, dec, fovy_w, fovy_h, n_stars)
+
+    if catalog_view is None:
+        with span("catalog_view"):
+            catalog_view = catalog_view_from(ex_ra, ex_dec, ex_distance)
+    with span("field_of_view"):
+        index = field_of_view(catalog_view, ra, dec, fovy_w, fovy_h)[:n_stars]
+    with span("skyview_dict"):
+        return catalog_view_dict(catalog_view, index)
+
+
+'''
+Return the skyview of an exoplanet of Exoplanet.csv from its precomputed sky
+(api/planet_sky.py): a lookup plus a field of view slice.
+Args:
+    planet: the Exoplanet
+    ra, dec, fovy_w, fovy_h, n_stars: same as get_skyview_from_exoplanet
+Returns:
+    data_dict: same as get_skyview_from_exoplanet_cartesian
+'''
+def planet_skyview(planet, ra, dec, fovy_w, fovy_h, n_stars):
+    with span("planet_sky"):
+        sky = planet_sky.get_planet_sky(planet)
+    with span("query"):
+        r = sky.query(ra, dec, fovy_w, fovy_h, n_stars)
+    with span("skyview_dict"):
+        return skyview_dict(r['DESIGNATION'], r['ra'], r['dec'], r['phot_g_mean_mag'],
+                            r['bv'], r['distance'], r['parallax'])
+
+
+'''
+Move the whole star catalog into the exoplanet's frame.
+Returns:
+    catalog_view: (catalog, ra_values, dec_values, distance, mag_values), the arrays
+        holding every catalog star as seen from the exoplanet
+'''
+def catalog_view_from(ex_ra, ex_dec, ex_distance):
+    stars = catalog.get_catalog()
+    return (stars,) + stars.view_from(ra_dec_to_xyz(ex_ra, ex_dec, ex_distance))
+
+
+'''
+Return the catalog rows inside a field of view of a catalog view, brightest first.
+'''
+def field_of_view(catalog_view, ra, dec, fovy_w, fovy_h):
+    _, ra_values, dec_values, _, mag_values = catalog_view
+    ra_start, ra_width, dec_min, dec_max = normalize_box(ra - fovy_w / 2, ra + fovy_w / 2,
+                                                         dec - fovy_h / 2, dec + fovy_h / 2)
+    visible = (np.isfinite(mag_values) & in_ra_range(ra_values, ra_start, ra_width) &
+               (dec_values >= dec_min) & (dec_values <= dec_max))
+    index = np.flatnonzero(visible)
+    return index[np.argsort(mag_values[index], kind="stable")]
+
+
+# catalog rows moved into an exoplanet's frame at a time by brightest_in_view
+VIEW_BLOCK_ROWS = 1 << 20
+
+
+'''
+Return the brightest stars of a field of view seen from a position, moving the catalog
+into that frame VIEW_BLOCK_ROWS rows at a time, so memory grows with n_stars and the
+block size instead of the catalog size.
+Args:
+    stars: the Catalog
+    position: heliocentric x, y, z in parsecs
+    ra, dec, fovy_w, fovy_h: the field of view
+    n_stars: number of stars kept, None for all
+Returns:
+    rows, ra_values, dec_values, distance, mag_values: catalog rows of the stars and their
+        view from the position, brightest first
+'''
+def brightest_in_view(stars, position, ra, dec, fovy_w, fovy_h, n_stars=None):
+    kept = (np.empty(0, dtype=np.int64),) + (np.empty(0),) * 4
+    for start in range(0, len(stars), VIEW_BLOCK_ROWS):
+        block = stars.view_from(position, slice(start, start + VIEW_BLOCK_ROWS))
+        index = field_of_view((stars,) + block, ra, dec, fovy_w, fovy_h)[:n_stars]
+        found = (index + start,) + tuple(values[index] for values in block)
+        kept = tuple(np.concatenate(pair) for pair in zip(kept, found))
+        order = np.argsort(kept[4], kind="stable")[:n_stars]
+        kept = tuple(values[order] for values in kept)
+    return kept
+
+
+'''
+Build the skyview dictionary of some rows of a catalog view.
+'''
+def catalog_view_dict(catalog_view, index):
+    stars, ra_values, dec_values, distance, mag_values = catalog_view
+    r = stars.rows(index)
+    bv_colors = bv_color_index(r['phot_bp_mean_mag'], r['phot_rp_mean_mag'])
+    return skyview_dict(r['DESIGNATION'], ra_values[index], dec_values[index], mag_values[index],
+                        bv_colors, distance[index], 1000 / distance[index])
+
+
+'''
+Return the sky seen from an exoplanet at several epochs, for time-lapses.
+The stars are the brightest n_stars of the field of view at the reference epoch of the
+catalog (config.GAIA_EPOCH), seen in the cartesian view (see
+get_skyview_from_exoplanet_cartesian); their positions are propagated to every epoch in
+one batched array operation (see api/epoch.py). Stars keep their place in every frame,
+also after they have moved out of the field of view.
+Args:
+    ex_ra, ex_dec, ex_distance, ra, dec, fovy_w, fovy_h, n_stars: same as get_skyview_from_exoplanet
+    years: years after the reference epoch, one per frame
+Returns:
+    frames: dictionary of numpy arrays
+        "epoch": (frames,) Julian year of every frame
+        "name": (stars,) star names, "bv": (stars,) B-V color index
+        "ra", "dec": (frames, stars) positions in degrees
+        "brightness": (frames, stars) apparent G magnitudes seen from the exoplanet
+'''
+def get_frames_from_exoplanet(ex_ra, ex_dec, ex_distance, ra, dec, fovy_w=400, fovy_h=400, n_stars=3000,
+                              years=(0,)):
+    with span("catalog_view"):
+        catalog_view = catalog_view_from(ex_ra, ex_dec, ex_distance)
+    with span("field_of_view"):
+        index = field_of_view(catalog_view, ra, dec, fovy_w, fovy_h)
+    stars = catalog_view[0]
+    # stars without a positive parallax have no distance to propagate
+    index = index[np.asarray(stars.columns['parallax'])[index] > 0][:n_stars]
+    r = stars.rows(index)
+    years = np.asarray(years, dtype=np.float64)
+
+    with span("epoch_frames"):
+        ra_values, dec_values, mag_values = epoch.sky_frames(
+            ra_dec_to_xyz(ex_ra, ex_dec, ex_distance), stars.xyz[index], epoch.velocities(r),
+            r['phot_g_mean_mag'], 1000 / r['parallax'], years)
+    return {
+        "epoch": config.GAIA_EPOCH + years,
+        "name": np.asarray(r['DESIGNATION']).astype(str),
+        "bv": bv_color_index(r['phot_bp_mean_mag'], r['phot_rp_mean_mag']),
+        "ra": ra_values,
+        "dec": dec_values,
+        "brightness": mag_values,
     }
-    
-    return data_dict
+
+
+# Six 90 x 90 degree views covering the whole sky: four around the equator and the two
+# polar caps (a box over a pole covers every right ascension, see normalize_box)
+CUBE_MAP_VIEWS = (("+ra0", 0, 0), ("+ra90", 90, 0), ("+ra180", 180, 0), ("+ra270", 270, 0),
+                  ("north", 0, 90), ("south", 0, -90))
+CUBE_MAP_FOV = 90
+
+
+'''
+Return the skyviews of several viewing directions from one exoplanet.
+Identical views are computed once. In cartesian mode the catalog is moved into the
+exoplanet's frame once for all views (or the planet's precomputed sky is used); in
+proxy mode the views share the star backend's tile and index caches.
+Args:
+    ex_ra, ex_dec, ex_distance: exoplanet position, same as get_skyview_from_exoplanet
+    views: list of (ra, dec, fovy_w, fovy_h, n_stars) tuples
+    mode: same as get_skyview_from_exoplanet
+Returns:
+    list of skyview dictionaries, one per view
+'''
+def get_skyviews_from_exoplanet(ex_ra, ex_dec, ex_distance, views, mode=None):
+    mode = mode or config.SKYVIEW_MODE
+    catalog_view = None
+    if mode == "cartesian" and planet_sky.find_planet(ex_ra, ex_dec, ex_distance) is None:
+        catalog_view = catalog_view_from(ex_ra, ex_dec, ex_distance)
+
+    results = {}
+    for view in views:
+        if view in results:
+            continue
+        if mode == "cartesian":
+            results[view] = get_skyview_from_exoplanet_cartesian(ex_ra, ex_dec, ex_distance, *view,
+                                                                 catalog_view=catalog_view)
+        else:
+            results[view] = get_skyview_from_exoplanet(ex_ra, ex_dec, ex_distance, *view, mode=mode)
+    return [results[view] for view in views]
 
 
 '''
@@ -111,8 +381,9 @@ Args:
     dec: declination in degrees
     fovy_w: field of view width in degrees
     fovy_h: field of view height in degrees
+    n_stars: maximum number of stars, the closest to the view center are kept
 Returns:
-    data_dict: dictionary containing stars' positional information
+    data_dict: dictionary containing stars' positional information (numpy arrays)
         "name": star names (Gaia designation)
         "x": x coordinates in 2D
         "y": y coordinates in 2D
@@ -120,50 +391,206 @@ Returns:
         "dec": declination in degrees
         "size": star size
         "brightness": star brightness
-        "distance": star distance from the earth
+        "distance": angular distance from the view center in degrees
 '''
-def get_skyview_from_earth(ra, dec, fovy_w=40, fovy_h=40):
-    coord = SkyCoord(ra=ra, dec=dec, unit=(u.degree, u.degree), frame='icrs')
-    width = u.Quantity(fovy_w, u.deg)
-    height = u.Quantity(fovy_h, u.deg)
+def get_skyview_from_earth(ra, dec, fovy_w=40, fovy_h=40, n_stars=50):
+    # Get the star data
+    with span("query"):
+        r = query_stars(ra - fovy_w / 2, ra + fovy_w / 2, dec - fovy_h / 2, dec + fovy_h / 2)
 
-    # Get the star data from Gaia
-    r = Gaia.query_object_async(coordinate=coord, width=width, height=height)
+    # keep the stars closest to the view center, like Gaia.query_object does
+    with span("nearest_to_center"):
+        dist = angular_distance(ra, dec, r['ra'], r['dec'])
+        order = np.argsort(dist, kind="stable")[:n_stars]
+        r = tile_cache.take_columns(r, order)
 
     name = r['DESIGNATION']
     ra_values = r['ra']
     dec_values = r['dec']
-    distance = r['dist']     
+    distance = dist[order]
     mag_values = r['phot_g_mean_mag']       
     parallex_values = r['parallax']
-    bv_colors = []
-    bp_mag = r['phot_bp_mean_mag']
-    rp_mag = r['phot_rp_mean_mag']
-    
-    for i in range(len(name)):
-        bm = bp_mag[i]
-        rm = rp_mag[i]
-        # Calculate an approximate B-V color index
-        bv_color_index = 0.751 * (bm - rm)
-        bv_colors.append(bv_color_index)
+    bv_colors = bv_color_index(r['phot_bp_mean_mag'], r['phot_rp_mean_mag'])
 
+    with span("skyview_dict"):
+        return skyview_dict(name, ra_values, dec_values, mag_values, bv_colors, distance, parallex_values)
+
+
+
+'''
+Yield the stars inside an RA/Dec box from the configured star backend in chunks,
+brightest first.
+Args:
+    ra_min, ra_max, dec_min, dec_max, parallax_min: same as query_stars
+    chunk_size: stars per chunk
+The store backend walks its spatial index band by band, the tile backend walks its
+tiles band by band (see tile_cache.iter_box), so only one band is held at a time.
+With the tile backend the bright star tier (api/bright_stars.py) comes first, before any
+tile is read; the Gaia counterparts of its stars are left out of the later chunks. When
+the archive cannot be reached after that, the stream ends with the bright stars.
+Returns:
+    iterator of column dictionaries, like query_stars
+'''
+def iter_stars(ra_min, ra_max, dec_min, dec_max, parallax_min=None, chunk_size=1000):
+    if config.STAR_BACKEND == "store":
+        yield from star_store.get_store().index.iter_box(ra_min, ra_max, dec_min, dec_max,
+                                                         parallax_min, chunk_size)
+        return
+    chunks = tile_cache.iter_box(ra_min, ra_max, dec_min, dec_max, parallax_min, chunk_size)
+    if not config.BRIGHT_STARS:
+        yield from chunks
+        return
+
+    bright = bright_stars.get_bright_stars().query_box(ra_min, ra_max, dec_min, dec_max, parallax_min)
+    for start in range(0, len(bright['ra']), chunk_size):
+        yield tile_cache.take_columns(bright, slice(start, start + chunk_size))
+    # fainter stars cannot be the counterpart of a bright star
+    horizon = np.nanmax(bright['phot_g_mean_mag'], initial=-np.inf) + config.BRIGHT_STARS_MATCH_MAG
+    try:
+        for r in chunks:
+            if len(r['ra']) and r['phot_g_mean_mag'][0] <= horizon:
+                sent = bright_stars.match(r['ra'], r['dec'], r['phot_g_mean_mag'],
+                                          bright['ra'], bright['dec'], bright['phot_g_mean_mag'])
+                r = tile_cache.take_columns(r, ~sent)
+            if len(r['ra']):
+                yield r
+    except (archive.ArchiveError, httpx.HTTPError):
+        if not len(bright['ra']):
+            raise
+        logger.warning("star archive query failed, the stream ends with the bright star tier", exc_info=True)
+
+
+'''
+Yield stars' positional information observed from the exoplanet in chunks, brightest
+(as seen from the exoplanet) first.
+Streaming always uses the cartesian view (see get_skyview_from_exoplanet_cartesian):
+the proxy view shifts stars by the mean position of the whole field, which is not known
+until every star has been read. Precomputed planet skies are walked band by band, other
+positions move the catalog into the exoplanet's frame block by block and only keep the
+brightest n_stars stars of the field (see brightest_in_view).
+Args:
+    ex_ra, ex_dec, ex_distance, ra, dec, fovy_w, fovy_h: same as get_skyview_from_exoplanet
+    n_stars: maximum number of stars over all chunks
+    chunk_size: stars per chunk
+Returns:
+    iterator of skyview dictionaries (see skyview_dict)
+'''
+def iter_skyview_from_exoplanet(ex_ra, ex_dec, ex_distance, ra, dec, fovy_w=400, fovy_h=400, n_stars=None,
+                                chunk_size=1000):
+    planet = planet_sky.find_planet(ex_ra, ex_dec, ex_distance)
+    if planet is not None:
+        chunks = planet_sky.get_planet_sky(planet).index.iter_box(
+            ra - fovy_w / 2, ra + fovy_w / 2, dec - fovy_h / 2, dec + fovy_h / 2, chunk_size=chunk_size)
+        for r in _limit_chunks(chunks, n_stars):
+            yield skyview_dict(r['DESIGNATION'], r['ra'], r['dec'], r['phot_g_mean_mag'],
+                               r['bv'], r['distance'], r['parallax'])
+        return
+
+    stars = catalog.get_catalog()
+    rows, ra_values, dec_values, distance, mag_values = brightest_in_view(
+        stars, ra_dec_to_xyz(ex_ra, ex_dec, ex_distance), ra, dec, fovy_w, fovy_h, n_stars)
+    for start in range(0, len(rows), chunk_size):
+        chunk = slice(start, start + chunk_size)
+        r = stars.rows(rows[chunk])
+        bv_colors = bv_color_index(r['phot_bp_mean_mag'], r['phot_rp_mean_mag'])
+        yield skyview_dict(r['DESIGNATION'], ra_values[chunk], dec_values[chunk], mag_values[chunk],
+                           bv_colors, distance[chunk], 1000 / distance[chunk])
+
+
+'''
+Yield stars' positional information observed from the earth in chunks, brightest first.
+Args:
+    ra, dec, fovy_w, fovy_h: same as get_skyview_from_earth
+    n_stars: maximum number of stars over all chunks
+    chunk_size: stars per chunk
+Returns:
+    iterator of skyview dictionaries, "distance" is the angular distance from the view center
+'''
+def iter_skyview_from_earth(ra, dec, fovy_w=40, fovy_h=40, n_stars=None, chunk_size=1000):
+    chunks = iter_stars(ra - fovy_w / 2, ra + fovy_w / 2, dec - fovy_h / 2, dec + fovy_h / 2,
+                        chunk_size=chunk_size)
+    for r in _limit_chunks(chunks, n_stars):
+        bv_colors = bv_color_index(r['phot_bp_mean_mag'], r['phot_rp_mean_mag'])
+        yield skyview_dict(r['DESIGNATION'], r['ra'], r['dec'], r['phot_g_mean_mag'], bv_colors,
+                           angular_distance(ra, dec, r['ra'], r['dec']), r['parallax'])
+
+
+def _limit_chunks(chunks, n_stars):
+    remaining = n_stars
+    for r in chunks:
+        if remaining is not None:
+            if remaining <= 0:
+                return
+            if len(r['ra']) > remaining:
+                r = {name: values[:remaining] for name, values in r.items()}
+            remaining -= len(r['ra'])
+        yield r
+
+
+'''
+Build the skyview result dictionary from star arrays.
+Values stay numpy arrays so responses can be encoded without per-star objects.
+The star size is a proxy scaled to [0, 20] from the magnitudes (lower magnitude = bigger);
+stars of a view without a magnitude range (one star, equal magnitudes) all get size 20.
+'''
+def skyview_dict(name, ra_values, dec_values, mag_values, bv_colors, distance, parallax):
     # Size proxy (lower magnitude = brighter)
-    size_normalized = (np.max(mag_values) - mag_values) / (np.max(mag_values) - np.min(mag_values)) * 20 # Scale to 20
+    mag_values = np.asarray(mag_values, dtype=np.float64)
+    mag_max = np.nanmax(mag_values) if np.any(np.isfinite(mag_values)) else np.nan
+    mag_range = mag_max - np.nanmin(mag_values) if np.isfinite(mag_max) else 0
+    if mag_range > 0:
+        size_normalized = (mag_max - mag_values) / mag_range * 20 # Scale to 20
+    else:
+        size_normalized = np.full(len(mag_values), 20.0)
 
     # only extract useful data
     data_dict = {
-        "name": name.tolist(),
-        "ra": ra_values.tolist(),
-        "dec": dec_values.tolist(),
-        "size": size_normalized.tolist(),
-        "brightness": mag_values.tolist(),
-        "bv": bv_colors,
-        "distance": distance.tolist(),
-        "parallax": parallex_values.tolist()
+        "name": np.asarray(name).astype(str),
+        "ra": np.asarray(ra_values, dtype=np.float64),
+        "dec": np.asarray(dec_values, dtype=np.float64),
+        "size": np.asarray(size_normalized, dtype=np.float64),
+        "brightness": np.asarray(mag_values, dtype=np.float64),
+        "bv": np.asarray(bv_colors, dtype=np.float64),
+        "distance": np.asarray(distance, dtype=np.float64),
+        "parallax": np.asarray(parallax, dtype=np.float64)
     }
 
     return data_dict
-    
+
+
+'''
+Move stars into the view from the exoplanet.
+Stars keep their sky offsets from the mean position of the field, re-centered on the
+viewing direction (RA offsets wrap around RA 0/360), and their distance becomes the distance from the exoplanet.
+Args:
+    ex_ra, ex_dec, ex_distance: exoplanet position in degrees and parsecs
+    ra, dec: observed direction in degrees
+    ra_values, dec_values, distance: star positions from the earth (arrays)
+Returns:
+    ra_values, dec_values, distance: star positions in the exoplanet view (arrays)
+'''
+def exoplanet_view(ex_ra, ex_dec, ex_distance, ra, dec, ra_values, dec_values, distance):
+    x, y, z = get_relative_pos(ex_ra, ex_dec, ex_distance, ra_values, dec_values, distance)
+    distance = np.sqrt(x**2 + y**2 + z**2)
+    if not len(ra_values):
+        return ra_values, dec_values, distance
+    # offsets around the viewing direction, so a field across RA 0/360 stays in one piece
+    ra_offsets = (ra_values - ra + 180) % 360 - 180
+    ra_values = ra + ra_offsets - np.mean(ra_offsets)
+    dec_values = dec + dec_values - np.mean(dec_values)
+    return ra_values, dec_values, distance
+
+
+'''
+Calculate an approximate B-V color index from Gaia BP and RP magnitudes.
+Args:
+    bp_mag: BP magnitudes (scalar or array)
+    rp_mag: RP magnitudes (scalar or array)
+Returns:
+    bv: B-V color index
+'''
+def bv_color_index(bp_mag, rp_mag):
+    return 0.751 * (np.asarray(bp_mag) - np.asarray(rp_mag))
 
 
 '''
@@ -191,6 +618,24 @@ def ra_dec_to_xy(ra_deg, dec_deg):
     return x_prime, y_prime
 
 
+'''
+Angular distance between two sky positions.
+Args:
+    ra1, dec1: first position in degrees
+    ra2, dec2: second position in degrees (scalars or arrays)
+Returns:
+    distance: angular distance in degrees
+'''
+def angular_distance(ra1, dec1, ra2, dec2):
+    ra1, dec1, ra2, dec2 = map(np.radians, (ra1, dec1, ra2, dec2))
+    cos_d = np.sin(dec1) * np.sin(dec2) + np.cos(dec1) * np.cos(dec2) * np.cos(ra1 - ra2)
+    return np.degrees(np.arccos(np.clip(cos_d, -1, 1)))
+
+
+'''
+Convert sky positions and distances to cartesian coordinates.
+Accepts scalars or numpy arrays.
+'''
 def ra_dec_to_xyz(ra_deg, dec_deg, dis):
     ra = np.radians(ra_deg)
     dec = np.radians(dec_deg)
@@ -202,6 +647,10 @@ def ra_dec_to_xyz(ra_deg, dec_deg, dis):
     
     return x, y, z
 
+'''
+Convert cartesian coordinates back to sky positions in degrees.
+Accepts scalars or numpy arrays.
+'''
 def xyz_to_ra_dec(x, y, z):
     r = np.sqrt(x**2 + y**2 + z**2)
     dec = np.arcsin(z / r)
@@ -223,6 +672,7 @@ Args:
     target_ra: target star's right ascension in degrees
     target_dec: target star's declination in degrees
     target_dis: target star's distance in parsecs
+    (target arguments may be numpy arrays to transform many stars at once)
 Returns:
     relative_x: relative x coordinate in 2D
     relative_y: relative y coordinate in 2D
@@ -0,0 +1,227 @@
+import json
+
+import numpy as np
+from fastapi.responses import JSONResponse, Response
+
+# Response encodings of the skyview endpoints, chosen from the Accept header.
+#
+# application/json (default)
+#     {"stars": [{"name", "ra", "dec", "vmag", "bv"}, ...]} with every value as a string,
+#     the format the frontend has always used.
+# application/vnd.exosky.columnar+json
+#     {"count": n, "columns": {"name": [...], "ra": [...], "dec": [...], "vmag": [...], "bv": [...]}}
+#     one array per column with numeric values (missing values are null).
+# application/vnd.exosky.float32
+#     little-endian float32 arrays of the numeric columns one after the other (ra, dec,
+#     vmag, bv; count values each), followed by the star names as UTF-8 joined by "\n".
+#     X-Exosky-Count and X-Exosky-Columns describe the layout.
+# application/vnd.apache.arrow.stream
+#     Arrow IPC stream with one record batch, only available when pyarrow is installed.
+#
+# All formats but the default are built straight from the skyview arrays.
+#
+# The time-lapse frames endpoint answers with the frames of n stars over f epochs:
+# application/json (default)
+#     {"count": n, "frames": f, "epochs": [...], "columns": {"name": [...], "bv": [...]},
+#      "ra": [[...], ...], "dec": [[...], ...], "vmag": [[...], ...]} with one row of n
+#     values per frame (missing values are null).
+# application/vnd.exosky.float32
+#     little-endian float32 arrays: the f epochs, then ra, dec and vmag as f x n
+#     row-major planes, then the n bv values, followed by the star names as UTF-8 joined
+#     by "\n". X-Exosky-Count, X-Exosky-Frames and X-Exosky-Columns describe the layout.
+#
+# The streaming skyview endpoints send one chunk of stars at a time, brightest first:
+# application/x-ndjson (default)
+#     one columnar JSON object (see above) per line.
+# application/vnd.exosky.float32
+#     per chunk a little-endian uint32 star count and uint32 byte length of the names,
+#     followed by the float32 chunk body described above.
+
+JSON = "application/json"
+COLUMNAR_JSON = "application/vnd.exosky.columnar+json"
+FLOAT32 = "application/vnd.exosky.float32"
+ARROW = "application/vnd.apache.arrow.stream"
+NDJSON = "application/x-ndjson"
+
+# response column name -> skyview key
+NUMERIC_COLUMNS = (("ra", "ra"), ("dec", "dec"), ("vmag", "brightness"), ("bv", "bv"))
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+def supported_types():
+    types = [JSON, COLUMNAR_JSON, FLOAT32]
+    if pyarrow is not None:
+        types.append(ARROW)
+    return types
+
+
+def stream_types():
+    return [NDJSON, FLOAT32]
+
+
+def negotiate(accept, supported=None, default=JSON):
+    """
+    Return the best supported media type for an Accept header, or None if the client
+    accepts none of them. A missing header or */* selects the default format.
+    """
+    if not accept:
+        return default
+    if supported is None:
+        supported = supported_types()
+    candidates = []
+    for position, part in enumerate(accept.split(",")):
+        fields = part.strip().split(";")
+        media_type = fields[0].strip().lower()
+        q = 1.0
+        for param in fields[1:]:
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if q <= 0:
+            continue
+        if media_type == "*/*" or (media_type.endswith("/*") and default.startswith(media_type[:-1])):
+            media_type = default
+        if media_type in supported:
+            candidates.append((-q, position, media_type))
+    if not candidates:
+        return None
+    return min(candidates)[2]
+
+
+def _column_list(values):
+    values = np.asarray(values, dtype=np.float64)
+    column = values.tolist()
+    for i in np.flatnonzero(~np.isfinite(values)):
+        column[i] = None
+    return column
+
+
+def columnar_body(skyview):
+    columns = {"name": np.asarray(skyview["name"]).tolist()}
+    for column, key in NUMERIC_COLUMNS:
+        columns[column] = _column_list(skyview[key])
+    return {"count": len(columns["name"]), "columns": columns}
+
+
+def encode_columnar_json(skyview):
+    return json.dumps(columnar_body(skyview), separators=(",", ":")).encode("utf-8")
+
+
+def encode_float32(skyview):
+    parts = [np.asarray(skyview[key], dtype="<f4").tobytes() for _, key in NUMERIC_COLUMNS]
+    parts.append("\n".join(np.asarray(skyview["name"]).tolist()).encode("utf-8"))
+    return b"".join(parts)
+
+
+def encode_chunk(skyview, media_type):
+    """
+    Encode one chunk of a skyview stream.
+    """
+    if media_type == FLOAT32:
+        names = "\n".join(np.asarray(skyview["name"]).tolist()).encode("utf-8")
+        header = np.array([len(skyview["name"]), len(names)], dtype="<u4").tobytes()
+        parts = [np.asarray(skyview[key], dtype="<f4").tobytes() for _, key in NUMERIC_COLUMNS]
+        return b"".join([header] + parts + [names])
+    return encode_columnar_json(skyview) + b"\n"
+
+
+def encode_arrow(skyview):
+    arrays = [pyarrow.array(np.asarray(skyview["name"]).tolist(), type=pyarrow.string())]
+    arrays += [pyarrow.array(np.asarray(skyview[key], dtype=np.float32)) for _, key in NUMERIC_COLUMNS]
+    batch = pyarrow.RecordBatch.from_arrays(arrays, names=["name"] + [column for column, _ in NUMERIC_COLUMNS])
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+
+def legacy_stars(skyview):
+    """
+    Star dictionaries of the default JSON format.
+    """
+    return [
+        {"name": str(name), "ra": str(ra), "dec": str(dec), "vmag": str(vmag), "bv": str(bv)}
+        for name, ra, dec, vmag, bv in zip(
+            np.asarray(skyview["name"]).tolist(), np.asarray(skyview["ra"]).tolist(),
+            np.asarray(skyview["dec"]).tolist(), np.asarray(skyview["brightness"]).tolist(),
+            np.asarray(skyview["bv"]).tolist())
+    ]
+
+
+def frames_types():
+    return [JSON, FLOAT32]
+
+
+def _frame_rows(values):
+    values = np.round(np.asarray(values, dtype=np.float64), 5)
+    rows = values.tolist()
+    for i, j in np.argwhere(~np.isfinite(values)):
+        rows[i][j] = None
+    return rows
+
+
+def frames_response(frames, media_type):
+    """
+    Encode time-lapse frames (see data_api.get_frames_from_exoplanet).
+    """
+    count, n_frames = len(frames["name"]), len(frames["epoch"])
+    if media_type == FLOAT32:
+        parts = [np.asarray(frames[key], dtype="<f4").tobytes() for key in ("epoch", "ra", "dec", "brightness", "bv")]
+        parts.append("\n".join(np.asarray(frames["name"]).tolist()).encode("utf-8"))
+        headers = {
+            "X-Exosky-Count": str(count),
+            "X-Exosky-Frames": str(n_frames),
+            "X-Exosky-Columns": "epoch,ra,dec,vmag,bv",
+        }
+        return Response(content=b"".join(parts), media_type=FLOAT32, headers=headers)
+    body = {
+        "count": count,
+        "frames": n_frames,
+        "epochs": _column_list(frames["epoch"]),
+        "columns": {"name": np.asarray(frames["name"]).tolist(), "bv": _column_list(frames["bv"])},
+        "ra": _frame_rows(frames["ra"]),
+        "dec": _frame_rows(frames["dec"]),
+        "vmag": _frame_rows(frames["brightness"]),
+    }
+    return Response(content=json.dumps(body, separators=(",", ":")).encode("utf-8"), media_type=JSON)
+
+
+def batch_types():
+    return [JSON, COLUMNAR_JSON]
+
+
+def batch_response(views, skyviews, media_type):
+    """
+    Encode the skyviews of a batch request as {"views": [...]}, one object per view
+    holding its parameters and its stars in the default or columnar JSON layout.
+    """
+    if media_type == COLUMNAR_JSON:
+        body = [dict(view, **columnar_body(skyview)) for view, skyview in zip(views, skyviews)]
+        content = json.dumps({"views": body}, separators=(",", ":")).encode("utf-8")
+        return Response(content=content, media_type=COLUMNAR_JSON)
+    body = [dict(view, stars=legacy_stars(skyview)) for view, skyview in zip(views, skyviews)]
+    return JSONResponse(status_code=200, content={"views": body})
+
+
+def skyview_response(skyview, media_type):
+    """
+    Encode a skyview dictionary (see data_api) as a response of the given media type.
+    """
+    if media_type == COLUMNAR_JSON:
+        return Response(content=encode_columnar_json(skyview), media_type=COLUMNAR_JSON)
+    if media_type == FLOAT32:
+        headers = {
+            "X-Exosky-Count": str(len(skyview["name"])),
+            "X-Exosky-Columns": ",".join(column for column, _ in NUMERIC_COLUMNS),
+        }
+        return Response(content=encode_float32(skyview), media_type=FLOAT32, headers=headers)
+    if media_type == ARROW:
+        return Response(content=encode_arrow(skyview), media_type=ARROW)
+    return JSONResponse(status_code=200, content={"stars": legacy_stars(skyview)})
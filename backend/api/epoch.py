@@ -0,0 +1,81 @@
+import numpy as np
+
+# Epoch propagation.
+# Gaia positions hold at the reference epoch of the catalog (config.GAIA_EPOCH). Every
+# star moves on a straight line through its heliocentric position with the space
+# velocity of its proper motion and radial velocity; stars without a proper motion or
+# radial velocity get zero for the missing part. Frames of many epochs are computed
+# together: positions are propagated as one (frames, stars, 3) array operation, in
+# blocks of frames that keep the temporaries at about BLOCK_VALUES stars.
+# The observer stays at the present position of the exoplanet, and straight-line motion
+# ignores the galactic orbit, so frames drift from the real sky over millions of years.
+
+# milliarcseconds per radian and km/s per pc/yr
+MAS_PER_RAD = 180 / np.pi * 3600 * 1000
+KM_S_PER_PC_YR = 977792.2
+BLOCK_VALUES = 1 << 20
+
+
+def velocities(columns):
+    """
+    (n, 3) heliocentric velocities in pc/yr (ICRS axes, see catalog.heliocentric_xyz)
+    of star columns with ra, dec, parallax, pmra, pmdec and radial_velocity.
+    """
+    ra = np.radians(np.asarray(columns["ra"], dtype=np.float64))
+    dec = np.radians(np.asarray(columns["dec"], dtype=np.float64))
+    parallax = np.asarray(columns["parallax"], dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        distance = np.where(parallax > 0, 1000 / parallax, np.nan)
+    v_ra = np.nan_to_num(np.asarray(columns["pmra"], dtype=np.float64)) * distance / MAS_PER_RAD
+    v_dec = np.nan_to_num(np.asarray(columns["pmdec"], dtype=np.float64)) * distance / MAS_PER_RAD
+    v_r = np.nan_to_num(np.asarray(columns["radial_velocity"], dtype=np.float64)) / KM_S_PER_PC_YR
+
+    sin_ra, cos_ra = np.sin(ra), np.cos(ra)
+    sin_dec, cos_dec = np.sin(dec), np.cos(dec)
+    return np.stack([
+        -sin_ra * v_ra - sin_dec * cos_ra * v_dec + cos_dec * cos_ra * v_r,
+        cos_ra * v_ra - sin_dec * sin_ra * v_dec + cos_dec * sin_ra * v_r,
+        cos_dec * v_dec + sin_dec * v_r,
+    ], axis=1)
+
+
+def propagate(xyz, velocity, years):
+    """
+    (frames, n, 3) positions of stars at `years` (array) after the reference epoch.
+    """
+    years = np.asarray(years, dtype=np.float64)
+    return np.asarray(xyz, dtype=np.float64)[None, :, :] + years[:, None, None] * velocity[None, :, :]
+
+
+def sky_frames(position, xyz, velocity, mag, sun_distance, years):
+    """
+    The sky of some stars seen from `position` at several epochs.
+    Args:
+        position: observer position (heliocentric x, y, z in parsecs)
+        xyz: (n, 3) star positions at the reference epoch
+        velocity: (n, 3) star velocities in pc/yr (see velocities)
+        mag: apparent G magnitudes seen from the sun at the reference epoch
+        sun_distance: distances from the sun at the reference epoch
+        years: (frames,) years after the reference epoch
+    Returns:
+        ra, dec: (frames, n) float32 sky positions in degrees
+        mag: (frames, n) float32 apparent magnitudes seen from `position`
+    """
+    years = np.asarray(years, dtype=np.float64)
+    n_frames, n = len(years), len(xyz)
+    ra = np.empty((n_frames, n), dtype=np.float32)
+    dec = np.empty((n_frames, n), dtype=np.float32)
+    frame_mag = np.empty((n_frames, n), dtype=np.float32)
+    origin = np.asarray(xyz, dtype=np.float64) - np.asarray(position, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        absolute = np.asarray(mag, dtype=np.float64) - 5 * np.log10(np.asarray(sun_distance, dtype=np.float64))
+    block = max(1, BLOCK_VALUES // max(n, 1))
+    for start in range(0, n_frames, block):
+        rel = propagate(origin, velocity, years[start:start + block])
+        x, y, z = rel[:, :, 0], rel[:, :, 1], rel[:, :, 2]
+        distance = np.sqrt(x * x + y * y + z * z)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ra[start:start + block] = np.degrees(np.arctan2(y, x)) % 360
+            dec[start:start + block] = np.degrees(np.arcsin(z / distance))
+            frame_mag[start:start + block] = absolute + 5 * np.log10(np.maximum(distance, 1e-6))
+    return ra, dec, frame_mag
@@ -0,0 +1,111 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+
+from api import config, metrics
+
+# Bounded executor for the blocking skyview work.
+# The skyview functions are synchronous and may wait on the Gaia archive, so the star
+# router runs them on a small thread pool instead of the event loop. The number of
+# requests waiting for or running on the pool is capped (503 beyond that), every call
+# has a timeout (504) and a call is abandoned as soon as the client disconnects.
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = 0
+
+DISCONNECT_POLL_SECONDS = 0.1
+
+
+class ClientDisconnected(Exception):
+    pass
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=config.SKYVIEW_WORKERS,
+                                           thread_name_prefix="skyview")
+        return _executor
+
+
+def shutdown():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+async def _wait_disconnect(request):
+    while not await request.is_disconnected():
+        await asyncio.sleep(DISCONNECT_POLL_SECONDS)
+
+
+async def wait_for_client(request, awaitable):
+    """
+    Await `awaitable`, raising ClientDisconnected if the client goes away first.
+    Wrap shared futures in asyncio.shield() so giving up does not cancel them.
+    """
+    future = asyncio.ensure_future(awaitable)
+    if request is None:
+        return await future
+    disconnect = asyncio.ensure_future(_wait_disconnect(request))
+    try:
+        done, _ = await asyncio.wait({future, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+        if future in done:
+            return future.result()
+        future.cancel()
+        raise ClientDisconnected()
+    finally:
+        disconnect.cancel()
+
+
+async def run_blocking(request, func, *args, **kwargs):
+    """
+    Run a blocking function on the skyview executor and return its result.
+    Args:
+        request: the incoming request, watched for client disconnects (may be None)
+        func, args, kwargs: the call to run
+    Raises:
+        HTTPException 503 when too many calls are pending, 504 on timeout
+        ClientDisconnected when the client went away before the result was ready
+    With EXOSKY_SKYVIEW_WORKERS=0 the call runs inline on the event loop.
+    """
+    global _pending
+
+    if config.SKYVIEW_WORKERS <= 0:
+        return func(*args, **kwargs)
+
+    if _pending >= config.SKYVIEW_MAX_PENDING:
+        raise HTTPException(status_code=503, detail="Server busy, try again later")
+
+    _pending += 1
+    loop = asyncio.get_running_loop()
+    # run in a copy of the request context so stage spans reach the request
+    future = loop.run_in_executor(get_executor(), metrics.copy_context().run,
+                                  functools.partial(func, *args, **kwargs))
+    waiters = {future}
+    disconnect = None
+    if request is not None:
+        disconnect = asyncio.ensure_future(_wait_disconnect(request))
+        waiters.add(disconnect)
+
+    try:
+        done, _ = await asyncio.wait(waiters, timeout=config.SKYVIEW_TIMEOUT,
+                                     return_when=asyncio.FIRST_COMPLETED)
+        if future in done:
+            return future.result()
+        # a call that already started keeps its thread until it returns, but nobody waits for it
+        future.cancel()
+        if disconnect is not None and disconnect in done:
+            raise ClientDisconnected()
+        raise HTTPException(status_code=504, detail="Skyview request timed out")
+    finally:
+        _pending -= 1
+        if disconnect is not None:
+            disconnect.cancel()
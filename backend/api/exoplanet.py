@@ -1,102 +1,259 @@
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import JSONResponse
-from fastapi.routing import APIRoute
-import json
-import pandas as pd
-import csv
-import os
-
-exoplanet_list = []
-router = APIRouter()
-
-class Exoplanet:
-    def __init__(self, pl_name, hostname, pl_orbper, sy_dist, ra, dec):
-        self.pl_name = pl_name
-        self.hostname = hostname
-        self.pl_orbper = pl_orbper
-        self.sy_dist = sy_dist
-        self.ra = ra
-        self.dec = dec
-        
-    def to_dict(self):
-        return {
-            "pl_name": self.pl_name,
-            "hostname": self.hostname,
-            "pl_orbper": self.pl_orbper,
-            "sy_dist": self.sy_dist,
-            "ra": self.ra,
-            "dec": self.dec
-        }
-
-@router.get("/all")
-async def get_exoplanet_list():
-    """
-    Retrieve exoplanet list.
-    Example: /exoplanet/all
-    """
-    global exoplanet_list
-    
-    if not exoplanet_list:
-        get_exoplanet_dict()
-        
-    exoplanet_dict = [exoplanet.to_dict() for exoplanet in exoplanet_list]
-    #response_data = json.dumps({"exoplanets": exoplanet_dict})
-                    
-    return JSONResponse(status_code=200, content=exoplanet_dict)
-
-
-def get_exoplanet_dict():
-    """
-    Initialize global variable (sample_data, i.e. Exoplanet collection) 
-    """
-    
-    file_path = os.path.join(os.path.dirname(
-        os.path.abspath(__file__)), "../static/Exoplanet.csv")
-
-    global exoplanet_list
-
-    with open(file_path, 'r') as file:
-        reader = csv.reader(file)
-
-        for row in reader:
-            # Skip columns comment and first row (title)
-            if not row[0].startswith('#') and row[0] != "pl_name":
-                exoplanet_list.append(Exoplanet(
-                    row[0], row[1], row[2], row[14], row[11], row[13]
-                ))
-                
-"""
-Indices
-
->> 0: Planet Name: 'pl_name', 
->> 1: Host Name: 'hostname', 
->> 2: Orbital Period [days]: 'pl_orbper', 
-3: Orbital Period Upper Unc. [days]: 'pl_orbpererr1', 
-4: Orbital Period Lower Unc. [days]: 'pl_orbpererr2', 
-5: Orbital Period Limit Flag: 'pl_orbperlim', 
-6: Planet Radius [Earth Radius]: 'pl_rade', 
-7: Planet Radius Upper Unc. [Earth Radius]: 'pl_radeerr1', 
-8: Planet Radius Lower Unc. [Earth Radius]: 'pl_radeerr2', 
-9: Planet Radius Limit Flag: 'pl_radelim', 
-10: RA [sexagesimal]: 'rastr', 
-11: RA [deg]: 'ra', 
-12: Dec [sexagesimal]: 'decstr', 
-13: Dec [deg]:'dec', 
->> 14: Distance [pc]: 'sy_dist', 
-15: Distance [pc] Upper Unc: 'sy_disterr1', 
-16: Distance [pc] Lower Unc: 'sy_disterr2', 
-17: Parallax [mas]: 'sy_plx', 
-18: Parallax [mas] Upper Unc: 'sy_plxerr1', 
-19: Parallax [mas] Lower Unc: 'sy_plxerr2', 
-20: V (Johnson) Magnitude: 'sy_vmag', 
-21: V (Johnson) Magnitude Upper Unc: 'sy_vmagerr1', 
-22: V (Johnson) Magnitude Lower Unc: 'sy_vmagerr2', 
-23: Ks (2MASS) Magnitude: 'sy_kmag', 
-24: Ks (2MASS) Magnitude Upper Unc: 'sy_kmagerr1', 
-25: Ks (2MASS) Magnitude Lower Unc: 'sy_kmagerr2', 
-26: Gaia Magnitude: 'sy_gaiamag', 
-27: Gaia Magnitude Upper Unc: 'sy_gaiamagerr1', 
-28: Gaia Magnitude Lower Unc: 'sy_gaiamagerr2', 
-29: Date of Last Update: 'rowupdate', 
-30: Release Date: 'releasedate'
-"""
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import JSONResponse, Response
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional
+import hashlib
+import json
+import csv
+import gzip
+import os
+import threading
+
+from api.compression import brotli, choose_encoding
+from api.planet_catalog import COLUMNS, PlanetCatalog
+
+EXOPLANET_CSV = os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), "../static/Exoplanet.csv")
+
+exoplanet_list = []
+router = APIRouter()
+
+# Every column of Exoplanet.csv (see api/planet_catalog.py), for /search and /nearest
+planet_catalog = PlanetCatalog({name: [] for name in COLUMNS})
+
+SEARCH_MAX_LIMIT = 1000
+
+# The /all response is serialized (and compressed) once per version of Exoplanet.csv.
+# Every request only compares the CSV mtime with the loaded one, so a changed CSV is
+# picked up on the next request without a restart.
+_lock = threading.Lock()
+_csv_mtime = None
+_all_response = None
+
+class Exoplanet:
+    def __init__(self, pl_name, hostname, pl_orbper, sy_dist, ra, dec):
+        self.pl_name = pl_name
+        self.hostname = hostname
+        self.pl_orbper = pl_orbper
+        self.sy_dist = sy_dist
+        self.ra = ra
+        self.dec = dec
+        
+    def to_dict(self):
+        return {
+            "pl_name": self.pl_name,
+            "hostname": self.hostname,
+            "pl_orbper": self.pl_orbper,
+            "sy_dist": self.sy_dist,
+            "ra": self.ra,
+            "dec": self.dec
+        }
+
+
+class CachedResponse:
+    """
+    Serialized /all response with its precompressed variants and validators.
+    """
+
+    def __init__(self, content, mtime):
+        self.body = json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self.etag = '"{}"'.format(hashlib.sha1(self.body).hexdigest())
+        self.mtime = int(mtime)
+        self.last_modified = formatdate(self.mtime, usegmt=True)
+        self.encoded = {"gzip": gzip.compress(self.body, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            self.encoded["br"] = brotli.compress(self.body)
+
+    def not_modified(self, request):
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            tags = [tag.strip() for tag in if_none_match.split(",")]
+            return "*" in tags or self.etag in tags or "W/" + self.etag in tags
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since is not None:
+            try:
+                return parsedate_to_datetime(if_modified_since).timestamp() >= self.mtime
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def encoding(self, accept_encoding):
+        """
+        Pick the precompressed variant for an Accept-Encoding header (None for identity).
+        """
+        return choose_encoding(accept_encoding, [name for name in ("br", "gzip") if name in self.encoded])
+
+    def response(self, request):
+        headers = {
+            "ETag": self.etag,
+            "Last-Modified": self.last_modified,
+            "Cache-Control": "no-cache",
+            "Vary": "Accept-Encoding",
+        }
+        if self.not_modified(request):
+            return Response(status_code=304, headers=headers)
+        encoding = self.encoding(request.headers.get("accept-encoding"))
+        if encoding is None:
+            return Response(content=self.body, media_type="application/json", headers=headers)
+        headers["Content-Encoding"] = encoding
+        return Response(content=self.encoded[encoding], media_type="application/json", headers=headers)
+
+
+@router.get("/all")
+async def get_exoplanet_list(request: Request):
+    """
+    Retrieve exoplanet list.
+    Example: /exoplanet/all
+    Supports conditional requests (ETag / Last-Modified) and gzip or brotli encoding.
+    """
+    refresh()
+    return _all_response.response(request)
+
+
+@router.get("/search")
+async def search_exoplanets(min_distance: Optional[float] = None, max_distance: Optional[float] = None,
+                            min_period: Optional[float] = None, max_period: Optional[float] = None,
+                            min_radius: Optional[float] = None, max_radius: Optional[float] = None,
+                            host: Optional[str] = None, sort: Optional[str] = None, order: str = "asc",
+                            offset: int = 0, limit: int = 100, fields: Optional[str] = None):
+    """
+    Search the exoplanet catalog.
+    Filters: distance [pc] (min_distance, max_distance), orbital period [days] (min_period,
+    max_period), radius [Earth radius] (min_radius, max_radius), host name prefix (host).
+    sort: any catalog column, order: asc or desc, offset/limit: page (limit up to 1000),
+    fields: comma separated columns to return (all by default).
+    Example: /exoplanet/search?max_distance=50&sort=sy_dist&limit=10&fields=pl_name,sy_dist
+    """
+    projection = fields.split(",") if fields else None
+    if ((sort is not None and sort not in COLUMNS) or order not in ("asc", "desc") or
+        offset < 0 or not 0 < limit <= SEARCH_MAX_LIMIT or
+        (projection is not None and any(name not in COLUMNS for name in projection))):
+        raise HTTPException(status_code=400, detail="Invalid parameters")
+
+    refresh()
+    catalog = planet_catalog
+    total, index = catalog.query(
+        ranges={"sy_dist": (min_distance, max_distance), "pl_orbper": (min_period, max_period),
+                "pl_rade": (min_radius, max_radius)},
+        host=host, sort=sort, descending=order == "desc", offset=offset, limit=limit)
+    return JSONResponse(status_code=200, content={
+        "total": total, "offset": offset, "limit": limit,
+        "exoplanets": catalog.records(index, projection)
+    })
+
+
+@router.get("/nearest")
+async def nearest_exoplanets(ra: float, dec: float, limit: int = 1, fields: Optional[str] = None):
+    """
+    Exoplanets closest to a sky position (ra, dec in degrees), closest first, with their
+    angular separation in degrees.
+    Example: /exoplanet/nearest?ra=185.2&dec=17.8&limit=3
+    """
+    projection = fields.split(",") if fields else None
+    if (not 0 < limit <= SEARCH_MAX_LIMIT or not -90 <= dec <= 90 or
+        (projection is not None and any(name not in COLUMNS for name in projection))):
+        raise HTTPException(status_code=400, detail="Invalid parameters")
+
+    refresh()
+    catalog = planet_catalog
+    index, separation = catalog.nearest(ra, dec, limit)
+    records = catalog.records(index, projection)
+    for record, value in zip(records, separation.tolist()):
+        record["separation"] = value
+    return JSONResponse(status_code=200, content={"exoplanets": records})
+
+
+def refresh():
+    """
+    Load Exoplanet.csv if it changed since it was last loaded.
+    Returns the mtime of the loaded CSV.
+    """
+    mtime = os.path.getmtime(EXOPLANET_CSV)
+    if mtime != _csv_mtime:
+        with _lock:
+            if mtime != _csv_mtime:
+                _load(mtime)
+    return _csv_mtime
+
+
+def load_exoplanets():
+    """
+    Parse Exoplanet.csv into exoplanet_list and build the /all response.
+    Called on startup (see main.py), refresh() reloads when the CSV changes.
+    """
+    with _lock:
+        _load(os.path.getmtime(EXOPLANET_CSV))
+
+
+def _load(mtime):
+    # must be called with _lock held
+    global _csv_mtime, _all_response, planet_catalog
+
+    planets = read_exoplanets()
+    catalog = PlanetCatalog.read(EXOPLANET_CSV)
+    response = CachedResponse([exoplanet.to_dict() for exoplanet in planets], mtime)
+    exoplanet_list[:] = planets
+    planet_catalog = catalog
+    _all_response = response
+    _csv_mtime = mtime
+
+
+def get_exoplanet_dict():
+    """
+    Load Exoplanet.csv into exoplanet_list and the columnar planet_catalog (PlanetCatalog)
+    and rebuild the /all response. Same as load_exoplanets, kept for existing callers.
+    """
+    load_exoplanets()
+
+
+def read_exoplanets():
+    """
+    Parse Exoplanet.csv into a list of Exoplanet.
+    """
+    planets = []
+    with open(EXOPLANET_CSV, 'r') as file:
+        reader = csv.reader(file)
+
+        for row in reader:
+            # Skip columns comment and first row (title)
+            if not row[0].startswith('#') and row[0] != "pl_name":
+                planets.append(Exoplanet(
+                    row[0], row[1], row[2], row[14], row[11], row[13]
+                ))
+    return planets
+                
+"""
+Indices
+
+>> 0: Planet Name: 'pl_name', 
+>> 1: Host Name: 'hostname', 
+>> 2: Orbital Period [days]: 'pl_orbper', 
+3: Orbital Period Upper Unc. [days]: 'pl_orbpererr1', 
+4: Orbital Period Lower Unc. [days]: 'pl_orbpererr2', 
+5: Orbital Period Limit Flag: 'pl_orbperlim', 
+6: Planet Radius [Earth Radius]: 'pl_rade', 
+7: Planet Radius Upper Unc. [Earth Radius]: 'pl_radeerr1', 
+8: Planet Radius Lower Unc. [Earth Radius]: 'pl_radeerr2', 
+9: Planet Radius Limit Flag: 'pl_radelim', 
+10: RA [sexagesimal]: 'rastr', 
+11: RA [deg]: 'ra', 
+12: Dec [sexagesimal]: 'decstr', 
+13: Dec [deg]:'dec', 
+>> 14: Distance [pc]: 'sy_dist', 
+15: Distance [pc] Upper Unc: 'sy_disterr1', 
+16: Distance [pc] Lower Unc: 'sy_disterr2', 
+17: Parallax [mas]: 'sy_plx', 
+18: Parallax [mas] Upper Unc: 'sy_plxerr1', 
+19: Parallax [mas] Lower Unc: 'sy_plxerr2', 
+20: V (Johnson) Magnitude: 'sy_vmag', 
+21: V (Johnson) Magnitude Upper Unc: 'sy_vmagerr1', 
+22: V (Johnson) Magnitude Lower Unc: 'sy_vmagerr2', 
+23: Ks (2MASS) Magnitude: 'sy_kmag', 
+24: Ks (2MASS) Magnitude Upper Unc: 'sy_kmagerr1', 
+25: Ks (2MASS) Magnitude Lower Unc: 'sy_kmagerr2', 
+26: Gaia Magnitude: 'sy_gaiamag', 
+27: Gaia Magnitude Upper Unc: 'sy_gaiamagerr1', 
+28: Gaia Magnitude Lower Unc: 'sy_gaiamagerr2', 
+29: Date of Last Update: 'rowupdate', 
+30: Release Date: 'releasedate'
+"""
@@ -0,0 +1,72 @@
+import math
+
+import numpy as np
+
+from api import config, tile_cache
+from api.spatial_index import normalize_box
+
+# Magnitude level of detail tiers for skyview queries.
+# A field of view only needs its brightest n_stars, so queries start from the shallowest
+# tier expected to hold that many stars in the requested area and only go deeper when
+# it does not:
+# - spatial indexes (star store, precomputed planet skies) are sorted by magnitude within
+#   every cell, so a tier is a magnitude limit (LOD_MAG_TIERS) that stops each cell scan
+#   early. A tier holding n_stars gives the same stars as a full-depth query.
+# - the tile cache has one tile layout per tier (LOD_TILE_SIZES). Every tile keeps its
+#   brightest TILE_STAR_LIMIT stars, so coarse layouts are bright all-sky tiers and fine
+#   layouts are deep. Tiles come from the archive, so the tier is picked up front.
+
+SKY_AREA = 4 * math.pi * (180 / math.pi) ** 2
+
+
+def box_area(ra_min, ra_max, dec_min, dec_max):
+    """
+    Solid angle of an RA/Dec box in square degrees.
+    """
+    ra_start, ra_width, dec_min, dec_max = normalize_box(ra_min, ra_max, dec_min, dec_max)
+    if dec_min > dec_max:
+        return 0.0
+    return ra_width * (math.sin(math.radians(dec_max)) - math.sin(math.radians(dec_min))) * 180 / math.pi
+
+
+def tile_tier(area, n_stars):
+    """
+    Return the tile size of the coarsest layout expected to hold n_stars stars in
+    `area` square degrees (the finest layout if none is).
+    """
+    sizes = sorted(config.LOD_TILE_SIZES, reverse=True)
+    for size in sizes:
+        if config.TILE_STAR_LIMIT * tile_cache.tile_count(size) * area / SKY_AREA >= n_stars:
+            return size
+    return sizes[-1]
+
+
+def mag_tiers(index, area, n_stars):
+    """
+    Return the magnitude limits to try on a spatial index, from the shallowest tier
+    expected to hold n_stars stars in `area` square degrees down to None (full depth).
+    """
+    limits = sorted(config.LOD_MAG_TIERS)
+    expected = index.count_brighter(limits) * area / SKY_AREA
+    return limits[int(np.searchsorted(expected, n_stars)):] + [None]
+
+
+def query_index(index, ra_min, ra_max, dec_min, dec_max, n_stars, parallax_min=None):
+    """
+    Return the brightest n_stars stars of an RA/Dec box from a SkyIndex, reading only
+    as deep as needed.
+    """
+    area = box_area(ra_min, ra_max, dec_min, dec_max)
+    for mag_max in mag_tiers(index, area, n_stars):
+        columns = index.query_box(ra_min, ra_max, dec_min, dec_max, parallax_min, n_stars, mag_max)
+        if mag_max is None or len(columns["ra"]) >= n_stars:
+            return columns
+
+
+def query_tiles(ra_min, ra_max, dec_min, dec_max, n_stars, parallax_min=None, timeout=None):
+    """
+    Return the brightest n_stars stars of an RA/Dec box from the tile layout of the
+    matching tier (timeout: see tile_cache.load_tiles).
+    """
+    size = tile_tier(box_area(ra_min, ra_max, dec_min, dec_max), n_stars)
+    return tile_cache.query_box(ra_min, ra_max, dec_min, dec_max, parallax_min, n_stars, size=size, timeout=timeout)
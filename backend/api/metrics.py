@@ -0,0 +1,190 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+from api import config
+
+# Per-process metrics in the Prometheus text format, without extra dependencies.
+# span(stage) times one stage of the skyview pipeline: the duration goes to the
+# exosky_stage_seconds histogram and, for the request being served, to its
+# Server-Timing header (see MetricsMiddleware). Counters and histograms are labelled
+# with plain strings. Every uvicorn worker has its own metrics.
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+STAR_BUCKETS = (0, 10, 50, 100, 500, 1000, 3000, 10000, 50000, 200000)
+
+_lock = threading.Lock()
+_request_spans = contextvars.ContextVar("exosky_request_spans", default=None)
+
+
+class Counter:
+    def __init__(self, name, help, label=None):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.values = {}
+
+    def inc(self, label_value=None, n=1):
+        with _lock:
+            self.values[label_value] = self.values.get(label_value, 0) + n
+
+    def render(self):
+        lines = ["# HELP {} {}".format(self.name, self.help), "# TYPE {} counter".format(self.name)]
+        for label_value, value in sorted(self.values.items(), key=lambda item: str(item[0])):
+            lines.append("{}{} {}".format(self.name, _labels(self.label, label_value), value))
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, label=None, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = buckets
+        self.values = {}
+
+    def observe(self, value, label_value=None):
+        with _lock:
+            counts, total = self.values.get(label_value, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.values[label_value] = (counts, total + value)
+
+    def render(self):
+        lines = ["# HELP {} {}".format(self.name, self.help), "# TYPE {} histogram".format(self.name)]
+        for label_value, (counts, total) in sorted(self.values.items(), key=lambda item: str(item[0])):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                labels = _labels(self.label, label_value, le="{:g}".format(bound) if bound != "+Inf" else bound)
+                lines.append("{}_bucket{} {}".format(self.name, labels, cumulative))
+            labels = _labels(self.label, label_value)
+            lines.append("{}_sum{} {}".format(self.name, labels, total))
+            lines.append("{}_count{} {}".format(self.name, labels, cumulative))
+        return lines
+
+
+def _labels(label, value, **extra):
+    pairs = []
+    if label is not None:
+        pairs.append((label, value))
+    pairs += extra.items()
+    if not pairs:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(name, str(value).replace('"', '\\"')) for name, value in pairs) + "}"
+
+
+stage_seconds = Histogram("exosky_stage_seconds", "Duration of skyview pipeline stages", "stage")
+request_seconds = Histogram("exosky_request_seconds", "Duration of HTTP requests by route", "route")
+skyview_stars = Histogram("exosky_skyview_stars", "Stars returned per skyview", "route", STAR_BUCKETS)
+archive_queries = Counter("exosky_archive_queries_total", "Gaia archive tile queries")
+archive_errors = Counter("exosky_archive_errors_total", "Failed Gaia archive tile queries")
+archive_requests = Counter("exosky_archive_requests_total", "Gaia archive HTTP requests by status code", "status")
+responses = Counter("exosky_responses_total", "HTTP responses by status code", "status")
+
+
+@contextmanager
+def span(stage):
+    """
+    Time a pipeline stage.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_seconds.observe(elapsed, stage)
+        spans = _request_spans.get()
+        if spans is not None:
+            spans.append((stage, elapsed))
+
+
+def _gauge(name, help, values, label):
+    lines = ["# HELP {} {}".format(name, help), "# TYPE {} gauge".format(name)]
+    for label_value, value in values.items():
+        lines.append("{}{} {}".format(name, _labels(label, label_value), value))
+    return lines
+
+
+def render():
+    """
+    All metrics of this process in the Prometheus text exposition format.
+    """
+    from api import tile_cache
+    from api.session import sessions
+    from api.star import skyview_cache
+
+    lines = []
+    for metric in (stage_seconds, request_seconds, skyview_stars, archive_queries, archive_errors,
+                   archive_requests, responses):
+        lines += metric.render()
+    lines += _gauge("exosky_tile_cache", "Tile cache counters (hits, misses, evictions)",
+                    tile_cache.get_stats(), "counter")
+    lines += _gauge("exosky_skyview_cache", "Skyview result cache counters (hits, misses, coalesced, entries)",
+                    skyview_cache.get_stats(), "counter")
+    lines += _gauge("exosky_sessions", "Open viewing sessions", {None: len(sessions)}, None)
+    return "\n".join(lines) + "\n"
+
+
+def server_timing(spans):
+    """
+    Server-Timing header value of a list of (stage, seconds), stages summed by name.
+    """
+    totals = {}
+    for stage, elapsed in spans:
+        totals[stage] = totals.get(stage, 0.0) + elapsed
+    return ", ".join("{};dur={:.2f}".format(stage, elapsed * 1000) for stage, elapsed in totals.items())
+
+
+def route_template(scope):
+    """
+    Path template of the route that served a request, e.g. /api/v1/star/skyview/earth/.
+    """
+    # recent FastAPI versions keep routes of included routers unprefixed and record
+    # the full path in their own scope entry
+    context = (scope.get("fastapi") or {}).get("effective_route_context")
+    path = getattr(context, "path_format", None) or getattr(scope.get("route"), "path", None)
+    return path or "unmatched"
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing every HTTP request (by route path) and collecting the stage
+    spans of the request, sent back as a Server-Timing header when SERVER_TIMING is set.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        spans = []
+        token = _request_spans.set(spans)
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                responses.inc(message["status"])
+                if config.SERVER_TIMING:
+                    spans.append(("total", time.perf_counter() - start))
+                    headers = list(message.get("headers", [])) + [
+                        (b"server-timing", server_timing(spans).encode("latin-1"))]
+                    message = dict(message, headers=headers)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_spans.reset(token)
+            request_seconds.observe(time.perf_counter() - start, route_template(scope))
+
+
+def copy_context():
+    """
+    Context to run executor work in, so its spans reach the current request.
+    """
+    return contextvars.copy_context()
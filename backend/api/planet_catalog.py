@@ -0,0 +1,165 @@
+import csv
+
+import numpy as np
+
+from api.spatial_index import unit_vectors
+
+# Columnar exoplanet catalog with every column of Exoplanet.csv.
+# Numeric columns are float64 arrays (NaN for empty cells), text columns are string
+# arrays. Range filters use a per-column sort order (binary search instead of a scan),
+# host name prefix search uses the sorted lower-case host names and the nearest lookup
+# uses unit vectors of the planet positions. Indexes are built on first use.
+
+COLUMNS = (
+    "pl_name", "hostname", "pl_orbper", "pl_orbpererr1", "pl_orbpererr2", "pl_orbperlim",
+    "pl_rade", "pl_radeerr1", "pl_radeerr2", "pl_radelim", "rastr", "ra", "decstr", "dec",
+    "sy_dist", "sy_disterr1", "sy_disterr2", "sy_plx", "sy_plxerr1", "sy_plxerr2",
+    "sy_vmag", "sy_vmagerr1", "sy_vmagerr2", "sy_kmag", "sy_kmagerr1", "sy_kmagerr2",
+    "sy_gaiamag", "sy_gaiamagerr1", "sy_gaiamagerr2", "rowupdate", "releasedate",
+)
+TEXT_COLUMNS = ("pl_name", "hostname", "rastr", "decstr", "rowupdate", "releasedate")
+
+
+def _float(value):
+    try:
+        return float(value)
+    except ValueError:
+        return np.nan
+
+
+class PlanetCatalog:
+    """
+    Args:
+        columns: dictionary of arrays keyed by the names in COLUMNS
+    """
+
+    def __init__(self, columns):
+        self.columns = columns
+        self._orders = {}
+        self._hosts = None
+        self._vectors = None
+
+    @classmethod
+    def read(cls, path):
+        """
+        Parse an Exoplanet Archive CSV (comment lines start with #).
+        """
+        with open(path, "r") as file:
+            rows = [row for row in csv.reader(file)
+                    if row and not row[0].startswith("#") and row[0] != "pl_name"]
+        columns = {}
+        for i, name in enumerate(COLUMNS):
+            values = [row[i] if i < len(row) else "" for row in rows]
+            if name in TEXT_COLUMNS:
+                columns[name] = np.array(values, dtype=str)
+            else:
+                columns[name] = np.array([_float(value) for value in values], dtype=np.float64)
+        return cls(columns)
+
+    def __len__(self):
+        return len(self.columns["pl_name"])
+
+    def order(self, name):
+        """
+        Row order sorting a column ascending (NaN and empty values last).
+        """
+        order = self._orders.get(name)
+        if order is None:
+            values = self.columns[name]
+            if name in TEXT_COLUMNS:
+                order = np.lexsort((values, values == ""))
+            else:
+                order = np.argsort(values, kind="stable")
+            self._orders[name] = order
+        return order
+
+    def in_range(self, name, low=None, high=None):
+        """
+        Boolean mask of the rows with low <= value <= high (numeric columns).
+        """
+        order = self.order(name)
+        values = self.columns[name][order]
+        start = 0 if low is None else np.searchsorted(values, low, side="left")
+        end = np.searchsorted(values, np.inf, side="right") if high is None else \
+            np.searchsorted(values, high, side="right")
+        mask = np.zeros(len(self), dtype=bool)
+        mask[order[start:end]] = True
+        return mask
+
+    def host_prefix(self, prefix):
+        """
+        Boolean mask of the rows whose host name starts with prefix (case-insensitive).
+        """
+        if self._hosts is None:
+            hosts = np.char.lower(self.columns["hostname"])
+            order = np.argsort(hosts, kind="stable")
+            self._hosts = (hosts[order], order)
+        hosts, order = self._hosts
+        prefix = prefix.lower()
+        start = np.searchsorted(hosts, prefix, side="left")
+        end = np.searchsorted(hosts, prefix + "\U0010ffff", side="left")
+        mask = np.zeros(len(self), dtype=bool)
+        mask[order[start:end]] = True
+        return mask
+
+    def query(self, ranges=None, host=None, sort=None, descending=False, offset=0, limit=None):
+        """
+        Return the total number of matching rows and the selected page of row indexes.
+        Args:
+            ranges: {column: (low, high)} inclusive numeric ranges, None for open ends
+            host: host name prefix
+            sort: column to sort by (catalog order when None), missing values last
+            descending: sort descending
+            offset, limit: page of the sorted matches
+        """
+        mask = np.ones(len(self), dtype=bool)
+        for name, (low, high) in (ranges or {}).items():
+            if low is not None or high is not None:
+                mask &= self.in_range(name, low, high)
+        if host:
+            mask &= self.host_prefix(host)
+
+        if sort is None:
+            index = np.flatnonzero(mask)
+        else:
+            order = self.order(sort)
+            index = order[mask[order]]
+            if descending:
+                values = self.columns[sort][index]
+                missing = (values == "") if sort in TEXT_COLUMNS else np.isnan(values)
+                index = np.concatenate([index[~missing][::-1], index[missing]])
+        end = None if limit is None else offset + limit
+        return len(index), index[offset:end]
+
+    def nearest(self, ra, dec, n=1):
+        """
+        Return the indexes and angular separations (degrees) of the n planets closest to
+        a sky position, closest first.
+        """
+        if not len(self):
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        if self._vectors is None:
+            self._vectors = unit_vectors(self.columns["ra"], self.columns["dec"])
+        cos_angle = np.nan_to_num(self._vectors @ unit_vectors(ra, dec), nan=-2.0)
+        n = min(n, len(self))
+        index = np.argpartition(-cos_angle, n - 1)[:n] if n < len(self) else np.arange(len(self))
+        index = index[np.argsort(-cos_angle[index], kind="stable")]
+        separation = np.degrees(np.arccos(np.clip(cos_angle[index], -1, 1)))
+        return index, separation
+
+    def records(self, index, fields=None):
+        """
+        Rows as dictionaries with JSON-ready values (missing numbers become None).
+        """
+        fields = fields or COLUMNS
+        columns = {}
+        for name in fields:
+            values = self.columns[name][index]
+            if name in TEXT_COLUMNS:
+                columns[name] = values.tolist()
+            else:
+                column = values.tolist()
+                for i in np.flatnonzero(np.isnan(values)):
+                    column[i] = None
+                columns[name] = column
+        return [dict(zip(fields, row)) for row in zip(*(columns[name] for name in fields))]
@@ -0,0 +1,201 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from api import catalog, config, exoplanet, lod
+from api.spatial_index import SkyIndex
+
+# Precomputed sky of every planetary system in Exoplanet.csv.
+# For each system the catalog is re-centered on the host position once (see
+# api/catalog.py) and its brightest PLANET_SKY_STARS stars, with positions, apparent
+# magnitudes and B-V as seen from there, are kept in a spatial index; the planets of one
+# host share it. A skyview request for a known planet is then a lookup plus a field of
+# view slice. Skies are built on demand (one build per system even under concurrent
+# requests), can be warmed on startup and are dropped when Exoplanet.csv changes. Only
+# the PLANET_SKY_ENTRIES most recently used skies are kept.
+
+_skies = OrderedDict()
+_planets = {}
+_build_locks = {}
+_lock = threading.Lock()
+_csv_mtime = None
+
+
+class PlanetSky:
+    """
+    Stars seen from one planetary system.
+    Args:
+        name: host name (hostname)
+        index: SkyIndex over the system's sky, "phot_g_mean_mag" holds apparent magnitudes
+    """
+
+    def __init__(self, name, index):
+        self.name = name
+        self.index = index
+
+    def __len__(self):
+        return len(self.index)
+
+    def query(self, ra, dec, fovy_w, fovy_h, n_stars=None):
+        """
+        Return the brightest stars of a field of view as a dictionary of arrays
+        (Gaia column names plus "bv" and "distance").
+        With n_stars, only the magnitude tiers needed for that many stars are read.
+        """
+        ra_min, ra_max, dec_min, dec_max = ra - fovy_w / 2, ra + fovy_w / 2, dec - fovy_h / 2, dec + fovy_h / 2
+        if n_stars is None:
+            return self.index.query_box(ra_min, ra_max, dec_min, dec_max)
+        return lod.query_index(self.index, ra_min, ra_max, dec_min, dec_max, n_stars)
+
+
+def system_key(ra, dec, distance):
+    """
+    Key of the planetary system at a host position, the planets of one host share it.
+    """
+    return round(float(ra), 5), round(float(dec), 5), round(float(distance), 4)
+
+
+def _remember(key, sky):
+    """
+    Keep a sky, dropping the least recently used ones. Must be called with _lock held.
+    """
+    _skies[key] = sky
+    _skies.move_to_end(key)
+    while len(_skies) > config.PLANET_SKY_ENTRIES:
+        _skies.popitem(last=False)
+
+
+def _lookup(key):
+    sky = _skies.get(key)
+    if sky is not None:
+        _skies.move_to_end(key)
+    return sky
+
+
+def _refresh():
+    """
+    Reload the exoplanet list and drop every sky when Exoplanet.csv changed.
+    Must be called with _lock held.
+    """
+    global _csv_mtime
+    mtime = exoplanet.refresh()
+    if mtime == _csv_mtime:
+        return
+    _planets.clear()
+    for planet in exoplanet.exoplanet_list:
+        try:
+            key = system_key(planet.ra, planet.dec, planet.sy_dist)
+        except ValueError:
+            continue
+        # the first planet of a system stands for it, they all share one sky
+        _planets.setdefault(key, planet)
+    _skies.clear()
+    _csv_mtime = mtime
+
+
+def find_planet(ex_ra, ex_dec, ex_distance):
+    """
+    Return an Exoplanet of the system at the given position (the first one listed), or
+    None if no planet of Exoplanet.csv is there.
+    """
+    with _lock:
+        _refresh()
+        return _planets.get(system_key(ex_ra, ex_dec, ex_distance))
+
+
+def build_planet_sky(planet):
+    """
+    Re-center the catalog on the system of one exoplanet and index its brightest stars.
+    """
+    from api.data_api import bv_color_index, ra_dec_to_xyz
+
+    stars = catalog.get_catalog()
+    position = ra_dec_to_xyz(float(planet.ra), float(planet.dec), float(planet.sy_dist))
+    ra, dec, distance, mag = stars.view_from(position)
+
+    index = np.flatnonzero(np.isfinite(mag))
+    if len(index) > config.PLANET_SKY_STARS:
+        index = index[np.argpartition(mag[index], config.PLANET_SKY_STARS)[:config.PLANET_SKY_STARS]]
+    r = stars.rows(index)
+
+    columns = {
+        "source_id": r["source_id"],
+        "DESIGNATION": r["DESIGNATION"],
+        "ra": ra[index],
+        "dec": dec[index],
+        "parallax": 1000 / distance[index],
+        "phot_g_mean_mag": mag[index],
+        "bv": bv_color_index(r["phot_bp_mean_mag"], r["phot_rp_mean_mag"]),
+        "distance": distance[index],
+    }
+    return PlanetSky(planet.hostname, SkyIndex.build(columns))
+
+
+def get_planet_sky(planet):
+    """
+    Return the precomputed sky of a planet's system, building it on first use.
+    Concurrent callers for the same system wait for a single build.
+    """
+    key = system_key(planet.ra, planet.dec, planet.sy_dist)
+    with _lock:
+        _refresh()
+        sky = _lookup(key)
+        if sky is not None:
+            return sky
+        build_lock = _build_locks.setdefault(key, threading.Lock())
+        mtime = _csv_mtime
+
+    with build_lock:
+        with _lock:
+            sky = _lookup(key)
+        if sky is not None:
+            return sky
+        sky = build_planet_sky(planet)
+        with _lock:
+            # do not keep skies built from a CSV that changed meanwhile
+            if _csv_mtime == mtime:
+                _remember(key, sky)
+        return sky
+
+
+def install(skies):
+    """
+    Use skies built elsewhere, e.g. attached from shared memory (see api/shared_memory.py).
+    Args:
+        skies: dictionary of PlanetSky keyed by system_key
+    """
+    with _lock:
+        _refresh()
+        for key, sky in skies.items():
+            _remember(key, sky)
+
+
+def skies():
+    """
+    Every sky kept, keyed by system_key.
+    """
+    with _lock:
+        return dict(_skies)
+
+
+def warm():
+    """
+    Build the skies of the first PLANET_SKY_ENTRIES systems in Exoplanet.csv.
+    """
+    catalog.get_catalog(wait=True)
+    with _lock:
+        _refresh()
+        planets = list(_planets.values())[:config.PLANET_SKY_ENTRIES]
+    for planet in planets:
+        get_planet_sky(planet)
+
+
+def invalidate():
+    """
+    Drop every precomputed sky, e.g. after the star catalog changed.
+    """
+    global _csv_mtime
+    with _lock:
+        _skies.clear()
+        _csv_mtime = None
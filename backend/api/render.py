@@ -0,0 +1,232 @@
+import io
+import math
+import struct
+import zlib
+
+import numpy as np
+
+from api import config
+from api.metrics import span
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# Server-side sky images.
+# The stars of a skyview (see data_api) are projected onto the image plane with a
+# gnomonic projection centered on the view direction (east to the left, like the sky
+# seen from inside) and drawn as small stamps of a core-and-halo profile, evaluated at
+# their sub-pixel position and summed into an RGB buffer with one np.bincount per
+# channel, so the cost grows with the star count rather than the image size. The
+# buffer is tone mapped, so bright stars saturate into larger discs. Star colors follow
+# the B-V to RGB mapping of the frontend (bv2rgb in StarrySky.jsx). PNG is encoded with
+# zlib only, WebP needs Pillow.
+
+PNG = "image/png"
+WEBP = "image/webp"
+
+# magnitude of a star reaching 1 - 1/e of full brightness at exposure 1; intensity
+# drops by 10**MAG_SCALE per magnitude (0.4 would be linear flux, which leaves all but
+# the brightest stars invisible in an 8 bit image)
+REFERENCE_MAG = 4.0
+MAG_SCALE = 0.2
+# stars without B-V are drawn with the color of a sun-like star
+DEFAULT_BV = 0.65
+# star profile (pixels): core and halo widths, halo strength, stamp radius of faint
+# stars (flux below FAINT_FLUX) and of bright ones, stars per stamp batch
+GLOW_SIGMA = 0.7
+HALO_SIGMA = 2.5
+HALO = 0.06
+FAINT_FLUX = 0.3
+FAINT_RADIUS = 2
+BRIGHT_RADIUS = 6
+STAMP_CHUNK = 4096
+
+
+def image_types():
+    types = [PNG]
+    if Image is not None:
+        types.append(WEBP)
+    return types
+
+
+def bv_to_rgb(bv):
+    """
+    (n, 3) RGB colors in [0, 1] of B-V color indices, clamped to [-0.4, 2.0].
+    """
+    bv = np.clip(np.nan_to_num(np.asarray(bv, dtype=np.float64), nan=DEFAULT_BV), -0.4, 2.0)
+    t_blue = (bv + 0.4) / 0.4
+    t_white = bv / 0.4
+    r = np.where(bv < 0, 0.61 + 0.11 * t_blue + 0.1 * t_blue**2,
+                 np.where(bv < 0.4, 0.83 + 0.17 * t_white, 1.0))
+    t_orange = (bv - 0.4) / 1.2
+    t_red = (bv - 1.6) / 0.4
+    g = np.select([bv < 0, bv < 0.4, bv < 1.6, bv < 2.0],
+                  [0.7 + 0.07 * t_blue + 0.1 * t_blue**2, 0.87 + 0.11 * t_white,
+                   0.98 - 0.16 * t_orange, 0.82 - 0.5 * t_red**2], 0.0)
+    t_yellow = (bv - 0.4) / 1.1
+    t_deep = (bv - 1.5) / 0.44
+    b = np.select([bv < 0.4, bv < 1.5, bv < 1.94],
+                  [1.0, 1.0 - 0.47 * t_yellow + 0.1 * t_yellow**2, 0.63 - 0.6 * t_deep**2], 0.0)
+    return np.stack([r, g, b], axis=1)
+
+
+def project(ra, dec, ra0, dec0, fov, width, height):
+    """
+    Gnomonic projection of sky positions (degrees) around (ra0, dec0).
+    fov is the horizontal field of view in degrees.
+    Returns:
+        x, y: pixel coordinates (x to the right, y down)
+        visible: mask of the stars in front of the observer
+    """
+    ra = np.radians(np.asarray(ra, dtype=np.float64))
+    dec = np.radians(np.asarray(dec, dtype=np.float64))
+    ra0, dec0 = math.radians(ra0), math.radians(dec0)
+    d_ra = ra - ra0
+    cos_dec = np.cos(dec)
+    cos_c = math.sin(dec0) * np.sin(dec) + math.cos(dec0) * cos_dec * np.cos(d_ra)
+    visible = cos_c > 1e-6
+    with np.errstate(divide="ignore", invalid="ignore"):
+        xi = cos_dec * np.sin(d_ra) / cos_c
+        eta = (math.cos(dec0) * np.sin(dec) - math.sin(dec0) * cos_dec * np.cos(d_ra)) / cos_c
+    scale = (width / 2) / math.tan(math.radians(fov) / 2)
+    return width / 2 - xi * scale, height / 2 - eta * scale, visible
+
+
+def query_box(ra0, dec0, fov, width, height):
+    """
+    RA/Dec box (fovy_w, fovy_h in degrees) covering an image of the given field of view.
+    """
+    half_w = math.tan(math.radians(fov) / 2)
+    half_diagonal = math.degrees(math.atan(half_w * math.hypot(1, height / width)))
+    dec_edge = min(abs(dec0) + half_diagonal, 90)
+    if dec_edge >= 89.9:
+        return 360.0, 2 * half_diagonal
+    return min(360.0, 2 * half_diagonal / math.cos(math.radians(dec_edge))), 2 * half_diagonal
+
+
+def glow(t):
+    """
+    Star profile along one axis at distances t (pixels): a sharp core and a faint wide
+    halo, 1 at the center.
+    """
+    t2 = t * t
+    return (np.exp(t2 * (-0.5 / GLOW_SIGMA**2)) + HALO * np.exp(t2 * (-0.5 / HALO_SIGMA**2))) / (1 + HALO)
+
+
+def _stamps(x, y, color, radius, row_width):
+    """
+    Flat buffer indices and R, G and B weights of the (2 radius + 1)^2 pixel stamps of
+    stars at (x, y) with (3, n) colors, for a buffer of row_width columns padded by
+    radius + 1 pixels on each side.
+    """
+    taps = np.arange(-radius, radius + 1)
+    pad = radius + 1
+    for start in range(0, len(x), STAMP_CHUNK):
+        cx, cy = x[start:start + STAMP_CHUNK], y[start:start + STAMP_CHUNK]
+        cols = np.rint(cx - 0.5).astype(np.int64)[:, None] + taps
+        rows = np.rint(cy - 0.5).astype(np.int64)[:, None] + taps
+        weights = (glow(rows + 0.5 - cy[:, None])[:, :, None] *
+                   glow(cols + 0.5 - cx[:, None])[:, None, :]).reshape(len(cx), -1)
+        cells = (rows[:, :, None] + pad) * row_width + (cols[:, None, :] + pad)
+        yield cells.ravel(), [(weights * channel[start:start + STAMP_CHUNK, None]).ravel() for channel in color]
+
+
+def rasterize(ra, dec, mag, bv, ra0, dec0, fov, width, height, exposure=1.0):
+    """
+    Render stars to an (height, width, 3) uint8 RGB image.
+    Args:
+        ra, dec: star positions in degrees
+        mag: apparent magnitudes
+        bv: B-V color indices
+        ra0, dec0: view direction in degrees
+        fov: horizontal field of view in degrees
+        exposure: brightness factor
+    """
+    mag = np.asarray(mag, dtype=np.float64)
+    x, y, visible = project(ra, dec, ra0, dec0, fov, width, height)
+    visible &= np.isfinite(mag) & (x > -0.5) & (x < width + 0.5) & (y > -0.5) & (y < height + 0.5)
+    index = np.flatnonzero(visible)
+    x, y = x[index], y[index]
+    flux = exposure * 10 ** (-MAG_SCALE * (mag[index] - REFERENCE_MAG))
+    color = (bv_to_rgb(np.asarray(bv)[index]) * flux[:, None]).T
+
+    # faint stars only need the core of the profile, their halo stays below one level
+    pad = BRIGHT_RADIUS + 1
+    padded_w, padded_h = width + 2 * pad, height + 2 * pad
+    faint = flux < FAINT_FLUX
+    parts = []
+    for stars, radius in ((faint, FAINT_RADIUS), (~faint, BRIGHT_RADIUS)):
+        # stamps of smaller radius are shifted into the common padding
+        shift = (pad - radius - 1) * (padded_w + 1)
+        parts += [(cells + shift, weights) for cells, weights in
+                  _stamps(x[stars], y[stars], color[:, stars], radius, padded_w)]
+    cells = np.concatenate([np.empty(0, dtype=np.int64)] + [part[0] for part in parts])
+
+    image = np.empty((height, width, 3), dtype=np.float32)
+    for channel in range(3):
+        weights = np.concatenate([np.empty(0)] + [part[1][channel] for part in parts])
+        plane = np.bincount(cells, weights=weights, minlength=padded_h * padded_w)
+        image[:, :, channel] = plane.reshape(padded_h, padded_w)[pad:-pad, pad:-pad]
+
+    # tone map: a star of REFERENCE_MAG centered on a pixel reaches 1 - 1/e there
+    np.negative(image, out=image)
+    np.exp(image, out=image)
+    np.subtract(1, image, out=image)
+    image *= 255
+    image += 0.5
+    return image.astype(np.uint8)
+
+
+def _png_chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+
+
+def encode_png(pixels, level=6):
+    """
+    Encode an (height, width, 3) uint8 image as PNG.
+    """
+    height, width, _ = pixels.shape
+    rows = np.zeros((height, width * 3 + 1), dtype=np.uint8)
+    rows[:, 1:] = pixels.reshape(height, width * 3)
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + _png_chunk(b"IHDR", header) +
+            _png_chunk(b"IDAT", zlib.compress(rows.tobytes(), level)) + _png_chunk(b"IEND", b""))
+
+
+def encode_webp(pixels, quality=80):
+    buffer = io.BytesIO()
+    Image.fromarray(pixels, "RGB").save(buffer, "WEBP", quality=quality)
+    return buffer.getvalue()
+
+
+def encode_image(pixels, media_type):
+    if media_type == WEBP:
+        return encode_webp(pixels, config.RENDER_WEBP_QUALITY)
+    return encode_png(pixels, config.RENDER_PNG_LEVEL)
+
+
+def render_skyview(skyview, ra0, dec0, fov, width, height, media_type=PNG, exposure=1.0):
+    """
+    Render a skyview dictionary (see data_api) and encode it as PNG or WebP.
+    """
+    with span("rasterize"):
+        pixels = rasterize(skyview["ra"], skyview["dec"], skyview["brightness"], skyview["bv"],
+                           ra0, dec0, fov, width, height, exposure)
+    with span("image_encode"):
+        return encode_image(pixels, media_type)
+
+
+def render_from_exoplanet(ex_ra, ex_dec, ex_distance, ra, dec, fov, width, height, media_type=PNG,
+                          exposure=1.0, mode=None):
+    """
+    Render the sky seen from an exoplanet towards (ra, dec) with a horizontal field of
+    view of `fov` degrees, from the brightest RENDER_MAX_STARS stars of the view.
+    """
+    from api.data_api import get_skyview_from_exoplanet
+
+    fovy_w, fovy_h = query_box(ra, dec, fov, width, height)
+    skyview = get_skyview_from_exoplanet(ex_ra, ex_dec, ex_distance, ra, dec, fovy_w, fovy_h,
+                                         config.RENDER_MAX_STARS, mode=mode)
+    return render_skyview(skyview, ra, dec, fov, width, height, media_type, exposure)
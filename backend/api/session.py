@@ -0,0 +1,182 @@
+import threading
+import time
+from collections import OrderedDict
+
+from api import config, planet_sky
+from api.data_api import catalog_view_from, get_skyview_from_exoplanet_cartesian
+from api.encoding import columnar_body
+
+# Viewing sessions with incremental star updates.
+# A client panning the sky from one exoplanet keeps a session open (a WebSocket, see
+# api/star.py) and sends camera updates. Every update computes the skyview of the new
+# camera and answers with the stars that entered the view, under a compact id that is
+# unique within the session, and the ids of the stars that left it, instead of the
+# whole field again.
+# Sessions always use the cartesian view (api/catalog.py): a star keeps its position
+# while panning, which the proxy view does not guarantee. The state of a session is the
+# name -> id map of the stars on screen, so it is bounded by the star count of the view;
+# exoplanets that are not in Exoplanet.csv share their catalog views through a small LRU.
+# Idle sessions are closed after SESSION_IDLE_TIMEOUT seconds and beyond SESSION_MAX open
+# sessions the least recently active one is evicted.
+
+_catalog_views = OrderedDict()
+_catalog_views_lock = threading.Lock()
+
+
+def shared_catalog_view(ex_ra, ex_dec, ex_distance):
+    """
+    The catalog seen from an exoplanet (see data_api.catalog_view_from), kept for the
+    SESSION_CATALOG_VIEWS most recently used exoplanets.
+    """
+    key = (ex_ra, ex_dec, ex_distance)
+    with _catalog_views_lock:
+        view = _catalog_views.get(key)
+        if view is not None:
+            _catalog_views.move_to_end(key)
+            return view
+    view = catalog_view_from(ex_ra, ex_dec, ex_distance)
+    with _catalog_views_lock:
+        _catalog_views[key] = view
+        while len(_catalog_views) > config.SESSION_CATALOG_VIEWS:
+            _catalog_views.popitem(last=False)
+    return view
+
+
+def clear_catalog_views():
+    with _catalog_views_lock:
+        _catalog_views.clear()
+
+
+class Camera:
+    """
+    View direction (ra, dec), field of view (fovy_w, fovy_h) and star count of an update.
+    """
+
+    def __init__(self, ra, dec, fovy_w, fovy_h, n_stars):
+        self.ra = ra
+        self.dec = dec
+        self.fovy_w = fovy_w
+        self.fovy_h = fovy_h
+        self.n_stars = n_stars
+
+    @classmethod
+    def from_message(cls, message, previous=None):
+        """
+        Parse a camera update. Missing fields keep their previous value.
+        Raises ValueError on invalid values.
+        """
+        if not isinstance(message, dict):
+            raise ValueError("A camera update is a JSON object")
+        fields = {}
+        for name, default in (("ra", None), ("dec", None), ("fovy_w", 400), ("fovy_h", 400), ("n_stars", 3000)):
+            value = message.get(name)
+            if value is None:
+                value = getattr(previous, name) if previous is not None else default
+            if value is None or isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise ValueError("Invalid {}".format(name))
+            fields[name] = value
+        if not (0 < fields["fovy_w"] <= 400 and 0 < fields["fovy_h"] <= 400 and
+                0 < fields["n_stars"] <= config.SKYVIEW_MAX_STARS and -90 <= fields["dec"] <= 90):
+            raise ValueError("Invalid parameters")
+        fields["n_stars"] = int(fields["n_stars"])
+        return cls(**fields)
+
+    def describe(self):
+        return {"ra": self.ra, "dec": self.dec, "fovy_w": self.fovy_w, "fovy_h": self.fovy_h}
+
+
+class ViewSession:
+    """
+    Stars on screen of one client panning the sky from an exoplanet.
+    """
+
+    def __init__(self, ex_ra, ex_dec, ex_distance):
+        self.ex_ra = ex_ra
+        self.ex_dec = ex_dec
+        self.ex_distance = ex_distance
+        self.visible = {}
+        self.next_id = 0
+        self.updates = 0
+        self.last_active = time.monotonic()
+        # an update abandoned on timeout may still run on its executor thread
+        self._lock = threading.Lock()
+
+    def skyview(self, camera):
+        catalog_view = None
+        if planet_sky.find_planet(self.ex_ra, self.ex_dec, self.ex_distance) is None:
+            catalog_view = shared_catalog_view(self.ex_ra, self.ex_dec, self.ex_distance)
+        return get_skyview_from_exoplanet_cartesian(self.ex_ra, self.ex_dec, self.ex_distance, camera.ra,
+                                                    camera.dec, camera.fovy_w, camera.fovy_h, camera.n_stars,
+                                                    catalog_view=catalog_view)
+
+    def update(self, camera):
+        """
+        Move the camera and return the change of the view:
+            {"view": camera, "enter": columnar stars plus their "id" column,
+             "leave": ids of the stars that left the view, "count": stars now in view}
+        """
+        with self._lock:
+            return self._update(camera)
+
+    def _update(self, camera):
+        skyview = self.skyview(camera)
+        names = skyview["name"].tolist()
+        current = set(names)
+        leave = [star_id for name, star_id in self.visible.items() if name not in current]
+        visible = {}
+        enter = []
+        for i, name in enumerate(names):
+            star_id = self.visible.get(name)
+            if star_id is None:
+                star_id = self.next_id
+                self.next_id += 1
+                enter.append(i)
+            visible[name] = star_id
+        self.visible = visible
+        self.updates += 1
+
+        body = columnar_body({key: values[enter] for key, values in skyview.items()})
+        body["columns"]["id"] = [visible[name] for name in body["columns"]["name"]]
+        return {"view": camera.describe(), "enter": body, "leave": leave, "count": len(visible)}
+
+
+class SessionRegistry:
+    """
+    Open sessions of this worker, each with a function that closes it.
+    """
+
+    def __init__(self):
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def add(self, session, close):
+        """
+        Register a session. Returns the close functions of the sessions evicted to stay
+        within SESSION_MAX, least recently active first.
+        """
+        with self._lock:
+            self._sessions[session] = close
+            evicted = []
+            while len(self._sessions) > max(config.SESSION_MAX, 1):
+                oldest, close_oldest = next(iter(self._sessions.items()))
+                if oldest is session:
+                    break
+                del self._sessions[oldest]
+                evicted.append(close_oldest)
+            return evicted
+
+    def touch(self, session):
+        session.last_active = time.monotonic()
+        with self._lock:
+            if session in self._sessions:
+                self._sessions.move_to_end(session)
+
+    def remove(self, session):
+        with self._lock:
+            self._sessions.pop(session, None)
+
+
+sessions = SessionRegistry()
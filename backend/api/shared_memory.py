@@ -0,0 +1,230 @@
+import json
+import struct
+import threading
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from api import catalog, config, planet_sky, tile_cache
+from api.spatial_index import SkyIndex
+
+# Star data shared between uvicorn worker processes.
+# With several workers (see serve.py) the parent process loads the star data once and
+# copies it into one shared memory segment: the tiles of the disk cache, the cartesian
+# catalog (cartesian mode, warmed skies, or whenever every tile is cached) and, with PLANET_SKY_WARM, the precomputed
+# sky of every exoplanet. Workers find the segment name in EXOSKY_SHARED_MEMORY_NAME
+# and attach to it on startup, getting read-only numpy views instead of private copies.
+# Data a worker builds later (new tiles, skies of a changed Exoplanet.csv) stays private.
+#
+# Segment layout: little-endian uint64 length of a JSON manifest, the manifest
+# ({"arrays": {key: [offset, dtype, shape]}, "meta": {...}}), then the arrays, each
+# aligned to ALIGNMENT bytes.
+
+ALIGNMENT = 64
+_HEADER = struct.Struct("<Q")
+
+_attached = None
+_attach_lock = threading.Lock()
+# open segments, kept alive until closed: the numpy views do not hold on to the mapping
+_open_segments = set()
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+class SharedArrays:
+    """
+    Named numpy arrays in one shared memory segment.
+    Args:
+        shm: the SharedMemory segment
+        arrays: dictionary of arrays backed by the segment
+        meta: JSON serializable description of the content
+    """
+
+    def __init__(self, shm, arrays, meta):
+        self.shm = shm
+        self.arrays = arrays
+        self.meta = meta
+        _open_segments.add(self)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def size(self):
+        return self.shm.size
+
+    @classmethod
+    def create(cls, arrays, meta=None):
+        """
+        Copy arrays into a new segment, owned by the calling process (see unlink).
+        """
+        arrays = {key: np.ascontiguousarray(values) for key, values in arrays.items()}
+        meta = meta or {}
+        layout = {}
+        offset = 0
+        for key, values in arrays.items():
+            layout[key] = [offset, values.dtype.str, list(values.shape)]
+            offset = _align(offset + values.nbytes)
+        manifest = json.dumps({"arrays": layout, "meta": meta}).encode("utf-8")
+        data_start = _align(_HEADER.size + len(manifest))
+
+        shm = SharedMemory(create=True, size=max(data_start + offset, 1))
+        shm.buf[:_HEADER.size] = _HEADER.pack(len(manifest))
+        shm.buf[_HEADER.size:_HEADER.size + len(manifest)] = manifest
+        views = {}
+        for key, values in arrays.items():
+            start = data_start + layout[key][0]
+            view = np.ndarray(values.shape, dtype=values.dtype, buffer=shm.buf, offset=start)
+            view[...] = values
+            view.flags.writeable = False
+            views[key] = view
+        return cls(shm, views, meta)
+
+    @classmethod
+    def attach(cls, name):
+        """
+        Attach to an existing segment, with read-only views of its arrays.
+        """
+        shm = _open(name)
+        (length,) = _HEADER.unpack(bytes(shm.buf[:_HEADER.size]))
+        manifest = json.loads(bytes(shm.buf[_HEADER.size:_HEADER.size + length]).decode("utf-8"))
+        data_start = _align(_HEADER.size + length)
+        arrays = {}
+        for key, (offset, dtype, shape) in manifest["arrays"].items():
+            view = np.ndarray(tuple(shape), dtype=np.dtype(dtype), buffer=shm.buf, offset=data_start + offset)
+            view.flags.writeable = False
+            arrays[key] = view
+        return cls(shm, arrays, manifest["meta"])
+
+    def group(self, prefix):
+        """
+        Arrays stored under "<prefix>/", keyed by the rest of their name.
+        """
+        return self.groups(prefix.count("/") + 1).get(prefix, {})
+
+    def groups(self, depth):
+        """
+        Arrays grouped by the first `depth` parts of their name:
+        {"tile/0": {"ra": ..., ...}, "tile/1": {...}} for depth 2.
+        """
+        groups = {}
+        for key, values in self.arrays.items():
+            parts = key.split("/")
+            if len(parts) > depth:
+                groups.setdefault("/".join(parts[:depth]), {})["/".join(parts[depth:])] = values
+        return groups
+
+    def close(self):
+        """
+        Unmap the segment. Views of its arrays must not be used afterwards.
+        """
+        _open_segments.discard(self)
+        self.arrays = {}
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+
+def _open(name):
+    """
+    Open a segment without handing it to this process' resource tracker, which would
+    otherwise unlink it when the process exits while other workers still use it.
+    """
+    try:
+        return SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 has no track argument
+        register = resource_tracker.register
+        resource_tracker.register = lambda *args, **kwargs: None
+        try:
+            return SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+
+
+def collect():
+    """
+    Load the star data to share and return (arrays, meta) for SharedArrays.create.
+    """
+    arrays = {}
+    meta = {"tiles": [], "catalog": False, "skies": []}
+
+    for i, (path, columns) in enumerate(tile_cache.disk_tiles()):
+        meta["tiles"].append(path)
+        for name, values in columns.items():
+            arrays["tile/{}/{}".format(i, name)] = values
+
+    # planet skies need the catalog in every mode; without cartesian mode or warming it is
+    # only shared when it can be built without the archive
+    share_catalog = config.SKYVIEW_MODE == "cartesian" or config.PLANET_SKY_WARM or catalog.cached_locally()
+    # the offline store is memory-mapped, its pages are already shared by the OS
+    if share_catalog and config.STAR_BACKEND != "store":
+        stars = catalog.get_catalog(wait=True)
+        for name, values in stars.columns.items():
+            arrays["catalog/columns/" + name] = values
+        arrays["catalog/xyz"] = stars.xyz
+        arrays["catalog/source_order"] = stars.source_order
+        meta["catalog"] = True
+
+    if config.PLANET_SKY_WARM:
+        planet_sky.warm()
+        for i, (system, sky) in enumerate(planet_sky.skies().items()):
+            key = "sky/{}".format(i)
+            meta["skies"].append({"key": key, "system": list(system), "name": sky.name, "n_side": sky.index.n_side})
+            for column, values in sky.index.columns.items():
+                arrays["{}/columns/{}".format(key, column)] = values
+            arrays[key + "/offsets"] = sky.index.offsets
+    return arrays, meta
+
+
+def publish():
+    """
+    Copy the star data into a new shared memory segment and return it.
+    The caller owns the segment and unlinks it when the workers are gone.
+    """
+    arrays, meta = collect()
+    shared = SharedArrays.create(arrays, meta)
+    # the private copies of this process are no longer needed
+    del arrays
+    tile_cache.clear_memory()
+    catalog.reset()
+    planet_sky.invalidate()
+    return shared
+
+
+def install(shared):
+    """
+    Serve tiles, catalog and planet skies of this process from a shared segment.
+    """
+    tiles = shared.groups(2)
+    tile_cache.share_tiles({path: tiles["tile/{}".format(i)] for i, path in enumerate(shared.meta["tiles"])})
+    if shared.meta["catalog"]:
+        catalog.install(catalog.Catalog(shared.group("catalog/columns"), shared.arrays["catalog/xyz"],
+                                        source_order=shared.arrays["catalog/source_order"]))
+    skies = {}
+    for sky in shared.meta["skies"]:
+        index = SkyIndex(shared.group(sky["key"] + "/columns"), shared.arrays[sky["key"] + "/offsets"],
+                         sky["n_side"])
+        skies[tuple(sky["system"])] = planet_sky.PlanetSky(sky["name"], index)
+    planet_sky.install(skies)
+
+
+def attach(name=None):
+    """
+    Attach this worker to the segment named by EXOSKY_SHARED_MEMORY_NAME (once).
+    Returns the SharedArrays, or None when no segment is configured.
+    """
+    global _attached
+    name = name or config.SHARED_MEMORY_NAME
+    if not name:
+        return None
+    with _attach_lock:
+        if _attached is None:
+            _attached = SharedArrays.attach(name)
+            install(_attached)
+        return _attached
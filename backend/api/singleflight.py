@@ -0,0 +1,108 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+# Request coalescing (single flight) with a short-lived result cache.
+# Concurrent calls with the same key share one in-flight computation, and finished
+# results are kept in a small LRU cache for `ttl` seconds. Meant to be used from a
+# single event loop (one instance per uvicorn worker).
+
+
+class Uncached:
+    """
+    A result handed to every waiting caller but not kept in the result cache,
+    e.g. a degraded answer while a backend is down.
+    """
+
+    def __init__(self, value):
+        self.value = value
+
+
+class SingleFlightCache:
+    """
+    Args:
+        ttl: seconds a finished result stays cached (0 disables the result cache)
+        max_entries: maximum number of cached results, least recently used are dropped
+    """
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0}
+        self._results = OrderedDict()
+        self._inflight = {}
+        self._uncached = set()
+
+    def get_stats(self):
+        return dict(self.stats, entries=len(self._results), inflight=len(self._inflight))
+
+    def clear(self):
+        self._results.clear()
+        for name in self.stats:
+            self.stats[name] = 0
+
+    def _cached(self, key):
+        entry = self._results.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires < time.monotonic():
+            del self._results[key]
+            return None
+        self._results.move_to_end(key)
+        return entry
+
+    async def _run(self, key, make_coroutine):
+        result = await make_coroutine()
+        if isinstance(result, Uncached):
+            self._uncached.add(key)
+            return result.value
+        return result
+
+    def _store(self, key, task):
+        self._inflight.pop(key, None)
+        if key in self._uncached:
+            self._uncached.discard(key)
+            return
+        if task.cancelled() or task.exception() is not None or self.ttl <= 0:
+            return
+        self._results[key] = (time.monotonic() + self.ttl, task.result())
+        self._results.move_to_end(key)
+        while len(self._results) > self.max_entries:
+            self._results.popitem(last=False)
+
+    def task(self, key, make_coroutine):
+        """
+        Return an awaitable for the result of `key`.
+        A cached result is returned directly, a call already in flight is shared,
+        otherwise make_coroutine() is started. Await the returned future through
+        asyncio.shield() so one caller giving up does not cancel it for the others.
+        A coroutine returning Uncached(value) shares value with the waiting callers
+        without caching it.
+        """
+        entry = self._cached(key)
+        if entry is not None:
+            self.stats["hits"] += 1
+            future = asyncio.get_running_loop().create_future()
+            future.set_result(entry[1])
+            return future
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+            return task
+
+        self.stats["misses"] += 1
+        task = asyncio.ensure_future(self._run(key, make_coroutine))
+        self._inflight[key] = task
+        task.add_done_callback(lambda done: self._store(key, done))
+        return task
+
+
+def quantize(value, step):
+    """
+    Snap a value to a grid of `step` (no snapping when step is 0).
+    """
+    if not step:
+        return value
+    return round(round(value / step) * step, 9)
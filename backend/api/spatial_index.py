@@ -0,0 +1,328 @@
+import math
+
+import numpy as np
+
+# In-process spatial index over a star catalog.
+# Stars are bucketed into the cells of a cube map: the unit sphere is projected onto the
+# six faces of a cube and every face is cut into n_side x n_side cells (equal-angle
+# projection, so cells have similar sizes and there is no singularity at the poles or at
+# RA 0/360). Rows are stored sorted by (cell, G magnitude), so a cell is a contiguous
+# slice whose brightest stars come first, and a field of view query only touches the
+# cells that can overlap it.
+
+_FACE_AXES = ((1, 2), (0, 2), (0, 1))
+
+
+def unit_vectors(ra_deg, dec_deg):
+    ra = np.radians(ra_deg)
+    dec = np.radians(dec_deg)
+    return np.stack([np.cos(dec) * np.cos(ra), np.cos(dec) * np.sin(ra), np.sin(dec)], axis=-1)
+
+
+def normalize_box(ra_min, ra_max, dec_min, dec_max):
+    """
+    Normalize an RA/Dec box that may wrap around RA 0/360 or extend past a pole.
+    Returns:
+        ra_start: start of the RA range in [0, 360)
+        ra_width: width of the RA range in degrees (360 for the whole circle)
+        dec_min, dec_max: declination range clipped to [-90, 90]
+    A box reaching over a pole sees every right ascension, so its RA range is widened
+    to the full circle.
+    """
+    width = ra_max - ra_min
+    if width >= 360 or dec_min < -90 or dec_max > 90:
+        return 0.0, 360.0, max(dec_min, -90.0), min(dec_max, 90.0)
+    return ra_min % 360, max(width, 0.0), dec_min, dec_max
+
+
+def ra_segments(ra_start, ra_width):
+    """
+    Split a normalized RA range into non-wrapping (ra_min, ra_max) segments.
+    """
+    ra_end = ra_start + ra_width
+    if ra_end <= 360:
+        return [(ra_start, ra_end)]
+    return [(ra_start, 360.0), (0.0, ra_end - 360)]
+
+
+def in_ra_range(ra, ra_start, ra_width):
+    if ra_width >= 360:
+        return np.ones(np.shape(ra), dtype=bool)
+    return (np.asarray(ra) - ra_start) % 360 <= ra_width
+
+
+def cell_of(vectors, n_side):
+    """
+    Return the cube map cell of each unit vector.
+    """
+    vectors = np.atleast_2d(vectors)
+    major = np.argmax(np.abs(vectors), axis=1)
+    rows = np.arange(len(vectors))
+    major_value = vectors[rows, major]
+    face = 2 * major + (major_value < 0)
+
+    axes = np.array(_FACE_AXES)[major]
+    u = vectors[rows, axes[:, 0]] / np.abs(major_value)
+    v = vectors[rows, axes[:, 1]] / np.abs(major_value)
+    i = np.clip(((np.arctan(u) * 4 / np.pi + 1) / 2 * n_side).astype(np.int64), 0, n_side - 1)
+    j = np.clip(((np.arctan(v) * 4 / np.pi + 1) / 2 * n_side).astype(np.int64), 0, n_side - 1)
+    return (face * n_side + i) * n_side + j
+
+
+def _face_point(face, a, b):
+    """
+    Unit vector of the face coordinates (a, b) in [-1, 1] (equal-angle projection).
+    """
+    major, sign = face // 2, np.where(face % 2 == 0, 1.0, -1.0)
+    axes = np.array(_FACE_AXES)[major]
+    vectors = np.zeros(np.shape(a) + (3,))
+    rows = np.arange(len(a))
+    vectors[rows, major] = sign
+    vectors[rows, axes[:, 0]] = np.tan(a * np.pi / 4)
+    vectors[rows, axes[:, 1]] = np.tan(b * np.pi / 4)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def cell_geometry(n_side):
+    """
+    Return the center unit vector and the angular radius (radians) of every cell.
+    """
+    cells = np.arange(6 * n_side * n_side)
+    face = cells // (n_side * n_side)
+    i = (cells // n_side) % n_side
+    j = cells % n_side
+
+    def coord(k):
+        return k / n_side * 2 - 1
+
+    centers = _face_point(face, coord(i + 0.5), coord(j + 0.5))
+    radius = np.zeros(len(cells))
+    for di in (0, 1):
+        for dj in (0, 1):
+            corner = _face_point(face, coord(i + di), coord(j + dj))
+            cos_angle = np.clip(np.sum(corner * centers, axis=1), -1, 1)
+            radius = np.maximum(radius, np.arccos(cos_angle))
+    return centers, radius
+
+
+def default_n_side(n_rows, stars_per_cell=64):
+    return int(np.clip(math.sqrt(n_rows / 6 / stars_per_cell), 1, 256))
+
+
+class SkyIndex:
+    """
+    Cone and box queries over star columns sorted by (cell, G magnitude).
+    Args:
+        columns: dictionary of arrays (in memory or memory-mapped) in index order
+        offsets: start row of every cell, with the total row count appended
+        n_side: cells per cube face edge
+    """
+
+    def __init__(self, columns, offsets, n_side):
+        self.columns = columns
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.n_side = n_side
+        self.cell_centers, self.cell_radius = cell_geometry(n_side)
+        self._sorted_mag = None
+
+    @staticmethod
+    def sort_columns(columns, n_side=None):
+        """
+        Sort star columns into index order.
+        Rows without a position are dropped.
+        Returns:
+            columns: sorted columns
+            offsets: start row of every cell
+            n_side: cells per cube face edge
+        """
+        valid = np.isfinite(columns["ra"]) & np.isfinite(columns["dec"])
+        columns = {name: values[valid] for name, values in columns.items()}
+        n_rows = len(columns["ra"])
+        if n_side is None:
+            n_side = default_n_side(n_rows)
+
+        cells = cell_of(unit_vectors(columns["ra"], columns["dec"]), n_side) if n_rows else np.empty(0, np.int64)
+        mag = np.nan_to_num(columns["phot_g_mean_mag"], nan=np.inf)
+        order = np.lexsort((mag, cells))
+        counts = np.bincount(cells, minlength=6 * n_side * n_side)
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        return {name: values[order] for name, values in columns.items()}, offsets, n_side
+
+    @classmethod
+    def build(cls, columns, n_side=None):
+        """
+        Build an in-memory index from star columns in any order.
+        """
+        return cls(*cls.sort_columns(columns, n_side))
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def rows(self, index):
+        """
+        Return the given rows as a dictionary of in-memory numpy arrays.
+        """
+        columns = {}
+        for name, values in self.columns.items():
+            values = values[index]
+            if values.dtype.kind == "S":
+                values = np.char.decode(values, "ascii")
+            elif values.dtype.kind == "f":
+                values = values.astype(np.float64)
+            columns[name] = values
+        return columns
+
+    def count_brighter(self, mag_limits):
+        """
+        Return the number of stars of the whole index not fainter than each magnitude.
+        """
+        if self._sorted_mag is None:
+            mag = np.asarray(self.columns["phot_g_mean_mag"], dtype=np.float32)
+            self._sorted_mag = np.sort(mag[np.isfinite(mag)])
+        return np.searchsorted(self._sorted_mag, mag_limits, side="right")
+
+    def cell_ranges(self, ra, dec, radius):
+        """
+        Return the (starts, ends) row ranges of all cells that can overlap the cone
+        (radius in degrees).
+        """
+        radius = math.radians(radius)
+        if radius >= math.pi:
+            cells = np.arange(len(self.cell_radius))
+        else:
+            center = unit_vectors(ra, dec)
+            angle = np.arccos(np.clip(self.cell_centers @ center, -1, 1))
+            cells = np.flatnonzero(angle <= radius + self.cell_radius)
+        return self.offsets[cells], self.offsets[cells + 1]
+
+    def _mag_bound(self, starts, ends, mag):
+        """
+        Per cell range, the end of the stars not fainter than `mag` (scalar or per range).
+        """
+        # binary search in every range at once (NaN magnitudes sort last and never match)
+        mag_values = self.columns["phot_g_mean_mag"]
+        lo = np.array(starts, dtype=np.int64)
+        hi = np.array(ends, dtype=np.int64)
+        while True:
+            open_ = lo < hi
+            if not open_.any():
+                return lo
+            mid = (lo + hi) // 2
+            brighter = np.zeros(len(lo), dtype=bool)
+            brighter[open_] = mag_values[mid[open_]] <= np.broadcast_to(mag, lo.shape)[open_]
+            lo = np.where(open_ & brighter, mid + 1, lo)
+            hi = np.where(open_ & ~brighter, mid, hi)
+
+    @staticmethod
+    def _gather(starts, ends):
+        lengths = ends - starts
+        keep = lengths > 0
+        starts, lengths = starts[keep], lengths[keep]
+        if not len(starts):
+            return np.empty(0, dtype=np.int64)
+        shift = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+        return np.arange(lengths.sum()) + shift
+
+    def candidates(self, ra, dec, radius, mag_max=None):
+        """
+        Return the rows of all cells that can overlap the cone (radius in degrees).
+        With mag_max, only the stars of each cell brighter than mag_max are returned.
+        """
+        starts, ends = self.cell_ranges(ra, dec, radius)
+        if mag_max is not None:
+            ends = self._mag_bound(starts, ends, mag_max)
+        return self._gather(starts, ends)
+
+    def _select(self, index, parallax_min, n_stars):
+        if parallax_min is not None:
+            index = index[np.asarray(self.columns["parallax"][index]) > parallax_min]
+        mag = np.nan_to_num(np.asarray(self.columns["phot_g_mean_mag"][index]), nan=np.inf)
+        order = np.argsort(mag, kind="stable")
+        if n_stars is not None:
+            order = order[:n_stars]
+        return self.rows(index[order])
+
+    def query_cone(self, ra, dec, radius, mag_max=None, distance_max=None, n_stars=None):
+        """
+        Return the stars within `radius` degrees of (ra, dec), brighter than mag_max and
+        nearer than distance_max parsecs, sorted by G magnitude.
+        """
+        index = self.candidates(ra, dec, radius, mag_max)
+        vectors = unit_vectors(self.columns["ra"][index], self.columns["dec"][index])
+        index = index[vectors @ unit_vectors(ra, dec) >= math.cos(math.radians(min(radius, 180)))]
+        parallax_min = 1000 / distance_max if distance_max is not None else None
+        return self._select(index, parallax_min, n_stars)
+
+    @staticmethod
+    def _bounding_cone(ra_start, ra_width, dec_min, dec_max):
+        center_ra = (ra_start + ra_width / 2) % 360
+        center_dec = (dec_min + dec_max) / 2
+        max_cos = 1.0 if dec_min <= 0 <= dec_max else math.cos(math.radians(min(abs(dec_min), abs(dec_max))))
+        radius = (dec_max - dec_min) / 2 + ra_width / 2 * max_cos
+        return center_ra, center_dec, radius
+
+    def _in_box(self, index, ra_start, ra_width, dec_min, dec_max):
+        ra = np.asarray(self.columns["ra"][index])
+        dec = np.asarray(self.columns["dec"][index])
+        return index[in_ra_range(ra, ra_start, ra_width) & (dec >= dec_min) & (dec <= dec_max)]
+
+    def query_box(self, ra_min, ra_max, dec_min, dec_max, parallax_min=None, n_stars=None, mag_max=None):
+        """
+        Return the stars inside an RA/Dec box, same contract as tile_cache.query_box.
+        The box may wrap around RA 0/360 and reach over the poles.
+        """
+        ra_start, ra_width, dec_min, dec_max = normalize_box(ra_min, ra_max, dec_min, dec_max)
+        if dec_min > dec_max:
+            return self.rows(np.empty(0, dtype=np.int64))
+
+        index = self.candidates(*self._bounding_cone(ra_start, ra_width, dec_min, dec_max), mag_max)
+        index = self._in_box(index, ra_start, ra_width, dec_min, dec_max)
+        return self._select(index, parallax_min, n_stars)
+
+    def iter_box(self, ra_min, ra_max, dec_min, dec_max, parallax_min=None, chunk_size=1000, mag_step=0.5):
+        """
+        Yield the stars inside an RA/Dec box in chunks of about chunk_size, brightest first.
+        The box is walked in magnitude bands using the per-cell magnitude order, so only
+        one band of rows is held at a time. The band width adapts to keep bands near
+        chunk_size stars. Stars without a magnitude are skipped.
+        """
+        ra_start, ra_width, dec_min, dec_max = normalize_box(ra_min, ra_max, dec_min, dec_max)
+        if dec_min > dec_max:
+            return
+        starts, ends = self.cell_ranges(*self._bounding_cone(ra_start, ra_width, dec_min, dec_max))
+        mag_values = self.columns["phot_g_mean_mag"]
+        cursor = starts.copy()
+
+        pending = None
+        while True:
+            active = cursor < ends
+            if not active.any():
+                break
+            # the brightest remaining star of every active cell
+            heads = np.asarray(mag_values[cursor[active]], dtype=np.float64)
+            finite = np.isfinite(heads)
+            if not finite.any():
+                break
+            limit = heads[finite].min() + mag_step
+            bound = cursor.copy()
+            bound[active] = self._mag_bound(cursor[active], ends[active], limit)
+
+            index = self._in_box(self._gather(cursor, bound), ra_start, ra_width, dec_min, dec_max)
+            cursor = bound
+            if parallax_min is not None:
+                index = index[np.asarray(self.columns["parallax"][index]) > parallax_min]
+            index = index[np.argsort(np.asarray(mag_values[index]), kind="stable")]
+            if pending is not None:
+                index = np.concatenate([pending, index])
+            while len(index) >= chunk_size:
+                yield self.rows(index[:chunk_size])
+                index = index[chunk_size:]
+            pending = index
+
+            scanned = len(index)
+            if scanned < chunk_size // 2:
+                mag_step *= 2
+            elif scanned > 4 * chunk_size:
+                mag_step /= 2
+        if pending is not None and len(pending):
+            yield self.rows(pending)
@@ -1,14 +1,27 @@
-import json
-from typing import Optional
-from fastapi import APIRouter, HTTPException
-from fastapi.encoders import jsonable_encoder
-from fastapi.responses import JSONResponse
-from matplotlib.pyplot import flag
+import asyncio
+import logging
+from typing import List, Optional
+
+import numpy as np
+from fastapi import APIRouter, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
 
-from api.data_api import get_skyview_from_exoplanet, get_skyview_from_earth
+from api import archive, catalog, config, metrics, render, tile_cache
+from api.executor import ClientDisconnected, run_blocking, wait_for_client
+from api.data_api import (CUBE_MAP_FOV, CUBE_MAP_VIEWS, get_frames_from_exoplanet, get_skyview_from_exoplanet,
+                          get_skyview_from_earth, get_skyviews_from_exoplanet, iter_skyview_from_exoplanet,
+                          iter_skyview_from_earth, track_fallback)
+from api.encoding import (JSON, NDJSON, batch_response, batch_types, encode_chunk, frames_response, frames_types,
+                          negotiate, skyview_response, stream_types, supported_types)
+from api.session import Camera, ViewSession, sessions
+from api.singleflight import SingleFlightCache, Uncached, quantize
 
+logger = logging.getLogger(__name__)
 router = APIRouter()
+skyview_cache = SingleFlightCache(config.SKYVIEW_CACHE_TTL, config.SKYVIEW_CACHE_ENTRIES)
+render_cache = SingleFlightCache(config.RENDER_CACHE_TTL, config.RENDER_CACHE_ENTRIES)
+frames_cache = SingleFlightCache(config.SKYVIEW_CACHE_TTL, config.FRAMES_CACHE_ENTRIES)
 
 
 class SkyviewParams(BaseModel):
@@ -17,81 +30,474 @@ class SkyviewParams(BaseModel):
     ex_distance: Optional[float] = None
     ra: float
     dec: float
+    mode: Optional[str] = None
+    fovy_w: Optional[float] = None
+    fovy_h: Optional[float] = None
+    n_stars: Optional[int] = None
+
+
+class SkyviewBatchParams(BaseModel):
+    ex_ra: Optional[float] = None
+    ex_dec: Optional[float] = None
+    ex_distance: Optional[float] = None
+    mode: Optional[str] = None
+    fovy_w: Optional[float] = None
+    fovy_h: Optional[float] = None
+    n_stars: Optional[int] = None
+    views: List[SkyviewParams] = []
+    cube_map: bool = False
+
+
+class FramesParams(SkyviewParams):
+    start: float = 0.0
+    end: float = 100000.0
+    frames: int = 100
+
+
+def response_type(request, supported=None, default=JSON):
+    """
+    Pick the response format from the Accept header (see api/encoding.py).
+    """
+    supported = supported or supported_types()
+    media_type = negotiate(request.headers.get("accept"), supported, default)
+    if media_type is None:
+        raise HTTPException(status_code=406, detail="Supported formats: " + ", ".join(supported))
+    return media_type
+
+
+def quantize_fov(value):
+    """
+    Snap a field of view to the skyview grid like ra/dec, so nearby fields share one
+    computation. Fields narrower than one grid step are kept as they are.
+    """
+    if value < config.SKYVIEW_GRID_DEG:
+        return value
+    return quantize(value, config.SKYVIEW_GRID_DEG)
+
+
+def view_fov(params, fovy_w, fovy_h):
+    """
+    Field of view of a request (snapped to the skyview grid), with the given defaults.
+    """
+    fovy_w = fovy_w if params.fovy_w is None else params.fovy_w
+    fovy_h = fovy_h if params.fovy_h is None else params.fovy_h
+    if not (0 < fovy_w <= 400 and 0 < fovy_h <= 400):
+        raise HTTPException(status_code=400, detail="Invalid parameters")
+    return quantize_fov(fovy_w), quantize_fov(fovy_h)
+
+
+def view_size(params, fovy_w, fovy_h, n_stars):
+    """
+    Field of view (see view_fov) and star count of a request, with the given defaults.
+    """
+    n_stars = n_stars if params.n_stars is None else params.n_stars
+    if not 0 < n_stars <= config.SKYVIEW_MAX_STARS:
+        raise HTTPException(status_code=400, detail="Invalid parameters")
+    return view_fov(params, fovy_w, fovy_h) + (n_stars,)
+
 
+def stream_limit(params):
+    """
+    Number of stars of a streaming request, capped by EXOSKY_SKYVIEW_STREAM_MAX_STARS.
+    """
+    if params.n_stars is not None and params.n_stars <= 0:
+        raise HTTPException(status_code=400, detail="Invalid parameters")
+    if params.n_stars is None:
+        return config.SKYVIEW_STREAM_MAX_STARS
+    return min(params.n_stars, config.SKYVIEW_STREAM_MAX_STARS)
+
+
+def uncached_on_fallback(func, *args, **kwargs):
+    """
+    Run a skyview function, results served from the bright star fallback are not cached.
+    """
+    result, fallback = track_fallback(func, *args, **kwargs)
+    return Uncached(result) if fallback else result
 
-class Star():
-    def __init__(self, name: str, ra: float, dec: float, vmag: float, bv: float):
-        self.name = name
-        self.ra = ra
-        self.dec = dec
-        self.vmag = vmag
-        self.bv = bv
 
-    def to_dict(self):
-        return {
-            "name": self.name,
-            "ra": str(self.ra),
-            "dec": str(self.dec),
-            "vmag": str(self.vmag),
-            "bv": str(self.bv)
-        }
+async def run_cached(cache, request, key, func, *args, **kwargs):
+    """
+    Run a blocking function on the executor, sharing the result with identical
+    concurrent requests and caching it in `cache`.
+    """
+    task = cache.task(key, lambda: run_blocking(None, uncached_on_fallback, func, *args, **kwargs))
+    return await wait_for_client(request, asyncio.shield(task))
+
+
+async def run_skyview(request, key, func, *args, **kwargs):
+    """
+    Run a skyview function on the executor, sharing the result with identical
+    concurrent requests and caching it briefly.
+    """
+    with metrics.span("skyview"):
+        return await run_cached(skyview_cache, request, key, func, *args, **kwargs)
+
+
+def encode_skyview(route, skyview, media_type):
+    """
+    Encode a skyview response, recording its star count and encoding time.
+    """
+    metrics.skyview_stars.observe(len(skyview["name"]), route)
+    with metrics.span("encode"):
+        return skyview_response(skyview, media_type)
+
+
+async def stream_skyview(request, chunks, media_type):
+    """
+    Stream the chunks of a skyview iterator, each one computed on the skyview executor.
+    The first chunk is computed before the response starts, so overload, timeout and
+    archive errors still get their status code. Later failures end the stream early.
+    """
+    try:
+        first = await run_blocking(request, next, chunks, None)
+    except ClientDisconnected:
+        chunks.close()
+        return Response(status_code=499)
+
+    async def body():
+        chunk = first
+        try:
+            while chunk is not None:
+                yield encode_chunk(chunk, media_type)
+                chunk = await run_blocking(request, next, chunks, None)
+        except (ClientDisconnected, HTTPException):
+            pass
+        finally:
+            try:
+                chunks.close()
+            except ValueError:
+                # still running on an abandoned executor thread, it stops on its own
+                pass
+
+    return StreamingResponse(body(), media_type=media_type)
 
 
 @router.post("/skyview/exoplanet/")
-async def get_stars_from_exoplanet(params: SkyviewParams):
+async def get_stars_from_exoplanet(params: SkyviewParams, request: Request):
     """
     Retrieve stars from exoplanet by given params:
     Exoplanet Right Ascension (ex_ra), Exoplanet Declination (ex_dec), Exoplanet Distance (ex_distance), Right Ascension (ra) and Declination (dec).
+    Optional field of view (fovy_w, fovy_h in degrees) and star count (n_stars) pick the level of detail.
+    The response format follows the Accept header (see api/encoding.py).
     """
 
-    print(params)
+    logger.debug("skyview from exoplanet: %s", params)
 
     if (params.ex_ra is None or params.ex_dec is None or 
         params.ex_distance is None or params.ex_distance < 0 or
-        params.ra is None or params.dec is None):
+        params.ra is None or params.dec is None or
+        (params.mode is not None and params.mode not in config.SKYVIEW_MODES)):
         raise HTTPException(status_code=400, detail="Invalid parameters")
+    fovy_w, fovy_h, n_stars = view_size(params, 400, 400, 3000)
+    media_type = response_type(request)
 
+    ra = quantize(params.ra, config.SKYVIEW_GRID_DEG)
+    dec = quantize(params.dec, config.SKYVIEW_GRID_DEG)
+    mode = params.mode or config.SKYVIEW_MODE
+    key = ("exoplanet", params.ex_ra, params.ex_dec, params.ex_distance, ra, dec, fovy_w, fovy_h, n_stars, mode)
+
+    try:
+        skyview = await run_skyview(
+            request,
+            key,
+            get_skyview_from_exoplanet,
+            params.ex_ra,
+            params.ex_dec,
+            params.ex_distance,
+            ra,
+            dec,
+            fovy_w,
+            fovy_h,
+            n_stars,
+            mode=mode
+        )
+    except ClientDisconnected:
+        return Response(status_code=499)
     
-    skyview = get_skyview_from_exoplanet(
-        params.ex_ra,
-        params.ex_dec,
-        params.ex_distance,
-        params.ra,
-        params.dec
-    )
-    
-    star_list = []
-    
-    for i in range(len(skyview["name"])):
-        star_list.append(Star(
-            skyview["name"][i], skyview["ra"][i], skyview["dec"][i], skyview["brightness"][i], skyview["bv"][i],
-        ))
-    
-    star_dict = [star.to_dict() for star in star_list]
-    
-    # Return the list of star dictionaries directly
-    return JSONResponse(status_code=200, content={"stars": star_dict})
+    return encode_skyview("exoplanet", skyview, media_type)
     
 @router.post("/skyview/earth/")
-async def get_stars_from_earth(params: SkyviewParams):
+async def get_stars_from_earth(params: SkyviewParams, request: Request):
     """
     Retrieve stars from earth by given Right Ascension (ra) and Declination (dec).
+    Optional field of view (fovy_w, fovy_h in degrees, default 40) and star count (n_stars, default 50).
+    The response format follows the Accept header (see api/encoding.py).
     """
-    if (params.ex_ra or params.ex_dec or params.ex_distance):
+    if (params.ex_ra or params.ex_dec or params.ex_distance or params.mode is not None):
         raise HTTPException(status_code=400, detail="Invalid parameters")
+    fovy_w, fovy_h, n_stars = view_size(params, 40, 40, 50)
+    media_type = response_type(request)
+
+    ra = quantize(params.ra, config.SKYVIEW_GRID_DEG)
+    dec = quantize(params.dec, config.SKYVIEW_GRID_DEG)
+
+    try:
+        skyview = await run_skyview(request, ("earth", ra, dec, fovy_w, fovy_h, n_stars),
+                                    get_skyview_from_earth, ra, dec, fovy_w, fovy_h, n_stars)
+    except ClientDisconnected:
+        return Response(status_code=499)
     
-    ra = params.ra
-    dec = params.dec
-    
-    skyview = get_skyview_from_earth(int(ra), int(dec))
-    
-    star_list = []
-    
-    for i in range(len(skyview["name"])):
-        star_list.append(Star(
-            skyview["name"][i], skyview["ra"][i], skyview["dec"][i], skyview["brightness"][i], skyview["bv"][i],
-        ))
-    
-    star_dict = [star.to_dict() for star in star_list]
-    
-    return JSONResponse(status_code=200, content={"stars":star_dict})
+    return encode_skyview("earth", skyview, media_type)
+
+
+@router.post("/skyview/exoplanet/batch")
+async def get_stars_from_exoplanet_batch(params: SkyviewBatchParams, request: Request):
+    """
+    Retrieve stars from one exoplanet for several viewing directions in one request.
+    Takes the exoplanet (ex_ra, ex_dec, ex_distance), optional mode and defaults for
+    fovy_w, fovy_h and n_stars, plus a list of views (ra, dec and optional fovy_w, fovy_h,
+    n_stars) and/or cube_map=true for six 90 degree views covering the whole sky.
+    Returns {"views": [...]} in the default or columnar JSON layout (see api/encoding.py).
+    """
+    if (params.ex_ra is None or params.ex_dec is None or
+        params.ex_distance is None or params.ex_distance < 0 or
+        (params.mode is not None and params.mode not in config.SKYVIEW_MODES) or
+        not (params.views or params.cube_map) or
+        len(params.views) + 6 * params.cube_map > config.SKYVIEW_BATCH_MAX_VIEWS or
+        any(view.ex_ra is not None or view.ex_dec is not None or view.ex_distance is not None or
+            view.mode is not None for view in params.views)):
+        raise HTTPException(status_code=400, detail="Invalid parameters")
+    media_type = response_type(request, batch_types())
+    fovy_w, fovy_h, n_stars = view_size(params, 400, 400, 3000)
+
+    views, described = [], []
+    for view in params.views:
+        view_fovy_w, view_fovy_h, view_n_stars = view_size(view, fovy_w, fovy_h, n_stars)
+        views.append((quantize(view.ra, config.SKYVIEW_GRID_DEG), quantize(view.dec, config.SKYVIEW_GRID_DEG),
+                      view_fovy_w, view_fovy_h, view_n_stars))
+        described.append({"ra": views[-1][0], "dec": views[-1][1], "fovy_w": view_fovy_w, "fovy_h": view_fovy_h})
+    if params.cube_map:
+        for face, ra, dec in CUBE_MAP_VIEWS:
+            views.append((ra, dec, CUBE_MAP_FOV, CUBE_MAP_FOV, n_stars))
+            described.append({"face": face, "ra": ra, "dec": dec, "fovy_w": CUBE_MAP_FOV, "fovy_h": CUBE_MAP_FOV})
+
+    mode = params.mode or config.SKYVIEW_MODE
+    key = ("batch", params.ex_ra, params.ex_dec, params.ex_distance, tuple(views), mode)
+    try:
+        skyviews = await run_skyview(request, key, get_skyviews_from_exoplanet,
+                                     params.ex_ra, params.ex_dec, params.ex_distance, views, mode=mode)
+    except ClientDisconnected:
+        return Response(status_code=499)
+
+    for skyview in skyviews:
+        metrics.skyview_stars.observe(len(skyview["name"]), "batch")
+    with metrics.span("encode"):
+        return batch_response(described, skyviews, media_type)
+
+
+@router.post("/skyview/exoplanet/frames")
+async def get_frames_from_exoplanet_view(params: FramesParams, request: Request):
+    """
+    Time-lapse of the sky seen from an exoplanet: the stars of one view at `frames` epochs
+    evenly spaced from `start` to `end` years after the Gaia reference epoch.
+    Same view parameters as /skyview/exoplanet/, frames always use the cartesian view.
+    Returns frames-by-stars positions and magnitudes as JSON or float32 (see api/encoding.py).
+    """
+    if (params.ex_ra is None or params.ex_dec is None or
+        params.ex_distance is None or params.ex_distance < 0 or params.mode is not None or
+        not 0 < params.frames <= config.FRAMES_MAX or
+        not abs(params.start) <= config.FRAMES_MAX_YEARS or not abs(params.end) <= config.FRAMES_MAX_YEARS):
+        raise HTTPException(status_code=400, detail="Invalid parameters")
+    fovy_w, fovy_h, n_stars = view_size(params, 400, 400, 3000)
+    if params.frames * n_stars > config.FRAMES_MAX_VALUES:
+        raise HTTPException(status_code=400, detail="Too many frames x stars, at most {}".format(
+            config.FRAMES_MAX_VALUES))
+    media_type = response_type(request, frames_types())
+
+    ra = quantize(params.ra, config.SKYVIEW_GRID_DEG)
+    dec = quantize(params.dec, config.SKYVIEW_GRID_DEG)
+    key = ("frames", params.ex_ra, params.ex_dec, params.ex_distance, ra, dec, fovy_w, fovy_h, n_stars,
+           params.start, params.end, params.frames)
+    years = np.linspace(params.start, params.end, params.frames)
+    try:
+        with metrics.span("skyview"):
+            frames = await run_cached(frames_cache, request, key, get_frames_from_exoplanet, params.ex_ra,
+                                      params.ex_dec, params.ex_distance, ra, dec, fovy_w, fovy_h, n_stars, years)
+        metrics.skyview_stars.observe(len(frames["name"]), "frames")
+        with metrics.span("encode"):
+            return await run_blocking(request, frames_response, frames, media_type)
+    except ClientDisconnected:
+        return Response(status_code=499)
+
+
+@router.post("/skyview/exoplanet/stream")
+async def stream_stars_from_exoplanet(params: SkyviewParams, request: Request):
+    """
+    Stream the stars seen from an exoplanet in chunks, brightest first.
+    Same parameters as /skyview/exoplanet/ (fovy_w, fovy_h default 400) plus an optional
+    star limit (n_stars). Streams always use the cartesian view, other modes are a 400.
+    The chunk format follows the Accept header (NDJSON by default, see api/encoding.py).
+    """
+    if (params.ex_ra is None or params.ex_dec is None or
+        params.ex_distance is None or params.ex_distance < 0 or params.mode not in (None, "cartesian")):
+        raise HTTPException(status_code=400, detail="Invalid parameters")
+    fovy_w, fovy_h = view_fov(params, 400, 400)
+    n_stars = stream_limit(params)
+    media_type = response_type(request, stream_types(), NDJSON)
+    chunks = iter_skyview_from_exoplanet(params.ex_ra, params.ex_dec, params.ex_distance,
+                                         params.ra, params.dec, fovy_w, fovy_h, n_stars=n_stars,
+                                         chunk_size=config.SKYVIEW_STREAM_CHUNK)
+    return await stream_skyview(request, chunks, media_type)
+
+
+@router.post("/skyview/earth/stream")
+async def stream_stars_from_earth(params: SkyviewParams, request: Request):
+    """
+    Stream the stars seen from earth in chunks, brightest first.
+    Same parameters as /skyview/earth/ (fovy_w, fovy_h default 40), n_stars limits the
+    whole stream.
+    """
+    if (params.ex_ra or params.ex_dec or params.ex_distance or params.mode is not None):
+        raise HTTPException(status_code=400, detail="Invalid parameters")
+    fovy_w, fovy_h = view_fov(params, 40, 40)
+    n_stars = stream_limit(params)
+    media_type = response_type(request, stream_types(), NDJSON)
+    chunks = iter_skyview_from_earth(params.ra, params.dec, fovy_w, fovy_h, n_stars=n_stars,
+                                     chunk_size=config.SKYVIEW_STREAM_CHUNK)
+    return await stream_skyview(request, chunks, media_type)
+
+
+@router.websocket("/session/exoplanet")
+async def skyview_session(websocket: WebSocket):
+    """
+    Viewing session for panning the sky from one exoplanet (see api/session.py).
+    The first message opens the session with the parameters of /skyview/exoplanet/ (ex_ra,
+    ex_dec, ex_distance, ra, dec and optional fovy_w, fovy_h, n_stars), every later message
+    moves the camera ({"ra", "dec"} plus optional fovy_w, fovy_h, n_stars and a "seq" echoed
+    in the reply). Each reply holds the stars entering the view with their session ids
+    ({"enter": {"count", "columns": {"id", "name", "ra", "dec", "vmag", "bv"}}}) and the ids
+    of the stars leaving it ("leave"). Updates arriving while one is computed are merged,
+    only the latest camera is answered. Sessions always use the cartesian view.
+    """
+    await websocket.accept()
+    try:
+        message = await asyncio.wait_for(websocket.receive_json(), config.SESSION_IDLE_TIMEOUT)
+        params = SkyviewParams(**message)
+        if (params.ex_ra is None or params.ex_dec is None or
+            params.ex_distance is None or params.ex_distance < 0 or
+            params.mode not in (None, "cartesian")):
+            raise ValueError("Invalid parameters")
+        camera = Camera.from_message(message)
+    except (ValueError, TypeError, KeyError):
+        await websocket.send_json({"error": "Invalid parameters"})
+        await websocket.close(code=1008)
+        return
+    except asyncio.TimeoutError:
+        await websocket.close(code=1001)
+        return
+    except WebSocketDisconnect:
+        return
+
+    session = ViewSession(params.ex_ra, params.ex_dec, params.ex_distance)
+    evicted = asyncio.Event()
+    for close in sessions.add(session, evicted.set):
+        close()
+    pending = [camera, message.get("seq")]
+    wake = asyncio.Event()
+    wake.set()
+
+    async def receive():
+        while True:
+            message = await asyncio.wait_for(websocket.receive_json(), config.SESSION_IDLE_TIMEOUT)
+            sessions.touch(session)
+            try:
+                pending[:] = [Camera.from_message(message, pending[0]), message.get("seq")]
+            except (ValueError, AttributeError) as error:
+                await websocket.send_json({"error": str(error)})
+                continue
+            wake.set()
+
+    async def send():
+        while True:
+            await wake.wait()
+            wake.clear()
+            camera, seq = pending
+            try:
+                reply = await run_blocking(None, session.update, camera)
+                metrics.skyview_stars.observe(reply["enter"]["count"], "session")
+            except HTTPException as error:
+                reply = {"error": error.detail, "status": error.status_code}
+            except catalog.CatalogLoading:
+                reply = {"error": "Star catalog is loading, try again later", "status": 503}
+            except Exception:
+                logger.exception("session update failed")
+                reply = {"error": "Skyview failed", "status": 500}
+            if seq is not None:
+                reply["seq"] = seq
+            await websocket.send_json(reply)
+
+    tasks = [asyncio.ensure_future(receive()), asyncio.ensure_future(send()),
+             asyncio.ensure_future(evicted.wait())]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        error = next((task.exception() for task in done if task.exception() is not None), None)
+        if isinstance(error, asyncio.TimeoutError) or evicted.is_set():
+            await websocket.close(code=1001)
+        elif isinstance(error, (ValueError, KeyError)):
+            # not a JSON text message
+            await websocket.close(code=1003)
+        elif error is not None and not isinstance(error, WebSocketDisconnect):
+            raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+        sessions.remove(session)
+
+
+@router.get("/render/exoplanet")
+async def render_from_exoplanet(request: Request, ex_ra: float, ex_dec: float, ex_distance: float,
+                                ra: float, dec: float, fov: Optional[float] = None, width: int = 800,
+                                height: int = 450, exposure: float = 1.0, mode: Optional[str] = None,
+                                format: Optional[str] = None):
+    """
+    Render the sky seen from an exoplanet (ex_ra, ex_dec, ex_distance) towards (ra, dec) as an image.
+    Optional horizontal field of view (fov, 1 to 120 degrees), image size (width, height in pixels),
+    exposure (brightness factor) and skyview mode. The format is png or webp, from the format
+    parameter or the Accept header (png by default).
+    Example: /star/render/exoplanet?ex_ra=90&ex_dec=-20&ex_distance=12&ra=20&dec=20&width=640&height=360
+    """
+    fov = config.RENDER_DEFAULT_FOV if fov is None else fov
+    if (ex_distance < 0 or not 1 <= fov <= 120 or not 0 < exposure <= 100 or
+        not 0 < width <= config.RENDER_MAX_SIZE or not 0 < height <= config.RENDER_MAX_SIZE or
+        (mode is not None and mode not in config.SKYVIEW_MODES)):
+        raise HTTPException(status_code=400, detail="Invalid parameters")
+    if format is not None:
+        media_type = "image/" + format.lower()
+        if media_type not in render.image_types():
+            raise HTTPException(status_code=400, detail="Supported formats: " + ", ".join(render.image_types()))
+    else:
+        media_type = response_type(request, render.image_types(), render.PNG)
+
+    ra = quantize(ra, config.SKYVIEW_GRID_DEG)
+    dec = quantize(dec, config.SKYVIEW_GRID_DEG)
+    fov = quantize_fov(fov)
+    mode = mode or config.SKYVIEW_MODE
+    key = ("render", ex_ra, ex_dec, ex_distance, ra, dec, fov, width, height, round(exposure, 2), mode, media_type)
+
+    try:
+        with metrics.span("render"):
+            image = await run_cached(render_cache, request, key, render.render_from_exoplanet, ex_ra, ex_dec,
+                                     ex_distance, ra, dec, fov, width, height, media_type, exposure, mode)
+    except ClientDisconnected:
+        return Response(status_code=499)
+
+    headers = {"Cache-Control": "public, max-age={}".format(int(config.RENDER_CACHE_TTL))}
+    if format is None:
+        headers["Vary"] = "Accept"
+    return Response(content=image, media_type=media_type, headers=headers)
+
+
+@router.get("/cache/stats")
+async def get_cache_stats():
+    """
+    Skyview coalescing/result cache, image and frames caches, tile cache and archive
+    client counters of this worker.
+    Example: /star/cache/stats
+    """
+    return JSONResponse(status_code=200, content={
+        "skyview": skyview_cache.get_stats(),
+        "render": render_cache.get_stats(),
+        "frames": frames_cache.get_stats(),
+        "tiles": tile_cache.get_stats(),
+        "archive": archive.get_stats()
+    })
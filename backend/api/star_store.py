@@ -0,0 +1,186 @@
+import argparse
+import json
+import os
+import threading
+
+import numpy as np
+
+from api import config
+from api.catalog import heliocentric_xyz
+from api.spatial_index import SkyIndex
+from api.tile_cache import COLUMNS, KINEMATIC_COLUMNS, concat_columns, table_to_columns, take_columns
+
+# Offline star store.
+# A Gaia extract is ingested once into a directory holding one .npy file per column,
+# sorted in spatial index order (see api/spatial_index.py). The store is opened with
+# memory mapping, so a query only touches the pages of the index cells it needs, and
+# every uvicorn worker mapping the same files shares those pages through the OS page cache.
+# Heliocentric x, y, z positions (see api/catalog.py) are precomputed into xyz.npy and
+# the permutation sorting the source ids (star lookups) into source_order.npy.
+# Stores written before proper motions and radial velocities were kept load with NaN
+# for them.
+#
+# Ingest a downloaded extract (CSV, VOTable or FITS) with:
+#     python -m api.star_store ingest gaia_extract.csv --out cache/store
+
+STORE_VERSION = 2
+
+DTYPES = {
+    "source_id": np.int64,
+    "ra": np.float64,
+    "dec": np.float64,
+    "parallax": np.float32,
+    "phot_g_mean_mag": np.float32,
+    "phot_bp_mean_mag": np.float32,
+    "phot_rp_mean_mag": np.float32,
+    "pmra": np.float32,
+    "pmdec": np.float32,
+    "radial_velocity": np.float32,
+}
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def read_extract(path, format=None):
+    """
+    Read a Gaia extract with astropy and return its columns.
+    Args:
+        path: CSV, VOTable or FITS file
+        format: astropy table format, guessed from the file extension when omitted
+    """
+    from astropy.table import Table
+
+    if format is None:
+        ext = os.path.splitext(path)[1].lower()
+        format = {".csv": "ascii.csv", ".vot": "votable", ".xml": "votable",
+                  ".fits": "fits", ".fit": "fits"}.get(ext)
+    return table_to_columns(Table.read(path, format=format))
+
+
+def write_store(columns, out_dir, n_side=None, bright_stars=False):
+    """
+    Write star columns to a store directory, sorted in spatial index order.
+    bright_stars records that the columns include the bright star tier.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    columns, offsets, n_side = SkyIndex.sort_columns(columns, n_side)
+
+    for name in COLUMNS:
+        values = columns[name]
+        if name == "DESIGNATION":
+            values = np.char.encode(values.astype(str), "ascii")
+        else:
+            values = values.astype(DTYPES[name])
+        np.save(os.path.join(out_dir, name + ".npy"), values)
+    np.save(os.path.join(out_dir, "cell_offsets.npy"), offsets)
+    np.save(os.path.join(out_dir, "xyz.npy"),
+            heliocentric_xyz(columns["ra"], columns["dec"], columns["parallax"]))
+    np.save(os.path.join(out_dir, "source_order.npy"), np.argsort(columns["source_id"], kind="stable"))
+
+    meta = {"version": STORE_VERSION, "rows": int(offsets[-1]), "n_side": n_side,
+            "columns": list(COLUMNS), "bright_stars": bright_stars}
+    with open(os.path.join(out_dir, "meta.json"), "w") as f:
+        json.dump(meta, f)
+    return meta
+
+
+def ingest(path, out_dir, format=None, n_side=None, bright_stars=None):
+    """
+    Convert a downloaded Gaia extract into a memory-mapped star store.
+    The bright star tier (see api/bright_stars.py) is added unless bright_stars is False
+    (default config.BRIGHT_STARS), bright stars found in the extract keep their Gaia row.
+    """
+    columns = read_extract(path, format)
+    if config.BRIGHT_STARS if bright_stars is None else bright_stars:
+        from api.bright_stars import get_bright_stars
+
+        bright = get_bright_stars()
+        columns = concat_columns([columns, take_columns(bright.columns, bright.unmatched(columns))])
+        return write_store(columns, out_dir, n_side, bright_stars=True)
+    return write_store(columns, out_dir, n_side)
+
+
+class StarStore:
+    """
+    Read-only, memory-mapped star store written by write_store().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        if self.meta["version"] != STORE_VERSION:
+            raise ValueError("Unsupported star store version: {}".format(self.meta["version"]))
+        self.columns = {}
+        for name in COLUMNS:
+            column_path = os.path.join(path, name + ".npy")
+            if name in KINEMATIC_COLUMNS and not os.path.exists(column_path):
+                # stores ingested before proper motions were kept: every star stands still
+                self.columns[name] = np.full(self.meta["rows"], np.nan, dtype=DTYPES[name])
+            else:
+                self.columns[name] = np.load(column_path, mmap_mode="r")
+
+        self.index = SkyIndex(self.columns, np.load(os.path.join(path, "cell_offsets.npy")),
+                              self.meta["n_side"])
+        xyz_path = os.path.join(path, "xyz.npy")
+        if os.path.exists(xyz_path):
+            self.xyz = np.load(xyz_path, mmap_mode="r")
+        else:
+            self.xyz = heliocentric_xyz(self.columns["ra"], self.columns["dec"], self.columns["parallax"])
+        order_path = os.path.join(path, "source_order.npy")
+        self.source_order = np.load(order_path, mmap_mode="r") if os.path.exists(order_path) else None
+
+    def __len__(self):
+        return self.meta["rows"]
+
+    def rows(self, index):
+        """
+        Return the given rows as a dictionary of in-memory numpy arrays.
+        """
+        return self.index.rows(index)
+
+    def query_box(self, ra_min, ra_max, dec_min, dec_max, parallax_min=None, n_stars=None, mag_max=None):
+        """
+        Return the stars inside an RA/Dec box, same contract as tile_cache.query_box.
+        Only the index cells overlapping the box are read from the mapped files.
+        """
+        return self.index.query_box(ra_min, ra_max, dec_min, dec_max, parallax_min, n_stars, mag_max)
+
+    def query_cone(self, ra, dec, radius, mag_max=None, distance_max=None, n_stars=None):
+        """
+        Return the stars within `radius` degrees of (ra, dec), see SkyIndex.query_cone.
+        """
+        return self.index.query_cone(ra, dec, radius, mag_max, distance_max, n_stars)
+
+
+def get_store():
+    """
+    Return the process wide store opened from config.STAR_STORE_DIR.
+    """
+    global _store
+    with _store_lock:
+        if _store is None or _store.path != config.STAR_STORE_DIR:
+            _store = StarStore(config.STAR_STORE_DIR)
+        return _store
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Exosky star store tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ingest_parser = commands.add_parser("ingest", help="ingest a Gaia extract (CSV, VOTable or FITS)")
+    ingest_parser.add_argument("path")
+    ingest_parser.add_argument("--out", default=config.STAR_STORE_DIR)
+    ingest_parser.add_argument("--format", default=None, help="astropy table format")
+    ingest_parser.add_argument("--n-side", type=int, default=None, help="index cells per cube face edge")
+    ingest_parser.add_argument("--no-bright-stars", dest="bright_stars", action="store_false", default=None,
+                               help="do not add the bright star tier")
+    args = parser.parse_args(argv)
+
+    if args.command == "ingest":
+        meta = ingest(args.path, args.out, args.format, args.n_side, args.bright_stars)
+        print("Ingested {} stars into {}".format(meta["rows"], args.out))
+
+
+if __name__ == "__main__":
+    main()
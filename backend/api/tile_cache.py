@@ -0,0 +1,511 @@
+import math
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import numpy as np
+
+from api import archive, config, metrics
+from api.spatial_index import in_ra_range, normalize_box, ra_segments
+
+# Persistent sky tile cache in front of the Gaia archive.
+# The sky is cut into fixed RA/Dec tiles of TILE_SIZE_DEG degrees. Each tile holds the
+# brightest TILE_STAR_LIMIT stars of that patch and is stored on disk as a columnar .npz
+# file (one array per Gaia column). Skyview queries only go to the archive for tiles
+# that are not cached yet; the on-disk cache is bounded by TILE_CACHE_MAX_BYTES and
+# evicts the least recently used tiles first.
+#
+# Every function taking a `size` works on the tile layout of that tile size (default
+# TILE_SIZE_DEG). Coarser layouts hold brighter stars per square degree, which is what
+# the level of detail tiers in api/lod.py are built from.
+#
+# Proper motions (mas/yr, pmra includes the cos(dec) factor) and radial velocities
+# (km/s) travel with every star for epoch propagation (see api/epoch.py). They are NaN
+# where Gaia has no measurement; tiles cached without them are fetched again.
+#
+# Tiles keep every star of their patch (stars without a parallax included) unless
+# TILE_MIN_PARALLAX sets a floor. Distance cuts belong to the callers: the earth view
+# has none, the proxy skyview passes its own parallax limit. As tiles only hold their
+# brightest stars, queries with a parallax limit read the layout of the largest of
+# TILE_PARALLAX_FLOORS below it, whose tiles hold the brightest stars above that floor
+# (the archive applies it), and cut at the exact limit. A tile of the floorless layout
+# with fewer than TILE_STAR_LIMIT stars holds its whole patch and answers every floor.
+
+KINEMATIC_COLUMNS = ("pmra", "pmdec", "radial_velocity")
+COLUMNS = ("source_id", "DESIGNATION", "ra", "dec", "parallax",
+           "phot_g_mean_mag", "phot_bp_mean_mag", "phot_rp_mean_mag") + KINEMATIC_COLUMNS
+
+stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+_stats_lock = threading.Lock()
+_index_lock = threading.Lock()
+_tile_locks = {}
+_fetch_pool = None
+_memory = OrderedDict()
+_shared = {}
+_disk_index = None
+
+
+class TilesPending(Exception):
+    """
+    Tiles are still being fetched from the archive after the caller's deadline. The
+    fetches go on and fill the cache, so a later query finds them.
+    """
+
+
+def _count(name, n=1):
+    with _stats_lock:
+        stats[name] += n
+
+
+def get_stats():
+    """
+    Return a copy of the cache counters (hits, misses, evictions).
+    """
+    with _stats_lock:
+        return dict(stats)
+
+
+def reset_stats():
+    with _stats_lock:
+        for name in stats:
+            stats[name] = 0
+
+
+def clear_memory():
+    """
+    Drop the in-process tile copies and forget the disk index (the files are kept).
+    """
+    global _disk_index
+    with _index_lock:
+        _memory.clear()
+        _disk_index = None
+
+
+def _size(size):
+    return config.TILE_SIZE_DEG if size is None else size
+
+
+def _floor(floor):
+    return config.TILE_MIN_PARALLAX if floor is None else floor
+
+
+def layout_floor(parallax_min=None):
+    """
+    Parallax floor (mas) of the tile layout answering queries above parallax_min: the
+    largest of TILE_PARALLAX_FLOORS not above it, None for the floorless layout.
+    """
+    if parallax_min is None:
+        return None
+    floors = [floor for floor in config.TILE_PARALLAX_FLOORS
+              if config.TILE_MIN_PARALLAX < floor <= parallax_min]
+    return max(floors) if floors else None
+
+
+def cache_dir(size=None, floor=None):
+    """
+    Directory of a tile layout. Tiles built with a different tile size,
+    star limit, parallax floor or Gaia table never mix.
+    """
+    layout = "{}-s{:g}-n{}-p{:g}".format(config.GAIA_TABLE, _size(size),
+                                         config.TILE_STAR_LIMIT, _floor(floor))
+    return os.path.join(config.TILE_CACHE_DIR, layout)
+
+
+def tile_count(size=None):
+    """
+    Number of tiles of a layout.
+    """
+    size = _size(size)
+    return int(math.ceil(360 / size)) * int(math.ceil(180 / size))
+
+
+def tile_key(ra, dec, size=None):
+    """
+    Return the (ra index, dec index) key of the tile containing the given position.
+    """
+    size = _size(size)
+    n_ra = int(math.ceil(360 / size))
+    n_dec = int(math.ceil(180 / size))
+    i = int(math.floor((ra % 360) / size)) % n_ra
+    j = min(int(math.floor((dec + 90) / size)), n_dec - 1)
+    return i, j
+
+
+def tile_bounds(key, size=None):
+    """
+    Return (ra_min, ra_max, dec_min, dec_max) of a tile in degrees.
+    """
+    size = _size(size)
+    i, j = key
+    return (i * size, min((i + 1) * size, 360.0),
+            j * size - 90, min((j + 1) * size - 90, 90.0))
+
+
+def tiles_for_box(ra_min, ra_max, dec_min, dec_max, size=None):
+    """
+    Return the keys of all tiles overlapping the RA/Dec box.
+    The box may wrap around RA 0/360 and reach over the poles (see normalize_box).
+    """
+    ra_start, ra_width, dec_min, dec_max = normalize_box(ra_min, ra_max, dec_min, dec_max)
+    if dec_min > dec_max:
+        return []
+
+    keys = []
+    for seg_min, seg_max in ra_segments(ra_start, ra_width):
+        i_min, j_min = tile_key(seg_min, dec_min, size)
+        i_max, j_max = tile_key(min(seg_max, np.nextafter(360.0, 0)), dec_max, size)
+        keys += [(i, j) for i in range(i_min, i_max + 1) for j in range(j_min, j_max + 1)
+                 if (i, j) not in keys]
+    return keys
+
+
+def empty_columns():
+    columns = {name: np.empty(0, dtype=np.float64) for name in COLUMNS}
+    columns["source_id"] = np.empty(0, dtype=np.int64)
+    columns["DESIGNATION"] = np.empty(0, dtype=str)
+    return columns
+
+
+def table_to_columns(table):
+    """
+    Convert an astropy table returned by the archive into a dict of plain numpy arrays.
+    Masked values become NaN, column names are matched case-insensitively. Missing
+    kinematic columns (extracts without proper motions) are filled with NaN.
+    """
+    names = {name.lower(): name for name in table.colnames}
+    columns = {}
+    for name in COLUMNS:
+        if name in KINEMATIC_COLUMNS and name.lower() not in names:
+            columns[name] = np.full(len(table), np.nan)
+            continue
+        col = table[names[name.lower()]]
+        if name == "DESIGNATION":
+            columns[name] = np.asarray(col).astype(str)
+        elif name == "source_id":
+            columns[name] = np.asarray(col, dtype=np.int64)
+        else:
+            columns[name] = np.ma.filled(np.ma.asarray(col, dtype=np.float64), np.nan)
+    return columns
+
+
+def concat_columns(parts):
+    if not parts:
+        return empty_columns()
+    return {name: np.concatenate([part[name] for part in parts]) for name in COLUMNS}
+
+
+def take_columns(columns, index):
+    return {name: columns[name][index] for name in COLUMNS}
+
+
+def fetch_tile(key, size=None, floor=None):
+    """
+    Query the Gaia archive for the brightest stars of one tile, above the parallax floor
+    of its layout when there is one.
+    """
+    floor = _floor(floor)
+    where = f"parallax > {floor}" if floor > 0 else None
+    query = archive.BoxQuery(", ".join(COLUMNS), config.GAIA_TABLE, where,
+                             "phot_g_mean_mag", config.TILE_STAR_LIMIT, tile_bounds(key, size))
+    return archive.get_client().query(query)
+
+
+def _tile_path(key, size=None, floor=None):
+    return os.path.join(cache_dir(size, floor), "{}_{}.npz".format(*key))
+
+
+def _load_disk_index():
+    """
+    LRU index of the tiles of every layout, which share the TILE_CACHE_MAX_BYTES budget.
+    """
+    global _disk_index
+    if _disk_index is None:
+        _disk_index = OrderedDict()
+        entries = []
+        if os.path.isdir(config.TILE_CACHE_DIR):
+            for layout in os.scandir(config.TILE_CACHE_DIR):
+                if not layout.is_dir():
+                    continue
+                for entry in os.scandir(layout.path):
+                    if entry.name.endswith(".npz"):
+                        st = entry.stat()
+                        entries.append((st.st_mtime, entry.path, st.st_size))
+        for _, path, size in sorted(entries):
+            _disk_index[path] = size
+    return _disk_index
+
+
+def _remember(path, columns):
+    _memory[path] = columns
+    _memory.move_to_end(path)
+    while len(_memory) > config.TILE_MEMORY_TILES:
+        _memory.popitem(last=False)
+
+
+def _evict(index):
+    total = sum(index.values())
+    while index and total > config.TILE_CACHE_MAX_BYTES:
+        path, size = index.popitem(last=False)
+        total -= size
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        _count("evictions")
+
+
+def store_tile(key, columns, size=None, floor=None):
+    """
+    Write a tile to the on-disk cache, evicting old tiles if the cache grows too large.
+    Tiles are kept brightest first (stars without a magnitude last), see iter_box.
+    """
+    columns = take_columns(columns, np.argsort(columns["phot_g_mean_mag"], kind="stable"))
+    directory = cache_dir(size, floor)
+    os.makedirs(directory, exist_ok=True)
+    path = _tile_path(key, size, floor)
+    tmp_path = "{}.{}.{}.tmp".format(path, os.getpid(), threading.get_ident())
+    with open(tmp_path, "wb") as f:
+        np.savez(f, **{name: columns[name] for name in COLUMNS})
+    os.replace(tmp_path, path)
+
+    with _index_lock:
+        index = _load_disk_index()
+        index[path] = os.path.getsize(path)
+        index.move_to_end(path)
+        _evict(index)
+        _remember(path, columns)
+
+
+def _read_tile(key, size=None, floor=None):
+    path = _tile_path(key, size, floor)
+    columns = _shared.get(path)
+    if columns is not None:
+        return columns
+    with _index_lock:
+        if path in _memory:
+            _memory.move_to_end(path)
+            index = _load_disk_index()
+            if path in index:
+                index.move_to_end(path)
+            return _memory[path]
+    try:
+        with np.load(path) as data:
+            columns = {name: data[name] for name in COLUMNS}
+    except (FileNotFoundError, EOFError, ValueError, KeyError):
+        return None
+    try:
+        os.utime(path)
+        size = os.path.getsize(path)
+    except FileNotFoundError:
+        size = 0
+    with _index_lock:
+        index = _load_disk_index()
+        if path not in index:
+            index[path] = size
+        index.move_to_end(path)
+        _remember(path, columns)
+    return columns
+
+
+def disk_tiles():
+    """
+    Yield (path, columns) of every tile in the disk cache, in all layouts.
+    """
+    with _index_lock:
+        paths = list(_load_disk_index())
+    for path in paths:
+        try:
+            with np.load(path) as data:
+                yield path, {name: data[name] for name in COLUMNS}
+        except (FileNotFoundError, EOFError, ValueError, KeyError):
+            continue
+
+
+def share_tiles(tiles):
+    """
+    Serve tiles from read-only columns shared between worker processes
+    (path -> columns, see api/shared_memory.py) before the memory and disk caches.
+    """
+    global _shared
+    _shared = dict(tiles)
+
+
+def _cached_tile(key, size=None, floor=None):
+    """
+    A tile of the layout from memory or disk, or the tile of the floorless layout when it
+    holds its whole patch. None when the archive has to be queried.
+    """
+    columns = _read_tile(key, size, floor)
+    if columns is None and floor is not None:
+        columns = _read_tile(key, size)
+        if columns is not None and len(columns["ra"]) >= config.TILE_STAR_LIMIT:
+            columns = None
+    return columns
+
+
+def is_cached(key, size=None):
+    """
+    Whether a tile can be read without querying the archive.
+    """
+    path = _tile_path(key, size)
+    if path in _shared:
+        return True
+    with _index_lock:
+        if path in _memory:
+            return True
+    return os.path.exists(path)
+
+
+def _tile_lock(path):
+    with _index_lock:
+        return _tile_locks.setdefault(path, threading.Lock())
+
+
+def load_tile(key, size=None, floor=None):
+    """
+    Return the columns of one tile, from memory, disk or (on a miss) the archive.
+    """
+    columns = _cached_tile(key, size, floor)
+    if columns is not None:
+        _count("hits")
+        return columns
+
+    with _tile_lock(_tile_path(key, size, floor)):
+        # another thread may have fetched the tile while we waited
+        columns = _read_tile(key, size, floor)
+        if columns is not None:
+            _count("hits")
+            return columns
+        _count("misses")
+        metrics.archive_queries.inc()
+        try:
+            with metrics.span("archive"):
+                columns = fetch_tile(key, size, floor)
+        except Exception:
+            metrics.archive_errors.inc()
+            raise
+        store_tile(key, columns, size, floor)
+        return columns
+
+
+def _get_fetch_pool():
+    global _fetch_pool
+    with _index_lock:
+        if _fetch_pool is None:
+            _fetch_pool = ThreadPoolExecutor(max_workers=config.TILE_FETCH_WORKERS, thread_name_prefix="tiles")
+        return _fetch_pool
+
+
+def load_tiles(keys, size=None, floor=None, timeout=None):
+    """
+    Return the columns of several tiles (see load_tile). Tiles missing from the caches
+    are fetched in parallel, so the archive client can merge their queries.
+    With a timeout (seconds), TilesPending is raised when the missing tiles are not all
+    fetched in time.
+    """
+    tiles = {}
+    missing = []
+    for key in keys:
+        columns = _cached_tile(key, size, floor)
+        if columns is None:
+            missing.append(key)
+        else:
+            _count("hits")
+            tiles[key] = columns
+    if len(missing) == 1 and timeout is None:
+        tiles[missing[0]] = load_tile(missing[0], size, floor)
+    elif missing:
+        futures = [(key, _get_fetch_pool().submit(metrics.copy_context().run, load_tile, key, size, floor))
+                   for key in missing]
+        _, pending = wait([future for _, future in futures], timeout)
+        if pending:
+            raise TilesPending("{} of {} tiles still being fetched".format(len(pending), len(keys)))
+        for key, future in futures:
+            tiles[key] = future.result()
+    return [tiles[key] for key in keys]
+
+
+'''
+Return the cached stars inside an RA/Dec box.
+Args:
+    ra_min, ra_max: right ascension range in degrees
+    dec_min, dec_max: declination range in degrees
+    parallax_min: only keep stars with a larger parallax (mas), also picks the parallax
+        floor of the tiles that are read (see layout_floor)
+    n_stars: maximum number of stars, the brightest are kept
+    mag_max: only keep stars brighter than this G magnitude
+    size: tile layout to read (default TILE_SIZE_DEG)
+    timeout: seconds to wait for missing tiles before raising TilesPending (see load_tiles)
+Returns:
+    columns: dictionary of numpy arrays keyed by Gaia column name, sorted by G magnitude
+'''
+def query_box(ra_min, ra_max, dec_min, dec_max, parallax_min=None, n_stars=None, mag_max=None, size=None,
+              timeout=None):
+    ra_start, ra_width, dec_lo, dec_hi = normalize_box(ra_min, ra_max, dec_min, dec_max)
+    parts = []
+    tiles = load_tiles(tiles_for_box(ra_min, ra_max, dec_min, dec_max, size), size, layout_floor(parallax_min),
+                       timeout)
+    for tile in tiles:
+        mask = (in_ra_range(tile["ra"], ra_start, ra_width) &
+                (tile["dec"] >= dec_lo) & (tile["dec"] <= dec_hi))
+        if parallax_min is not None:
+            mask &= tile["parallax"] > parallax_min
+        if mag_max is not None:
+            mask &= tile["phot_g_mean_mag"] <= mag_max
+        parts.append(take_columns(tile, mask))
+
+    columns = concat_columns(parts)
+    order = np.argsort(columns["phot_g_mean_mag"], kind="stable")
+    if n_stars is not None:
+        order = order[:n_stars]
+    return take_columns(columns, order)
+
+
+def iter_box(ra_min, ra_max, dec_min, dec_max, parallax_min=None, chunk_size=1000, size=None, mag_step=0.5):
+    """
+    Yield the cached stars inside an RA/Dec box in chunks of about chunk_size, brightest
+    first (see query_box for the arguments). Tiles are stored brightest first, so the box
+    is walked in magnitude bands across its tiles and only one band of rows is gathered
+    and sorted at a time, like SkyIndex.iter_box. Stars without a magnitude are skipped.
+    """
+    ra_start, ra_width, dec_lo, dec_hi = normalize_box(ra_min, ra_max, dec_min, dec_max)
+    tiles = load_tiles(tiles_for_box(ra_min, ra_max, dec_min, dec_max, size), size, layout_floor(parallax_min))
+    mags = [tile["phot_g_mean_mag"] for tile in tiles]
+    cursor = [0] * len(tiles)
+    ends = [int(np.searchsorted(mag, np.inf, side="right")) for mag in mags]
+
+    pending = None
+    while True:
+        heads = [mag[c] for mag, c, end in zip(mags, cursor, ends) if c < end]
+        if not heads:
+            break
+        limit = min(heads) + mag_step
+        parts = [] if pending is None else [pending]
+        for i, tile in enumerate(tiles):
+            bound = cursor[i] + int(np.searchsorted(mags[i][cursor[i]:ends[i]], limit, side="left"))
+            if bound == cursor[i]:
+                continue
+            band = take_columns(tile, slice(cursor[i], bound))
+            cursor[i] = bound
+            mask = (in_ra_range(band["ra"], ra_start, ra_width) &
+                    (band["dec"] >= dec_lo) & (band["dec"] <= dec_hi))
+            if parallax_min is not None:
+                mask &= band["parallax"] > parallax_min
+            parts.append(take_columns(band, mask))
+
+        columns = concat_columns(parts)
+        scanned = len(columns["ra"]) - (0 if pending is None else len(pending["ra"]))
+        columns = take_columns(columns, np.argsort(columns["phot_g_mean_mag"], kind="stable"))
+        while len(columns["ra"]) >= chunk_size:
+            yield take_columns(columns, slice(0, chunk_size))
+            columns = take_columns(columns, slice(chunk_size, None))
+        pending = columns
+
+        if scanned < chunk_size // 2:
+            mag_step *= 2
+        elif scanned > 4 * chunk_size:
+            mag_step /= 2
+    if pending is not None and len(pending["ra"]):
+        yield pending
@@ -0,0 +1,57 @@
+import argparse
+import tempfile
+import time
+
+from api import archive, config, tile_cache
+from benchmark.fake_gaia import FakeGaiaArchive, synthetic_catalog
+
+# Cold tile loads through the archive client (api/archive.py) with and without query
+# merging. Every round reads one RA/Dec box from an empty tile cache, so all its tiles
+# are fetched from a local Gaia stand-in with a simulated round trip; the table shows
+# the wall time and the number of archive queries per round.
+#     python -m benchmark.bench_archive --stars 200000 --latency 0.2 --boxes 60x30 180x30 360x60
+
+
+def cold_load(box, merge_max, rounds):
+    config.ARCHIVE_MERGE_MAX = merge_max
+    width, height = (float(value) for value in box.split("x"))
+    times = []
+    for _ in range(rounds):
+        with tempfile.TemporaryDirectory() as tiles:
+            config.TILE_CACHE_DIR = tiles
+            tile_cache.clear_memory()
+            start = time.perf_counter()
+            tile_cache.query_box(0, width, -height / 2, height / 2)
+            times.append(time.perf_counter() - start)
+    tile_cache.clear_memory()
+    return min(times)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark merged archive tile queries")
+    parser.add_argument("--stars", type=int, default=200000, help="synthetic catalog size")
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds per archive query")
+    parser.add_argument("--boxes", nargs="+", default=["60x30", "180x30", "360x60"], help="RA x Dec degrees")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    config.ARCHIVE_RATE = 0
+    config.BRIGHT_STARS = False
+    with FakeGaiaArchive(synthetic_catalog(args.stars), args.latency) as fake:
+        config.GAIA_TAP_URL = fake.url
+        print("{:>10} {:>8} {:>14} {:>10} {:>14} {:>10}".format(
+            "box", "tiles", "separate [ms]", "queries", "merged [ms]", "queries"))
+        for box in args.boxes:
+            width, height = (float(value) for value in box.split("x"))
+            n_tiles = len(tile_cache.tiles_for_box(0, width, -height / 2, height / 2))
+            line = "{:>10} {:>8}".format(box, n_tiles)
+            for merge_max in (1, 8):
+                before = fake.queries
+                elapsed = cold_load(box, merge_max, args.rounds)
+                line += " {:>14.0f} {:>10.1f}".format(elapsed * 1000, (fake.queries - before) / args.rounds)
+            print(line)
+    archive.close_clients()
+
+
+if __name__ == "__main__":
+    main()
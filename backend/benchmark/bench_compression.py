@@ -0,0 +1,72 @@
+import argparse
+import statistics
+import threading
+import time
+
+import httpx
+import uvicorn
+
+import api.star as star
+from api import compression, config
+from benchmark.bench_encoding import synthetic_skyview
+from main import app
+
+# Bytes on the wire and end-to-end latency of /skyview/exoplanet/ responses per
+# response format, content encoding and compression level. The app runs in-process
+# behind uvicorn, the skyview itself is a precomputed synthetic result so only
+# serialization, compression and transfer are measured.
+#     python -m benchmark.bench_compression --stars 3000 20000
+
+
+def measure(client, accept, accept_encoding, repeat):
+    view = {"ex_ra": 90, "ex_dec": -20, "ex_distance": 0.9, "ra": 20, "dec": 20}
+    headers = {"Accept": accept, "Accept-Encoding": accept_encoding}
+    times = []
+    for _ in range(repeat):
+        star.skyview_cache.clear()
+        start = time.perf_counter()
+        with client.stream("POST", "/api/v1/star/skyview/exoplanet/", json=view, headers=headers) as response:
+            response.read()
+            wire = response.num_bytes_downloaded
+        times.append(time.perf_counter() - start)
+    return wire, statistics.median(times)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark response compression")
+    parser.add_argument("--stars", type=int, nargs="+", default=[3000, 20000])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args(argv)
+
+    server = uvicorn.Server(uvicorn.Config(app, port=args.port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+
+    settings = [("identity", None)] + [("gzip", level) for level in (1, 6, 9)]
+    settings += [(name, None) for name in compression.available_encodings() if name != "gzip"]
+    formats = {"legacy json": "application/json", "columnar json": "application/vnd.exosky.columnar+json"}
+
+    try:
+        print("{:>7} {:<14} {:<10} {:>12} {:>10}".format("stars", "format", "encoding", "wire bytes", "p50 ms"))
+        with httpx.Client(base_url="http://127.0.0.1:{}".format(args.port), timeout=60) as client:
+            for n in args.stars:
+                skyview = synthetic_skyview(n)
+                star.get_skyview_from_exoplanet = lambda *a, **k: skyview
+                for format_name, accept in formats.items():
+                    for encoding, level in settings:
+                        if level is not None:
+                            config.COMPRESSION_LEVEL = level
+                        wire, latency = measure(client, accept, encoding, args.repeat)
+                        label = encoding if level is None else "{}-{}".format(encoding, level)
+                        print("{:>7} {:<14} {:<10} {:>12} {:>10.2f}".format(n, format_name, label, wire,
+                                                                            latency * 1000))
+    finally:
+        server.should_exit = True
+        thread.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from api import catalog, constellation_store
+from benchmark.fake_gaia import synthetic_catalog
+
+# Saving and loading constellations (api/constellation_store.py).
+# Star references are resolved in one batch through the sorted source id index
+# (catalog.Catalog.find), against one scan of the source ids per star. Loading the
+# constellations of a planet reads the stored stars, it does not touch the catalog.
+#     python -m benchmark.bench_constellations --stars 1000000 --edges 10 100 1000
+
+
+def best_time(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark constellation star lookups")
+    parser.add_argument("--stars", type=int, default=1000000, help="synthetic catalog size")
+    parser.add_argument("--edges", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--constellations", type=int, default=200, help="constellations per planet")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    columns = synthetic_catalog(args.stars)
+    star_catalog = catalog.Catalog(columns, catalog.heliocentric_xyz(columns["ra"], columns["dec"],
+                                                                     columns["parallax"]))
+    source_ids = np.asarray(columns["source_id"])
+    elapsed, _ = best_time(lambda: catalog.Catalog(columns, star_catalog.xyz).find(source_ids[:1]), 1)
+    print("index build: {:.1f} ms for {} stars".format(elapsed * 1000, args.stars))
+
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as directory:
+        store = constellation_store.ConstellationStore(os.path.join(directory, "constellations.sqlite3"))
+        print("{:>8} {:>14} {:>14} {:>14} {:>14}".format(
+            "edges", "batched [ms]", "per star [ms]", "save [ms]", "list [ms]"))
+        for n_edges in args.edges:
+            edges = rng.choice(source_ids, (n_edges, 2)).tolist()
+            stars = [star for edge in edges for star in edge]
+            batched, _ = best_time(lambda: constellation_store.resolve_stars(stars, star_catalog), args.repeat)
+            per_star, _ = best_time(lambda: [np.flatnonzero(source_ids == star) for star in stars], 1)
+            planet = "planet {}".format(n_edges)
+            save, _ = best_time(lambda: [store.save(planet, "c", edges, star_catalog=star_catalog)
+                                         for _ in range(args.constellations)], 1)
+            listed, _ = best_time(lambda: store.for_planet(planet, 0, args.constellations), args.repeat)
+            print("{:>8} {:>14.2f} {:>14.1f} {:>14.2f} {:>14.2f}".format(
+                n_edges, batched * 1000, per_star * 1000, save * 1000 / args.constellations, listed * 1000))
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import argparse
+import time
+
+import numpy as np
+
+from api import encoding
+
+# Payload size and serialization time of the skyview response formats.
+# "legacy" is the previous path: one Star object per row, every value turned into a
+# string, then JSON encoded.
+#     python -m benchmark.bench_encoding --sizes 3000 100000
+
+
+class Star():
+    def __init__(self, name, ra, dec, vmag, bv):
+        self.name = name
+        self.ra = ra
+        self.dec = dec
+        self.vmag = vmag
+        self.bv = bv
+
+    def to_dict(self):
+        return {"name": self.name, "ra": str(self.ra), "dec": str(self.dec),
+                "vmag": str(self.vmag), "bv": str(self.bv)}
+
+
+def legacy(skyview):
+    from fastapi.responses import JSONResponse
+
+    skyview = {key: np.asarray(values).tolist() for key, values in skyview.items()}
+    star_list = [Star(skyview["name"][i], skyview["ra"][i], skyview["dec"][i],
+                      skyview["brightness"][i], skyview["bv"][i]) for i in range(len(skyview["name"]))]
+    return JSONResponse(content={"stars": [star.to_dict() for star in star_list]}).body
+
+
+def synthetic_skyview(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return {
+        "name": np.array(["Gaia DR2 {}".format(i) for i in rng.integers(10**17, 10**18, n)]),
+        "ra": rng.uniform(0, 360, n),
+        "dec": rng.uniform(-90, 90, n),
+        "brightness": rng.uniform(2, 18, n),
+        "bv": rng.uniform(-0.3, 2, n),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark skyview response encodings")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[3000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    formats = {
+        "legacy json": legacy,
+        "columnar json": encoding.encode_columnar_json,
+        "float32": encoding.encode_float32,
+    }
+    if encoding.pyarrow is not None:
+        formats["arrow"] = encoding.encode_arrow
+
+    print("{:>8} {:<14} {:>12} {:>10}".format("stars", "format", "bytes", "ms"))
+    for n in args.sizes:
+        skyview = synthetic_skyview(n)
+        for name, encode in formats.items():
+            times = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                body = encode(skyview)
+                times.append(time.perf_counter() - start)
+            print("{:>8} {:<14} {:>12} {:>10.2f}".format(n, name, len(body), min(times) * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import argparse
+import time
+
+import numpy as np
+
+import api.data_api as data_api
+from api import catalog, encoding
+from benchmark.fake_gaia import synthetic_catalog
+
+# Time-lapse frames (api/epoch.py) of one exoplanet view against one skyview per frame.
+# The batched path selects the stars once and propagates them to every epoch in one
+# array operation; the per-frame path computes a frame at a time, each with its own
+# catalog view and selection (what a client had to do with one request per epoch).
+# Encoding times and sizes are for the float32 and JSON frame formats.
+#     python -m benchmark.bench_frames --stars 200000 --n-stars 10000 --frames 10 100 1000
+
+
+def best_time(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark batched epoch propagation")
+    parser.add_argument("--stars", type=int, default=200000, help="synthetic catalog size")
+    parser.add_argument("--n-stars", type=int, default=10000, help="stars per frame")
+    parser.add_argument("--frames", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--years", type=float, default=100000, help="time span of the frames")
+    parser.add_argument("--per-frame-max", type=int, default=100, help="skip the per-frame path above this")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    columns = synthetic_catalog(args.stars)
+    catalog.install(catalog.Catalog(columns, catalog.heliocentric_xyz(columns["ra"], columns["dec"],
+                                                                      columns["parallax"])))
+    view = (90.0, -20.0, 12.0, 20.0, 10.0, 120.0, 90.0, args.n_stars)
+    print("{:>8} {:>8} {:>14} {:>14} {:>14} {:>12} {:>14} {:>12}".format(
+        "frames", "stars", "batched [ms]", "per frame [ms]", "float32 [ms]", "float32 [MB]", "JSON [ms]",
+        "JSON [MB]"))
+    for n_frames in args.frames:
+        years = np.linspace(0, args.years, n_frames)
+        batched, frames = best_time(lambda: data_api.get_frames_from_exoplanet(*view, years=years), args.repeat)
+        line = "{:>8} {:>8} {:>14.1f}".format(n_frames, len(frames["name"]), batched * 1000)
+        if n_frames <= args.per_frame_max:
+            per_frame, _ = best_time(lambda: [data_api.get_frames_from_exoplanet(*view, years=[t]) for t in years], 1)
+            line += " {:>14.1f}".format(per_frame * 1000)
+        else:
+            line += " {:>14}".format("-")
+        for media_type in (encoding.FLOAT32, encoding.JSON):
+            elapsed, response = best_time(lambda: encoding.frames_response(frames, media_type), 1)
+            line += " {:>14.1f} {:>12.2f}".format(elapsed * 1000, len(response.body) / 1e6)
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import argparse
+import time
+
+import numpy as np
+
+from api import lod
+from api.spatial_index import SkyIndex
+
+# Query latency of the in-process spatial index on a synthetic catalog.
+#     python -m benchmark.bench_index --stars 1000000
+
+
+def synthetic_catalog(n, seed=0):
+    rng = np.random.default_rng(seed)
+    g = rng.uniform(2, 20, n)
+    return {
+        "source_id": np.arange(n, dtype=np.int64),
+        "ra": rng.uniform(0, 360, n),
+        "dec": np.degrees(np.arcsin(rng.uniform(-1, 1, n))),
+        "parallax": rng.uniform(0.5, 50, n),
+        "phot_g_mean_mag": g,
+        "phot_bp_mean_mag": g + 0.3,
+        "phot_rp_mean_mag": g - 0.3,
+    }
+
+
+def time_query(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return np.median(times) * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark spatial index queries")
+    parser.add_argument("--stars", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    catalog = synthetic_catalog(args.stars)
+    start = time.perf_counter()
+    index = SkyIndex.build(catalog)
+    print("built index over {} stars in {:.0f} ms (n_side={})".format(
+        len(index), (time.perf_counter() - start) * 1000, index.n_side))
+
+    queries = {
+        "cone r=1":                 lambda: index.query_cone(120, 30, 1),
+        "cone r=5 mag<10":          lambda: index.query_cone(120, 30, 5, mag_max=10),
+        "cone r=5 mag<10 d<100pc":  lambda: index.query_cone(120, 30, 5, mag_max=10, distance_max=100),
+        "box 2x2 wrap":             lambda: index.query_box(359, 361, -1, 1),
+        "box 10x10 pole":           lambda: index.query_box(0, 10, 85, 95, mag_max=12),
+        "box 40x40 top 3000":       lambda: index.query_box(20, 60, -20, 20, n_stars=3000),
+        "box 40x40 top 3000 lod":   lambda: lod.query_index(index, 20, 60, -20, 20, 3000),
+        "all sky top 3000":         lambda: index.query_box(0, 360, -90, 90, n_stars=3000),
+        "all sky top 3000 lod":     lambda: lod.query_index(index, 0, 360, -90, 90, 3000),
+    }
+    for name, query in queries.items():
+        n = len(query()["ra"])
+        print("{:<26} {:>8} stars {:>9.3f} ms".format(name, n, time_query(query, args.repeat)))
+
+
+if __name__ == "__main__":
+    main()
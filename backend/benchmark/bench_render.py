@@ -0,0 +1,68 @@
+import argparse
+import time
+
+import numpy as np
+
+from api import render
+
+# Throughput of the sky image renderer (api/render.py) at several resolutions:
+# rasterizing the stars of one view, then encoding the image as PNG and WebP.
+#     python -m benchmark.bench_render --sizes 320x180 800x450 1920x1080 --stars 3000 20000
+
+
+def synthetic_view(n, seed=0):
+    """
+    Random stars around (ra, dec) = (20, 20) with a roughly realistic magnitude spread.
+    """
+    rng = np.random.default_rng(seed)
+    return {
+        "ra": rng.uniform(-20, 60, n),
+        "dec": rng.uniform(-10, 50, n),
+        "brightness": 12 - rng.exponential(2.0, n).clip(0, 13),
+        "bv": rng.uniform(-0.3, 2.0, n),
+    }
+
+
+def best_time(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark server-side sky rendering")
+    parser.add_argument("--sizes", nargs="+", default=["320x180", "800x450", "1920x1080"])
+    parser.add_argument("--stars", type=int, nargs="+", default=[3000, 20000])
+    parser.add_argument("--fov", type=float, default=60)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    formats = [("png", render.encode_png)]
+    if render.Image is not None:
+        formats.append(("webp", render.encode_webp))
+
+    header = "{:>10} {:>8} {:>15}".format("size", "stars", "rasterize [ms]")
+    for name, _ in formats:
+        header += " {:>10} {:>10}".format(name + " [ms]", name + " [kB]")
+    print(header + " {:>10}".format("images/s"))
+    for size in args.sizes:
+        width, height = (int(value) for value in size.split("x"))
+        for n in args.stars:
+            view = synthetic_view(n)
+            raster, pixels = best_time(lambda: render.rasterize(view["ra"], view["dec"], view["brightness"],
+                                                                view["bv"], 20, 20, args.fov, width, height),
+                                       args.repeat)
+            line = "{:>10} {:>8} {:>15.1f}".format(size, n, raster * 1000)
+            png_time = None
+            for name, encode in formats:
+                elapsed, data = best_time(lambda: encode(pixels), args.repeat)
+                png_time = elapsed if png_time is None else png_time
+                line += " {:>10.1f} {:>10.1f}".format(elapsed * 1000, len(data) / 1000)
+            print(line + " {:>10.1f}".format(1 / (raster + png_time)))
+
+
+if __name__ == "__main__":
+    main()
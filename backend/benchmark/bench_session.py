@@ -0,0 +1,64 @@
+import argparse
+import json
+import time
+
+import api.data_api as data_api
+from api import catalog, encoding
+from api.session import Camera, ViewSession, clear_catalog_views
+from benchmark.fake_gaia import synthetic_catalog
+
+# Panning cost of a viewing session (api/session.py) against stateless skyview requests.
+# A camera pans in small steps across the sky of an exoplanet that is not in
+# Exoplanet.csv (cartesian view over a synthetic catalog). Per pan, the stateless path
+# computes the skyview and encodes every star (default and columnar JSON), the session
+# computes the same skyview and encodes only the stars entering and leaving the view.
+#     python -m benchmark.bench_session --stars 200000 --n-stars 3000 --step 2
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark viewing session deltas against full skyviews")
+    parser.add_argument("--stars", type=int, default=200000, help="synthetic catalog size")
+    parser.add_argument("--n-stars", type=int, default=3000, help="stars per view")
+    parser.add_argument("--fov", type=float, default=60)
+    parser.add_argument("--step", type=float, nargs="+", default=[0.5, 2, 10], help="pan step in degrees")
+    parser.add_argument("--pans", type=int, default=30)
+    args = parser.parse_args(argv)
+
+    columns = synthetic_catalog(args.stars)
+    catalog.install(catalog.Catalog(columns, catalog.heliocentric_xyz(columns["ra"], columns["dec"],
+                                                                      columns["parallax"])))
+    planet = (90.0, -20.0, 12.0)
+    print("{:>8} {:>12} {:>12} {:>12} {:>12} {:>12} {:>12}".format(
+        "step", "full [ms]", "JSON [kB]", "cols [kB]", "delta [ms]", "delta [kB]", "entering"))
+    for step in args.step:
+        cameras = [(20 + i * step, 10) for i in range(args.pans + 1)]
+
+        start = time.perf_counter()
+        full_json = full_columnar = 0
+        for ra, dec in cameras[1:]:
+            skyview = data_api.get_skyview_from_exoplanet(*planet, ra, dec, args.fov, args.fov, args.n_stars,
+                                                          mode="cartesian")
+            full_json += len(encoding.skyview_response(skyview, encoding.JSON).body)
+            full_columnar += len(encoding.encode_columnar_json(skyview))
+        full_time = time.perf_counter() - start
+
+        clear_catalog_views()
+        session = ViewSession(*planet)
+        session.update(Camera(*cameras[0], args.fov, args.fov, args.n_stars))
+        start = time.perf_counter()
+        delta_bytes = entering = 0
+        for ra, dec in cameras[1:]:
+            reply = session.update(Camera(ra, dec, args.fov, args.fov, args.n_stars))
+            delta_bytes += len(json.dumps(reply, separators=(",", ":")))
+            entering += reply["enter"]["count"]
+        delta_time = time.perf_counter() - start
+
+        pans = args.pans
+        print("{:>8g} {:>12.2f} {:>12.1f} {:>12.1f} {:>12.2f} {:>12.1f} {:>12.0f}".format(
+            step, full_time / pans * 1000, full_json / pans / 1000, full_columnar / pans / 1000,
+            delta_time / pans * 1000, delta_bytes / pans / 1000, entering / pans))
+    catalog.reset()
+
+
+if __name__ == "__main__":
+    main()
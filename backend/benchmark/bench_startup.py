@@ -0,0 +1,54 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Cold start of a backend worker: time to import main.py, to run the app startup
+# (lifespan) and to answer the first and second /exoplanet/all requests. Every run is a
+# fresh interpreter, like a newly scheduled worker.
+#     python -m benchmark.bench_startup --runs 5
+#     python -m benchmark.bench_startup --runs 5 --test-routes
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(main.app) as client:
+    started = time.perf_counter()
+    client.get("/api/v1/exoplanet/all")
+    first = time.perf_counter()
+    client.get("/api/v1/exoplanet/all")
+    second = time.perf_counter()
+heavy = [name for name in ("astropy", "astroquery", "matplotlib", "pandas") if name in sys.modules]
+print(json.dumps({"import": imported - start, "startup": started - imported,
+                  "first request": first - started, "second request": second - first, "heavy": heavy}))
+"""
+
+
+def run_once(test_routes):
+    env = dict(os.environ, EXOSKY_ENABLE_TEST_ROUTES="1" if test_routes else "0")
+    output = subprocess.run([sys.executable, "-c", CHILD], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark worker cold start")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--test-routes", action="store_true", help="also mount the test router")
+    args = parser.parse_args(argv)
+
+    runs = [run_once(args.test_routes) for _ in range(args.runs)]
+    for name in ("import", "startup", "first request", "second request"):
+        print("{:<15} {:>9.1f} ms".format(name, statistics.median(run[name] for run in runs) * 1000))
+    print("heavy modules loaded: {}".format(", ".join(runs[-1]["heavy"]) or "none"))
+
+
+if __name__ == "__main__":
+    main()
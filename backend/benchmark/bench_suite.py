@@ -0,0 +1,254 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import threading
+import time
+
+import httpx
+import numpy as np
+import uvicorn
+
+import api.data_api as data_api
+import api.star as star
+from api import catalog, config, planet_sky, tile_cache
+from benchmark.fake_gaia import FakeGaiaArchive, synthetic_catalog
+from main import app
+
+# Reproducible benchmark suite.
+# For every catalog size a local Gaia TAP stand-in (benchmark/fake_gaia.py) serves a
+# synthetic catalog, the app runs in-process against it with an empty tile cache and
+# the skyview result cache off, and seeded random requests measure throughput and
+# p50/p99 latency of both skyview endpoints (first pass with archive queries, then
+# warm) and of /exoplanet/all. The coordinate transforms are timed directly.
+# Results are written as JSON; --compare reports the change against an earlier run
+# and exits with 1 when a p50 got slower than --tolerance allows.
+#     python -m benchmark.bench_suite --stars 1000 100000 1000000 --out results.json
+#     python -m benchmark.bench_suite --compare results.json
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True, cwd=config.BACKEND_DIR).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                               text=True, cwd=config.BACKEND_DIR).stdout.strip() != ""
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def summary(name, stars, latencies, elapsed, **extra):
+    latencies = np.asarray(latencies) * 1000
+    result = {
+        "name": name,
+        "stars": stars,
+        "requests": len(latencies),
+        "throughput": len(latencies) / elapsed if elapsed > 0 else None,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "mean_ms": float(np.mean(latencies)),
+    }
+    result.update(extra)
+    return result
+
+
+def exoplanet_views(rng, n):
+    return [{"ex_ra": float(rng.uniform(0, 360)), "ex_dec": float(rng.uniform(-80, 80)),
+             "ex_distance": float(rng.uniform(1, 500)), "ra": float(rng.uniform(0, 360)),
+             "dec": float(rng.uniform(-60, 60))} for _ in range(n)]
+
+
+def earth_views(rng, n):
+    return [{"ra": float(rng.uniform(0, 360)), "dec": float(rng.uniform(-60, 60))} for _ in range(n)]
+
+
+async def run_requests(base_url, requests, concurrency):
+    """
+    Send (method, path, json) requests with at most `concurrency` in flight.
+    Returns the latency of each request and the wall time of the run.
+    """
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=300) as client:
+
+        async def send(method, path, body):
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.request(method, path, json=body)
+                latencies.append(time.perf_counter() - start)
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*[send(*request) for request in requests])
+        return latencies, time.perf_counter() - start
+
+
+def reset_caches(cache_dir):
+    config.TILE_CACHE_DIR = cache_dir
+    tile_cache.clear_memory()
+    tile_cache.reset_stats()
+    catalog.reset()
+    planet_sky.invalidate()
+    star.skyview_cache.clear()
+
+
+def bench_endpoints(base_url, archive, stars, args):
+    rng = np.random.default_rng(args.seed)
+    results = []
+    for name, path, views in (
+            ("skyview_exoplanet", "/api/v1/star/skyview/exoplanet/", exoplanet_views(rng, args.requests)),
+            ("skyview_earth", "/api/v1/star/skyview/earth/", earth_views(rng, args.requests))):
+        with tempfile.TemporaryDirectory(prefix="exosky-bench-") as cache_dir:
+            reset_caches(cache_dir)
+            requests = [("POST", path, view) for view in views]
+            queries = archive.queries
+            latencies, elapsed = asyncio.run(run_requests(base_url, requests, args.concurrency))
+            results.append(summary(name + "_cold", stars, latencies, elapsed,
+                                   archive_queries=archive.queries - queries))
+            latencies, elapsed = asyncio.run(run_requests(base_url, requests, args.concurrency))
+            results.append(summary(name + "_warm", stars, latencies, elapsed))
+
+    requests = [("GET", "/api/v1/exoplanet/all", None)] * args.requests
+    latencies, elapsed = asyncio.run(run_requests(base_url, requests, args.concurrency))
+    results.append(summary("exoplanet_all", stars, latencies, elapsed))
+    return results
+
+
+def time_calls(func, repeat):
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def bench_transforms(stars, columns, repeat):
+    ra, dec = columns["ra"], columns["dec"]
+    distance = 1000 / columns["parallax"]
+    cartesian = catalog.Catalog(columns, catalog.heliocentric_xyz(ra, dec, columns["parallax"]))
+    position = data_api.ra_dec_to_xyz(90.0, -20.0, 12.0)
+    calls = {
+        "ra_dec_to_xyz": lambda: data_api.ra_dec_to_xyz(ra, dec, distance),
+        "exoplanet_view": lambda: data_api.exoplanet_view(90.0, -20.0, 12.0, 20.0, 20.0, ra, dec, distance),
+        "bv_color_index": lambda: data_api.bv_color_index(columns["phot_bp_mean_mag"], columns["phot_rp_mean_mag"]),
+        "catalog_view_from": lambda: cartesian.view_from(position),
+    }
+    results = []
+    for name, call in calls.items():
+        latencies = time_calls(call, repeat)
+        results.append(summary("transform_" + name, stars, latencies, sum(latencies)))
+    return results
+
+
+def run_suite(args):
+    settings = {name: getattr(config, name) for name in ("GAIA_TAP_URL", "TILE_CACHE_DIR", "SKYVIEW_CACHE_TTL",
+                                                         "SKYVIEW_MAX_PENDING")}
+    config.SKYVIEW_CACHE_TTL = 0
+    # the result cache was created on import
+    cache_ttl, star.skyview_cache.ttl = star.skyview_cache.ttl, 0
+    config.SKYVIEW_MAX_PENDING = max(config.SKYVIEW_MAX_PENDING, args.concurrency)
+    server = uvicorn.Server(uvicorn.Config(app, port=args.port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+
+    base_url = "http://127.0.0.1:{}".format(args.port)
+    results = []
+    try:
+        for stars in args.stars:
+            columns = synthetic_catalog(stars, args.seed)
+            with FakeGaiaArchive(columns, latency=args.latency) as archive:
+                config.GAIA_TAP_URL = archive.url
+                results += bench_endpoints(base_url, archive, stars, args)
+            results += bench_transforms(stars, columns, args.repeat)
+    finally:
+        server.should_exit = True
+        thread.join()
+        for name, value in settings.items():
+            setattr(config, name, value)
+        star.skyview_cache.ttl = cache_ttl
+        reset_caches(config.TILE_CACHE_DIR)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Print the p50 change of every result also found in the baseline.
+    Returns the names of the results that got slower than the tolerance.
+    """
+    previous = {(result["name"], result["stars"]): result for result in baseline["results"]}
+    regressions = []
+    print("{:<32} {:>9} {:>12} {:>12} {:>8}".format("benchmark", "stars", "before [ms]", "after [ms]", "ratio"))
+    for result in results:
+        before = previous.get((result["name"], result["stars"]))
+        if before is None:
+            continue
+        ratio = result["p50_ms"] / before["p50_ms"] if before["p50_ms"] > 0 else float("inf")
+        flag = " <-" if ratio > tolerance else ""
+        print("{:<32} {:>9} {:>12.2f} {:>12.2f} {:>7.2f}x{}".format(
+            result["name"], result["stars"], before["p50_ms"], result["p50_ms"], ratio, flag))
+        if ratio > tolerance:
+            regressions.append("{} ({} stars)".format(result["name"], result["stars"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the API against a local Gaia archive stand-in")
+    parser.add_argument("--stars", type=int, nargs="+", default=[1000, 100000], help="synthetic catalog sizes")
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=20, help="calls per transform")
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated archive latency in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--out", help="result file (default benchmark/results/<commit>.json)")
+    parser.add_argument("--compare", help="earlier result file to compare with")
+    parser.add_argument("--tolerance", type=float, default=1.2, help="largest accepted p50 ratio")
+    args = parser.parse_args(argv)
+
+    commit, dirty = git_commit()
+    results = run_suite(args)
+    report = {
+        "commit": commit,
+        "dirty": dirty,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "args": {name: getattr(args, name) for name in ("stars", "requests", "concurrency", "repeat", "latency",
+                                                        "seed")},
+        "results": results,
+    }
+
+    print("{:<32} {:>9} {:>10} {:>10} {:>10}".format("benchmark", "stars", "req/s", "p50 [ms]", "p99 [ms]"))
+    for result in results:
+        print("{:<32} {:>9} {:>10.1f} {:>10.2f} {:>10.2f}".format(
+            result["name"], result["stars"], result["throughput"], result["p50_ms"], result["p99_ms"]))
+
+    out = args.out or os.path.join(RESULTS_DIR, "{}.json".format(commit or "results"))
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print("Results written to", out)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("Slower than {}x: {}".format(args.tolerance, ", ".join(regressions)))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
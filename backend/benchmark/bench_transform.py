@@ -0,0 +1,64 @@
+import argparse
+import math
+import time
+
+import numpy as np
+
+import api.data_api as data_api
+
+# Micro-benchmark of the per-star transform in get_skyview_from_exoplanet:
+# the former scalar loop against the vectorized exoplanet_view/bv_color_index path.
+#     python -m benchmark.bench_transform --sizes 3000 30000 300000
+
+
+def legacy_loop(ex_ra, ex_dec, ex_distance, ra, dec, ra_values, dec_values, distance, bp_mag, rp_mag):
+    ra_values = ra_values.copy()
+    dec_values = dec_values.copy()
+    distance = distance.copy()
+    ra_mean = np.mean(ra_values)
+    dec_mean = np.mean(dec_values)
+    bv_colors = []
+    for i in range(len(ra_values)):
+        x, y, z = data_api.get_relative_pos(ex_ra, ex_dec, ex_distance, ra_values[i], dec_values[i], distance[i])
+        distance[i] = math.sqrt(x**2 + y**2 + z**2)
+        ra_values[i] = ra + ra_values[i] - ra_mean
+        dec_values[i] = dec + dec_values[i] - dec_mean
+        bv_colors.append(0.751 * (bp_mag[i] - rp_mag[i]))
+    return ra_values, dec_values, distance, bv_colors
+
+
+def vectorized(ex_ra, ex_dec, ex_distance, ra, dec, ra_values, dec_values, distance, bp_mag, rp_mag):
+    ra_values, dec_values, distance = data_api.exoplanet_view(ex_ra, ex_dec, ex_distance, ra, dec,
+                                                              ra_values, dec_values, distance)
+    return ra_values, dec_values, distance, data_api.bv_color_index(bp_mag, rp_mag)
+
+
+def best_time(func, args, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the exoplanet view transform")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[3000, 30000, 300000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    print("{:>8} {:>12} {:>12} {:>9}".format("stars", "loop [ms]", "numpy [ms]", "speedup"))
+    for n in args.sizes:
+        bp = rng.uniform(5, 15, n)
+        star_args = (90.0, -20.0, 12.0, 20.0, 20.0,
+                     rng.uniform(0, 360, n), rng.uniform(-90, 90, n), rng.uniform(5, 500, n),
+                     bp, bp - rng.uniform(-0.3, 2.5, n))
+        loop = best_time(legacy_loop, star_args, 1 if n > 30000 else args.repeat)
+        vec = best_time(vectorized, star_args, args.repeat)
+        print("{:>8} {:>12.2f} {:>12.3f} {:>8.0f}x".format(n, loop * 1000, vec * 1000, loop / vec))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import numpy as np
+
+from api import config
+from benchmark.bench_suite import exoplanet_views, run_requests, summary
+from benchmark.fake_gaia import FakeGaiaArchive, synthetic_catalog
+
+# Scaling of serve.py across worker processes.
+# Starts serve.py with 1, 2, 4 and 8 workers against a local Gaia stand-in (the tile
+# cache is filled once beforehand), with and without the shared memory star data, and
+# measures skyview throughput, p50/p99 latency and the memory of the process tree.
+# Memory is the proportional set size (Linux /proc/<pid>/smaps_rollup), which splits
+# shared pages between the processes mapping them, so it adds up to the real total.
+#     python -m benchmark.bench_workers --workers 1 2 4 8 --stars 200000 --mode cartesian
+
+
+def children(pid):
+    try:
+        with open("/proc/{}/task/{}/children".format(pid, pid)) as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+def pss_mb(pid):
+    """
+    Proportional set size of a process and its descendants in MB (None if unavailable).
+    """
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        pending += children(current)
+        try:
+            with open("/proc/{}/smaps_rollup".format(current)) as f:
+                for line in f:
+                    if line.startswith("Pss:"):
+                        total += int(line.split()[1])
+        except OSError:
+            if current == pid:
+                return None
+    return total / 1024
+
+
+def wait_ready(base_url, process, timeout=600):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("serve.py exited with {}".format(process.returncode))
+        try:
+            if httpx.get(base_url + "/api/v1/exoplanet/all", timeout=5).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("serve.py did not start within {} s".format(timeout))
+
+
+def run_server(env, workers, port, requests, concurrency):
+    base_url = "http://127.0.0.1:{}".format(port)
+    process = subprocess.Popen([sys.executable, "serve.py", "--port", str(port), "--workers", str(workers)],
+                               cwd=config.BACKEND_DIR, env=env, stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL)
+    try:
+        wait_ready(base_url, process)
+        # one request per worker so every worker has loaded its data before measuring
+        asyncio.run(run_requests(base_url, requests[:workers * 2], workers))
+        latencies, elapsed = asyncio.run(run_requests(base_url, requests, concurrency))
+        return latencies, elapsed, pss_mb(process.pid)
+    finally:
+        process.terminate()
+        try:
+            process.wait(30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark serve.py across worker counts")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--stars", type=int, default=200000, help="synthetic catalog size")
+    parser.add_argument("--mode", default="cartesian", choices=config.SKYVIEW_MODES)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--port", type=int, default=8767)
+    parser.add_argument("--out", help="write the results as JSON")
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    requests = [("POST", "/api/v1/star/skyview/exoplanet/", view)
+                for view in exoplanet_views(rng, args.requests)]
+    results = []
+    with FakeGaiaArchive(synthetic_catalog(args.stars, args.seed)) as archive, \
+            tempfile.TemporaryDirectory(prefix="exosky-bench-") as cache_dir:
+        env = dict(os.environ, EXOSKY_GAIA_TAP_URL=archive.url, EXOSKY_TILE_CACHE_DIR=cache_dir,
+                   EXOSKY_SKYVIEW_MODE=args.mode, EXOSKY_SKYVIEW_CACHE_TTL="0",
+                   EXOSKY_SKYVIEW_MAX_PENDING=str(max(64, args.concurrency)), EXOSKY_ARCHIVE_DEADLINE="0")
+        # fill the tile cache once (waiting for the archive), so every run starts from the same disk cache
+        run_server(dict(env, EXOSKY_SHARED_MEMORY="0"), 1, args.port, requests[:10], 1)
+
+        print("{:>8} {:>8} {:>10} {:>10} {:>10} {:>10}".format(
+            "workers", "shared", "req/s", "p50 [ms]", "p99 [ms]", "PSS [MB]"))
+        for workers in args.workers:
+            for shared in ((False, True) if workers > 1 else (False,)):
+                run_env = dict(env, EXOSKY_SHARED_MEMORY="1" if shared else "0")
+                latencies, elapsed, memory = run_server(run_env, workers, args.port, requests, args.concurrency)
+                result = summary("skyview_exoplanet_" + args.mode, args.stars, latencies, elapsed,
+                                 workers=workers, shared=shared, pss_mb=memory)
+                results.append(result)
+                print("{:>8} {:>8} {:>10.1f} {:>10.2f} {:>10.2f} {:>10}".format(
+                    workers, "yes" if shared else "no", result["throughput"], result["p50_ms"],
+                    result["p99_ms"], "-" if memory is None else "{:.0f}".format(memory)))
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"cpus": os.cpu_count(), "args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+import argparse
+import gzip
+import io
+import re
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+# Local stand-in for the Gaia TAP service.
+# Answers the synchronous ADQL queries of api/archive.py (TOP n stars of an
+# RA/Dec box above a parallax floor, brightest first) from an in-memory synthetic
+# catalog, as a VOTable like the ESA archive. Point the backend to it with
+# EXOSKY_GAIA_TAP_URL=http://127.0.0.1:<port>/ to run benchmarks without network access.
+#     python -m benchmark.fake_gaia --stars 1000000 --port 8790 --latency 0.05
+
+SYNC_PATH = "/tap-server/tap/sync"
+
+_NUMBER = r"(-?[0-9.eE+-]+)"
+_PATTERNS = {
+    "top": re.compile(r"\bTOP\s+(\d+)", re.I),
+    "parallax_min": re.compile(r"\bparallax\s*>\s*" + _NUMBER, re.I),
+    "ra_min": re.compile(r"\bra\s*>=\s*" + _NUMBER, re.I),
+    "ra_max": re.compile(r"\bra\s*<\s*" + _NUMBER, re.I),
+    "dec_min": re.compile(r"\bdec\s*>=\s*" + _NUMBER, re.I),
+    "dec_max": re.compile(r"\bdec\s*<\s*" + _NUMBER, re.I),
+}
+
+
+def synthetic_catalog(n, seed=0, parallax_min=0.5, sort=True):
+    """
+    Random Gaia-like star columns spread uniformly over the sky, sorted by G magnitude
+    unless sort is False. Parallaxes are uniform between parallax_min and 50 mas.
+    """
+    rng = np.random.default_rng(seed)
+    source_id = np.arange(1, n + 1, dtype=np.int64) * 1000 + seed
+    g = rng.uniform(2, 18, n)
+    bp_rp = rng.uniform(-0.3, 2.5, n)
+    columns = {
+        "source_id": source_id,
+        "DESIGNATION": np.char.add("Gaia DR2 ", source_id.astype(str)),
+        "ra": rng.uniform(0, 360, n),
+        "dec": np.degrees(np.arcsin(rng.uniform(-1, 1, n))),
+        "parallax": rng.uniform(parallax_min, 50, n),
+        "phot_g_mean_mag": g,
+        "phot_bp_mean_mag": g + bp_rp / 2,
+        "phot_rp_mean_mag": g - bp_rp / 2,
+        "pmra": rng.normal(0, 20, n),
+        "pmdec": rng.normal(0, 20, n),
+        "radial_velocity": np.where(rng.uniform(0, 1, n) < 0.3, rng.normal(0, 30, n), np.nan),
+    }
+    if not sort:
+        return columns
+    order = np.argsort(g, kind="stable")
+    return {name: values[order] for name, values in columns.items()}
+
+
+def parse_query(query):
+    """
+    The TOP count and the box bounds of a tile query (None for missing conditions).
+    """
+    fields = {}
+    for name, pattern in _PATTERNS.items():
+        match = pattern.search(query)
+        fields[name] = float(match.group(1)) if match else None
+    return fields
+
+
+def select(columns, query):
+    """
+    Rows of the catalog answering a tile query, brightest first.
+    """
+    fields = parse_query(query)
+    mask = np.ones(len(columns["ra"]), dtype=bool)
+    for name, column, above in (("parallax_min", "parallax", None), ("ra_min", "ra", True),
+                                ("ra_max", "ra", False), ("dec_min", "dec", True), ("dec_max", "dec", False)):
+        value = fields[name]
+        if value is None:
+            continue
+        if above is None:
+            mask &= columns[column] > value
+        elif above:
+            mask &= columns[column] >= value
+        else:
+            mask &= columns[column] < value
+    index = np.flatnonzero(mask)
+    if fields["top"] is not None:
+        index = index[:int(fields["top"])]
+    return {name: values[index] for name, values in columns.items()}
+
+
+def votable_bytes(columns):
+    from astropy.io.votable import from_table
+    from astropy.table import Table
+
+    table = Table({name: values for name, values in columns.items()})
+    buffer = io.BytesIO()
+    from_table(table).to_xml(buffer)
+    return buffer.getvalue()
+
+
+class FakeGaiaArchive:
+    """
+    Threaded HTTP server answering tile queries from `columns`.
+    Args:
+        columns: catalog as a dictionary of arrays (see synthetic_catalog)
+        latency: seconds added to every query, a simulated archive round trip
+        port: port to listen on (0 picks a free one)
+    Setting `failures` to n answers the next n queries with 503 Service Unavailable.
+    """
+
+    def __init__(self, columns, latency=0.0, host="127.0.0.1", port=0):
+        self.columns = columns
+        self.latency = latency
+        self.queries = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return "http://{}:{}/".format(host, port)
+
+    def _handler(self):
+        archive = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path.split("?")[0] != SYNC_PATH:
+                    self.send_error(404)
+                    return
+                length = int(self.headers.get("Content-Length", 0))
+                form = urllib.parse.parse_qs(self.rfile.read(length).decode("utf-8"))
+                query = form.get("QUERY", [""])[0]
+                with archive._lock:
+                    archive.queries += 1
+                    fail = archive.failures > 0
+                    archive.failures -= fail
+                if fail:
+                    self.send_error(503)
+                    return
+                if archive.latency:
+                    time.sleep(archive.latency)
+                body = votable_bytes(select(archive.columns, query))
+                if form.get("FORMAT", ["votable"])[0].endswith("_gzip"):
+                    body = gzip.compress(body, compresslevel=1)
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-votable+xml")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a synthetic catalog as a local Gaia TAP service")
+    parser.add_argument("--stars", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every query")
+    parser.add_argument("--port", type=int, default=8790)
+    args = parser.parse_args(argv)
+
+    archive = FakeGaiaArchive(synthetic_catalog(args.stars, args.seed), args.latency, port=args.port)
+    print("Serving {} stars, use EXOSKY_GAIA_TAP_URL={}".format(args.stars, archive.url))
+    try:
+        archive.server.serve_forever()
+    except KeyboardInterrupt:
+        archive.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
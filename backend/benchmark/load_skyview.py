@@ -0,0 +1,79 @@
+import argparse
+import asyncio
+import statistics
+import threading
+import time
+
+import httpx
+import uvicorn
+
+import api.star as star
+from api import config
+from main import app
+
+# Load test of the star router with a simulated slow archive.
+# Runs the app in-process, replaces the skyview function by one that waits
+# --latency seconds (an archive round trip), fires --concurrency skyview requests at
+# once and measures how long they take together and how fast /exoplanet/all answers
+# meanwhile. It runs once with skyviews on the event loop (EXOSKY_SKYVIEW_WORKERS=0,
+# the former behaviour) and once on the bounded executor.
+#     python -m benchmark.load_skyview --concurrency 16 --latency 0.2
+
+
+def simulated_skyview(latency):
+    def skyview(*args, **kwargs):
+        time.sleep(latency)
+        return {"name": ["Gaia DR2 1"] * 100, "ra": [1.0] * 100, "dec": [2.0] * 100,
+                "brightness": [3.0] * 100, "bv": [0.5] * 100}
+    return skyview
+
+
+async def run_load(base_url, concurrency):
+    view = {"ex_ra": 90, "ex_dec": -20, "ex_distance": 0.9, "ra": 20, "dec": 20}
+    limits = httpx.Limits(max_connections=concurrency + 8)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+        list_latency = []
+
+        async def list_exoplanets():
+            await asyncio.sleep(0.01)
+            start = time.perf_counter()
+            await client.get("/api/v1/exoplanet/all")
+            list_latency.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*[client.post("/api/v1/star/skyview/exoplanet/", json=view)
+                               for _ in range(concurrency)],
+                             *[list_exoplanets() for _ in range(4)])
+        elapsed = time.perf_counter() - start
+    return concurrency / elapsed, statistics.median(list_latency)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the skyview endpoints")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.2, help="simulated archive latency in seconds")
+    parser.add_argument("--workers", type=int, default=8, help="skyview executor threads")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args(argv)
+
+    star.get_skyview_from_exoplanet = simulated_skyview(args.latency)
+    config.SKYVIEW_MAX_PENDING = max(config.SKYVIEW_MAX_PENDING, args.concurrency)
+    server = uvicorn.Server(uvicorn.Config(app, port=args.port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+
+    try:
+        print("{:<18} {:>16} {:>24}".format("mode", "skyviews/s", "/exoplanet/all p50 [ms]"))
+        for name, workers in (("event loop", 0), ("executor", args.workers)):
+            config.SKYVIEW_WORKERS = workers
+            throughput, list_p50 = asyncio.run(run_load("http://127.0.0.1:{}".format(args.port), args.concurrency))
+            print("{:<18} {:>16.1f} {:>24.1f}".format(name, throughput, list_p50 * 1000))
+    finally:
+        server.should_exit = True
+        thread.join()
+
+
+if __name__ == "__main__":
+    main()
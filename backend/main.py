@@ -1,28 +1,61 @@
-import os
-from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-from api import router as api_router
-from test import router as test_router
-from fastapi.middleware.cors import CORSMiddleware
-
-app = FastAPI()
-
-# Local frontend server
-origins = [
-    "http://localhost:3000",
-]
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-static_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
-app.mount("/static", StaticFiles(directory=static_directory), name="static")
-
-app.include_router(api_router, prefix="/api/v1")
-app.include_router(test_router, prefix="/api/v1")
\ No newline at end of file
+import os
+import threading
+from contextlib import asynccontextmanager
+from fastapi import FastAPI
+from fastapi.staticfiles import StaticFiles
+from fastapi.responses import FileResponse, JSONResponse
+from api import router as api_router
+from fastapi.middleware.cors import CORSMiddleware
+from api import archive, catalog, config, executor, exoplanet, planet_sky, shared_memory
+from api.compression import CompressionMiddleware
+from api.metrics import MetricsMiddleware
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # workers started by serve.py read the star data from the parent's shared memory
+    shared_memory.attach()
+    exoplanet.load_exoplanets()
+    # Start building the star catalog if the tile cache does not hold the whole sky yet
+    if config.CATALOG_PRELOAD:
+        catalog.preload()
+    # Build the precomputed exoplanet skies in the background
+    if config.PLANET_SKY_WARM:
+        threading.Thread(target=planet_sky.warm, daemon=True).start()
+    yield
+    executor.shutdown()
+    archive.close_clients()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+@app.exception_handler(catalog.CatalogLoading)
+async def catalog_loading(request, error):
+    return JSONResponse(status_code=503, content={"detail": "Star catalog is loading, try again later"},
+                        headers={"Retry-After": "10"})
+
+# Local frontend server
+origins = [
+    "http://localhost:3000",
+]
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(MetricsMiddleware)
+
+static_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+app.mount("/static", StaticFiles(directory=static_directory), name="static")
+
+app.include_router(api_router, prefix="/api/v1")
+
+if config.ENABLE_TEST_ROUTES:
+    # the test routes plot with matplotlib, keep them out of production imports
+    from test import router as test_router
+    app.include_router(test_router, prefix="/api/v1")
@@ -0,0 +1,37 @@
+import argparse
+import os
+
+import uvicorn
+
+from api import config, shared_memory
+
+# Production entry point.
+#     python3 serve.py --host 0.0.0.0 --port 80 --workers 4
+# With one worker this is plain uvicorn. With more, the star data is loaded once here
+# and shared with every worker through a shared memory segment (EXOSKY_SHARED_MEMORY=0
+# turns that off and lets each worker load its own copy), see api/shared_memory.py.
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the Exosky backend")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=config.WORKERS)
+    args = parser.parse_args(argv)
+
+    shared = None
+    if args.workers > 1 and config.SHARED_MEMORY:
+        shared = shared_memory.publish()
+        # read by the workers' config on import
+        os.environ["EXOSKY_SHARED_MEMORY_NAME"] = shared.name
+        print("Shared star data: {:.1f} MB in {}".format(shared.size / 1e6, shared.name))
+    try:
+        uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers)
+    finally:
+        if shared is not None:
+            shared.close()
+            shared.unlink()
+
+
+if __name__ == "__main__":
+    main()
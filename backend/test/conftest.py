@@ -0,0 +1,113 @@
+import numpy as np
+import pytest
+
+from api import archive, catalog, config, star_store, tile_cache
+from benchmark.fake_gaia import FakeGaiaArchive, synthetic_catalog
+
+
+def synthetic_stars(n, seed=0):
+    """
+    Unsorted synthetic catalog with parallaxes from 1.5 mas, see
+    benchmark.fake_gaia.synthetic_catalog.
+    """
+    return synthetic_catalog(n, seed, parallax_min=1.5, sort=False)
+
+
+@pytest.fixture(autouse=True)
+def no_bright_stars(monkeypatch):
+    """
+    Keep the bright star tier out of the synthetic skies, tests of the tier turn it back on.
+    """
+    monkeypatch.setattr(config, "BRIGHT_STARS", False)
+
+
+@pytest.fixture(autouse=True)
+def data_api_archive(request, monkeypatch):
+    """
+    Answer the archive queries of test_data_api.py from a local Gaia stand-in. That module
+    is also imported by the test router of the app, so its fixtures live here.
+    """
+    if request.module.__name__.rpartition(".")[2] != "test_data_api":
+        yield None
+        return
+    request.getfixturevalue("tile_cache_dir")
+    with FakeGaiaArchive(synthetic_catalog(20000)) as fake:
+        monkeypatch.setattr(config, "GAIA_TAP_URL", fake.url)
+        yield fake
+        archive.close_clients()
+
+
+@pytest.fixture
+def make_stars():
+    return synthetic_stars
+
+
+@pytest.fixture
+def archive_calls(monkeypatch):
+    """
+    Stub out the Gaia archive. Returns the list of tiles that were requested.
+    """
+    calls = []
+
+    def fetch_tile(key, size=None, floor=None):
+        calls.append(key)
+        raise AssertionError("unexpected archive query for tile {}".format(key))
+
+    monkeypatch.setattr(tile_cache, "fetch_tile", fetch_tile)
+    return calls
+
+
+@pytest.fixture
+def tile_cache_dir(tmp_path, monkeypatch):
+    """
+    Point the tile cache to an empty temporary directory.
+    """
+    monkeypatch.setattr(config, "TILE_CACHE_DIR", str(tmp_path / "tiles"))
+    tile_cache.clear_memory()
+    tile_cache.reset_stats()
+    yield tmp_path / "tiles"
+    tile_cache.clear_memory()
+
+
+@pytest.fixture
+def seeded_tile_cache(tile_cache_dir, make_stars, monkeypatch):
+    """
+    Fill every tile of the cache with synthetic stars, in the default layout and in a
+    coarse level of detail layout.
+    Returns the full synthetic catalog.
+    """
+    stars = make_stars(20000)
+    monkeypatch.setattr(config, "LOD_TILE_SIZES", (90.0, config.TILE_SIZE_DEG))
+    for size in config.LOD_TILE_SIZES:
+        keys = np.array([tile_cache.tile_key(ra, dec, size) for ra, dec in zip(stars["ra"], stars["dec"])])
+        n_ra = int(np.ceil(360 / size))
+        n_dec = int(np.ceil(180 / size))
+        for i in range(n_ra):
+            for j in range(n_dec):
+                index = np.flatnonzero((keys[:, 0] == i) & (keys[:, 1] == j))
+                index = index[np.argsort(stars["phot_g_mean_mag"][index])[:config.TILE_STAR_LIMIT]]
+                tile_cache.store_tile((i, j), tile_cache.take_columns(stars, index), size)
+    tile_cache.clear_memory()
+    tile_cache.reset_stats()
+    return stars
+
+
+@pytest.fixture
+def store_dir(tmp_path, make_stars, monkeypatch):
+    """
+    Ingest a synthetic CSV extract and switch data_api to the star store backend.
+    """
+    stars = make_stars(5000, seed=3)
+    path = tmp_path / "extract.csv"
+    with open(path, "w") as f:
+        f.write(",".join(star_store.COLUMNS) + "\n")
+        for i in range(len(stars["ra"])):
+            f.write(",".join(str(stars[name][i]) for name in star_store.COLUMNS) + "\n")
+
+    out = tmp_path / "store"
+    star_store.main(["ingest", str(path), "--out", str(out)])
+    monkeypatch.setattr(config, "STAR_BACKEND", "store")
+    monkeypatch.setattr(config, "STAR_STORE_DIR", str(out))
+    catalog.reset()
+    yield out, stars
+    catalog.reset()
@@ -0,0 +1,131 @@
+import os
+
+import numpy as np
+import pytest
+
+from api import archive, config, tile_cache
+from benchmark.fake_gaia import FakeGaiaArchive, select, synthetic_catalog
+
+
+@pytest.fixture
+def fake_archive(tile_cache_dir, monkeypatch):
+    """
+    A local Gaia stand-in behind a fresh archive client without rate limit or backoff.
+    """
+    monkeypatch.setattr(config, "ARCHIVE_RATE", 0)
+    monkeypatch.setattr(config, "ARCHIVE_BACKOFF", 0.01)
+    monkeypatch.setattr(config, "ARCHIVE_MERGE_WINDOW", 0.05)
+    with FakeGaiaArchive(synthetic_catalog(20000)) as fake:
+        monkeypatch.setattr(config, "GAIA_TAP_URL", fake.url)
+        yield fake
+        archive.close_clients()
+
+
+def box_query(box, top=100):
+    return archive.BoxQuery("ra, dec", "gaia", "parallax > 1", "phot_g_mean_mag", top, box)
+
+
+def test_merge_groups():
+    queries = [box_query((0, 30, 0, 30)), box_query((30, 60, 0, 30)), box_query((30, 60, 0, 30)),
+               box_query((90, 120, 0, 30)), box_query((60, 90, 30, 60)), box_query((60, 90, 0, 30), top=5)]
+    groups = {box: len(members) for box, members in archive.merge_groups(queries)}
+    assert groups == {(0, 60, 0, 30): 3, (90, 120, 0, 30): 1, (60, 90, 30, 60): 1, (60, 90, 0, 30): 1}
+
+    row = [box_query((ra, ra + 30, 0, 30)) for ra in range(0, 360, 30)]
+    assert [box for box, _ in archive.merge_groups(row, max_boxes=5)] == [
+        (0, 150, 0, 30), (150, 300, 0, 30), (300, 360, 0, 30)]
+
+
+def test_merged_tile_queries(fake_archive, monkeypatch):
+    monkeypatch.setattr(config, "TILE_STAR_LIMIT", 40)
+    keys = [tile_cache.tile_key(ra, 10) for ra in range(5, 360, 30)]
+    tiles = tile_cache.load_tiles(keys)
+
+    stats = archive.get_stats()
+    assert stats["queries"] == len(keys)
+    assert stats["merged"] > 0
+    assert fake_archive.queries < len(keys)
+    for key, tile in zip(keys, tiles):
+        ra_min, ra_max, dec_min, dec_max = tile_cache.tile_bounds(key)
+        expected = select(fake_archive.columns, "SELECT TOP 40 * WHERE ra >= {} AND ra < {} "
+                          "AND dec >= {} AND dec < {}".format(ra_min, ra_max, dec_min, dec_max))
+        np.testing.assert_array_equal(tile["source_id"], expected["source_id"])
+    assert tile_cache.get_stats()["misses"] == len(keys)
+
+
+def test_tile_parallax_floor(fake_archive, monkeypatch):
+    # no floor by default: distant stars reach the views, e.g. the earth view
+    monkeypatch.setattr(config, "TILE_STAR_LIMIT", 20000)
+    stars = fake_archive.columns
+    tile = tile_cache.load_tile((0, 3))
+    inside = ((stars["ra"] < 30) & (stars["dec"] >= 0) & (stars["dec"] < 30))
+    assert len(tile["ra"]) == inside.sum()
+    assert np.any(tile["parallax"] < 1)
+
+    monkeypatch.setattr(config, "TILE_MIN_PARALLAX", 1.0)
+    assert not os.path.exists(os.path.join(tile_cache.cache_dir(), "0_3.npz"))
+    tile = tile_cache.load_tile((0, 3))
+    assert len(tile["ra"]) == (inside & (stars["parallax"] > 1)).sum()
+
+
+def test_parallax_limited_query(fake_archive, monkeypatch):
+    # a limit far above the floorless tiles' stars: their brightest stars are mostly too far
+    monkeypatch.setattr(config, "TILE_STAR_LIMIT", 60)
+    columns = tile_cache.query_box(40, 80, 0, 30, parallax_min=40, n_stars=30)
+    # the stars of one archive query with the limit, as before the tile cache
+    expected = select(fake_archive.columns, "SELECT TOP 30 * WHERE parallax > 40 "
+                      "AND ra >= 40 AND ra < 80 AND dec >= 0 AND dec < 30")
+    np.testing.assert_array_equal(columns["source_id"], expected["source_id"])
+    assert tile_cache.layout_floor(40) == 32
+    assert os.path.isdir(tile_cache.cache_dir(floor=32))
+
+
+def test_retry_and_errors(fake_archive):
+    fake_archive.failures = 2
+    columns = archive.get_client().query(box_query((0, 30, 0, 30), top=10))
+    assert len(columns["ra"]) == 10
+    assert archive.get_stats()["retries"] == 2
+
+    client = archive.ArchiveClient(fake_archive.url + "missing/")
+    with pytest.raises(archive.ArchiveError):
+        client.request("SELECT TOP 1 ra FROM gaia")
+    assert client.get_stats()["requests"] == 1
+    client.close()
+
+
+def test_close_fails_waiting_queries(fake_archive, monkeypatch):
+    import threading
+    import time
+
+    monkeypatch.setattr(config, "ARCHIVE_MAX_CONCURRENCY", 1)
+    monkeypatch.setattr(config, "ARCHIVE_RETRIES", 0)
+    fake_archive.latency = 1.0
+    client = archive.ArchiveClient(fake_archive.url)
+    errors = []
+
+    def query(box):
+        try:
+            client.query(box_query(box, top=10))
+        except archive.ArchiveError as error:
+            errors.append(error)
+
+    # one group on the only worker, two queued behind it, one more in the merge window
+    threads = [threading.Thread(target=query, args=((ra, ra + 10, 0, 10),)) for ra in (0, 100, 200)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.3)
+    monkeypatch.setattr(config, "ARCHIVE_MERGE_WINDOW", 5.0)
+    threads.append(threading.Thread(target=query, args=((300, 310, 0, 10),)))
+    threads[-1].start()
+    time.sleep(0.1)
+
+    start = time.monotonic()
+    client.close()
+    for thread in threads[1:]:
+        thread.join(timeout=2)
+        assert not thread.is_alive()
+    assert time.monotonic() - start < 1.0
+    assert len(errors) >= 3
+    with pytest.raises(archive.ArchiveError):
+        client.query(box_query((0, 10, 0, 10)))
+    threads[0].join(timeout=5)
@@ -0,0 +1,202 @@
+import numpy as np
+import pytest
+
+import api.data_api as data_api
+from api import bright_stars, catalog, config, tile_cache
+
+SIRIUS = {"name": " 9Alp CMa", "RA": ["06", "45", "08.9"], "DE": ["-", "16", "42", "58"],
+          "vmag": "-1.46", "bv": "+0.00"}
+NOVA = {"name": " NOVA 1572", "RA": ["  ", "  ", "    "], "DE": [" ", "  ", "  ", "  "],
+        "vmag": "     ", "bv": "     "}
+NO_COLOR = {"name": "          ", "RA": ["00", "15", "07.0"], "DE": ["+", "31", "32", "09"],
+            "vmag": " 6.45", "bv": "     "}
+
+
+@pytest.fixture
+def bright_tier(tmp_path, monkeypatch):
+    """
+    Turn the bright star tier on, compiled into a temporary cache directory.
+    """
+    monkeypatch.setattr(config, "BRIGHT_STARS", True)
+    monkeypatch.setattr(config, "CACHE_DIR", str(tmp_path / "cache"))
+    bright_stars.reset()
+    catalog.reset()
+    yield bright_stars.get_bright_stars()
+    bright_stars.reset()
+    catalog.reset()
+
+
+def test_parse_catalog():
+    columns = bright_stars.parse_catalog([SIRIUS, NOVA, NO_COLOR])
+    assert list(columns["DESIGNATION"]) == ["HR 1", "HR 3"]
+    assert list(columns["source_id"]) == [-1, -3]
+    np.testing.assert_allclose(columns["ra"], [(6 + 45 / 60 + 8.9 / 3600) * 15, (15 / 60 + 7 / 3600) * 15])
+    np.testing.assert_allclose(columns["dec"], [-(16 + 42 / 60 + 58 / 3600), 31 + 32 / 60 + 9 / 3600])
+    np.testing.assert_allclose(columns["phot_g_mean_mag"], [-1.46, 6.45])
+    bv = data_api.bv_color_index(columns["phot_bp_mean_mag"], columns["phot_rp_mean_mag"])
+    assert bv[0] == pytest.approx(0) and np.isnan(bv[1])
+    # placed where BRIGHT_STARS_ABS_MAG looks like the V magnitude
+    distance = 1000 / columns["parallax"]
+    np.testing.assert_allclose(columns["phot_g_mean_mag"] - 5 * np.log10(distance / 10),
+                               config.BRIGHT_STARS_ABS_MAG)
+
+
+def test_compiled_once(bright_tier, monkeypatch):
+    assert len(bright_tier) > 9000
+    sirius = np.flatnonzero(bright_tier.columns["DESIGNATION"] == "HR 2491")[0]
+    assert bright_tier.columns["phot_g_mean_mag"][sirius] == pytest.approx(-1.46)
+    np.testing.assert_allclose(np.linalg.norm(bright_tier.xyz, axis=1),
+                               1000 / bright_tier.columns["parallax"], rtol=1e-5)
+
+    # the next start reads the compiled arrays, the JSON is not parsed again
+    assert bright_stars._load_compiled(config.BRIGHT_STARS_PATH) is not None
+    bright_stars.reset()
+    monkeypatch.setattr(bright_stars, "parse_catalog", None)
+    assert len(bright_stars.get_bright_stars()) == len(bright_tier)
+
+
+def test_gaia_counterpart_wins(bright_tier):
+    box = (95, 110, -25, -10)
+    rows = bright_tier.query_box(*box)
+    sirius = np.flatnonzero(rows["DESIGNATION"] == "HR 2491")[0]
+    gaia = tile_cache.empty_columns()
+    gaia.update({
+        "source_id": np.array([1], dtype=np.int64),
+        "DESIGNATION": np.array(["Gaia DR2 1"]),
+        "ra": rows["ra"][[sirius]] + 10 / 3600,
+        "dec": rows["dec"][[sirius]],
+        "parallax": np.array([379.2]),
+        "phot_g_mean_mag": np.array([-1.2]),
+        "phot_bp_mean_mag": np.array([-1.2]),
+        "phot_rp_mean_mag": np.array([-1.2]),
+        "pmra": np.array([-546.0]),
+        "pmdec": np.array([-1223.1]),
+        "radial_velocity": np.array([-5.5]),
+    })
+    merged = bright_stars.merge_box(gaia, *box)
+    assert len(merged["ra"]) == len(rows["ra"])
+    assert merged["DESIGNATION"][0] == "Gaia DR2 1"
+    assert "HR 2491" not in merged["DESIGNATION"]
+    assert np.all(np.diff(merged["phot_g_mean_mag"]) >= 0)
+
+    merged = bright_stars.merge_box(gaia, *box, n_stars=5)
+    assert len(merged["ra"]) == 5
+
+
+@pytest.fixture
+def archive_down(tile_cache_dir, monkeypatch):
+    """
+    Every archive query fails like an unreachable archive. Returns the requested tiles.
+    """
+    from api import archive
+
+    calls = []
+
+    def fetch_tile(key, size=None, floor=None):
+        calls.append(key)
+        raise archive.ArchiveError("Gaia archive query failed: ConnectError")
+
+    monkeypatch.setattr(tile_cache, "fetch_tile", fetch_tile)
+    return calls
+
+
+def test_skyview_without_archive(bright_tier, archive_down):
+    star_info = data_api.get_skyview_from_earth(101, -17, 10, 10, n_stars=5)
+    assert archive_down
+    assert star_info["name"][0] == "HR 2491"
+    assert all(name.startswith("HR ") for name in star_info["name"])
+
+    star_info, fallback = data_api.track_fallback(data_api.get_skyview_from_exoplanet, 90, -20, 0.9, 20, 20,
+                                                  n_stars=50, mode="proxy")
+    assert len(star_info["name"]) == 50 and fallback
+
+
+def test_fallback_is_not_cached(bright_tier, archive_down, monkeypatch):
+    import asyncio
+
+    import httpx
+
+    import api.star as star
+    from main import app
+
+    async def post():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/api/v1/star/skyview/earth/", json={"ra": 101, "dec": -17, "n_stars": 5})
+
+    star.skyview_cache.clear()
+    assert asyncio.run(post()).json()["stars"][0]["name"] == "HR 2491"
+    assert star.skyview_cache.get_stats()["entries"] == 0
+
+    # anything but an archive failure is an error, not a bright star answer
+    def broken(key, size=None, floor=None):
+        raise KeyError("ra")
+
+    monkeypatch.setattr(tile_cache, "fetch_tile", broken)
+    with pytest.raises(KeyError):
+        data_api.get_skyview_from_earth(101, -17, 10, 10, n_stars=5)
+    star.skyview_cache.clear()
+
+
+def test_slow_archive_answers_with_bright_stars(bright_tier, tile_cache_dir, make_stars, monkeypatch):
+    import threading
+    import time
+
+    stars = make_stars(20000)
+    released = threading.Event()
+
+    def fetch_tile(key, size=None, floor=None):
+        released.wait()
+        ra_min, ra_max, dec_min, dec_max = tile_cache.tile_bounds(key, size)
+        inside = ((stars["ra"] >= ra_min) & (stars["ra"] < ra_max) &
+                  (stars["dec"] >= dec_min) & (stars["dec"] < dec_max))
+        return tile_cache.take_columns(stars, inside)
+
+    monkeypatch.setattr(tile_cache, "fetch_tile", fetch_tile)
+    monkeypatch.setattr(config, "ARCHIVE_DEADLINE", 0.2)
+    start = time.monotonic()
+    star_info, fallback = data_api.track_fallback(data_api.get_skyview_from_earth, 101, -17, 10, 10, n_stars=50)
+    elapsed = time.monotonic() - start
+    # the fetches go on in the background and fill the cache for the next request
+    released.set()
+    assert elapsed < 2
+    assert fallback and all(name.startswith("HR ") for name in star_info["name"])
+
+    for _ in range(100):
+        star_info, fallback = data_api.track_fallback(data_api.get_skyview_from_earth, 101, -17, 10, 10,
+                                                      n_stars=50)
+        if not fallback:
+            break
+        time.sleep(0.05)
+    assert not fallback and len(star_info["name"]) == 50
+    assert not all(name.startswith("HR ") for name in star_info["name"])
+
+
+def test_stream_starts_with_bright_stars(bright_tier, seeded_tile_cache, archive_calls):
+    bright = bright_tier.query_box(0, 360, -90, 90)
+    chunks = list(data_api.iter_stars(0, 360, -90, 90, chunk_size=2000))
+    first = tile_cache.concat_columns(chunks[:-(-len(bright["ra"]) // 2000)])
+    np.testing.assert_array_equal(first["DESIGNATION"], bright["DESIGNATION"])
+    # the Gaia counterparts of the bright stars sent first are left out
+    gaia = seeded_tile_cache
+    matched = bright_stars.match(gaia["ra"], gaia["dec"], gaia["phot_g_mean_mag"],
+                                 bright["ra"], bright["dec"], bright["phot_g_mean_mag"])
+    assert 0 < matched.sum() < 10
+    assert sum(len(chunk["ra"]) for chunk in chunks) == len(bright["ra"]) + len(gaia["ra"]) - matched.sum()
+
+
+def test_stream_without_archive(bright_tier, archive_down):
+    chunks = list(data_api.iter_stars(95, 110, -25, -10, chunk_size=20))
+    assert archive_down
+    assert len(chunks) > 0 and all(name.startswith("HR ") for chunk in chunks for name in chunk["DESIGNATION"])
+
+
+def test_catalog_includes_bright_stars(bright_tier, seeded_tile_cache, archive_calls):
+    stars = catalog.get_catalog()
+    extra = bright_tier.unmatched(seeded_tile_cache)
+    assert 0 < len(bright_tier) - len(extra) < 10
+    assert len(stars) == len(seeded_tile_cache["ra"]) + len(extra)
+    view = data_api.get_skyview_from_exoplanet(101.3, -16.7, 0.01, 101.3, -16.7, 10, 10, n_stars=3,
+                                               mode="cartesian")
+    assert view["name"][0] == "HR 2491"
+    assert archive_calls == []
@@ -0,0 +1,96 @@
+import numpy as np
+
+import api.data_api as data_api
+from api import catalog, star_store
+
+
+def test_heliocentric_xyz():
+    xyz = catalog.heliocentric_xyz(np.array([0.0, 90.0, 10.0]), np.array([0.0, 0.0, 90.0]),
+                                   np.array([10.0, 100.0, -1.0]))
+    assert np.allclose(xyz[0], [100, 0, 0])
+    assert np.allclose(xyz[1], [0, 10, 0], atol=1e-5)
+    assert np.all(np.isnan(xyz[2]))
+
+
+def test_store_has_precomputed_xyz(store_dir):
+    store = star_store.get_store()
+    assert isinstance(store.xyz, np.memmap)
+    assert store.xyz.shape == (len(store), 3)
+
+
+def test_view_from_sun_is_earth_sky(store_dir):
+    stars = catalog.get_catalog()
+    ra, dec, distance, mag = stars.view_from((0, 0, 0))
+    assert np.allclose(ra, stars.columns["ra"], atol=1e-4)
+    assert np.allclose(dec, stars.columns["dec"], atol=1e-4)
+    assert np.allclose(mag, stars.columns["phot_g_mean_mag"], atol=1e-4)
+
+
+def test_brightest_in_view_by_blocks(store_dir, monkeypatch):
+    stars = catalog.get_catalog()
+    position = data_api.ra_dec_to_xyz(90, -20, 50)
+    catalog_view = (stars,) + stars.view_from(position)
+    expected = data_api.field_of_view(catalog_view, 20, 20, 60, 60)[:100]
+    monkeypatch.setattr(data_api, "VIEW_BLOCK_ROWS", 700)
+    rows, ra, dec, distance, mag = data_api.brightest_in_view(stars, position, 20, 20, 60, 60, 100)
+    np.testing.assert_array_equal(rows, expected)
+    np.testing.assert_allclose(ra, catalog_view[1][expected])
+    np.testing.assert_allclose(mag, catalog_view[4][expected])
+
+
+def test_cartesian_skyview(store_dir, archive_calls):
+    star_info = data_api.get_skyview_from_exoplanet(90, -20, 50, 20, 20, fovy_w=60, fovy_h=60,
+                                                    n_stars=100, mode="cartesian")
+    assert 0 < len(star_info["name"]) <= 100
+    assert np.all(np.diff(star_info["brightness"]) >= 0)
+    ra = np.array(star_info["ra"])
+    assert np.all((ra >= 350 - 1e-9) | (ra <= 50 + 1e-9))
+    assert np.all(np.abs(np.array(star_info["dec"]) - 20) <= 30 + 1e-9)
+
+    # a star's distance and brightness follow the exoplanet's position
+    stars = catalog.get_catalog()
+    planet = np.array(data_api.ra_dec_to_xyz(90, -20, 50))
+    i = list(np.char.decode(stars.columns["DESIGNATION"], "ascii")).index(star_info["name"][0])
+    expected = np.linalg.norm(stars.xyz[i] - planet)
+    assert np.isclose(star_info["distance"][0], expected, rtol=1e-4)
+    assert archive_calls == []
+
+
+def test_cold_build_runs_in_background(tile_cache_dir, make_stars, monkeypatch):
+    import asyncio
+    import threading
+
+    import httpx
+
+    from api import tile_cache
+    from main import app
+
+    stars = make_stars(2000)
+    release = threading.Event()
+
+    def fetch_tile(key, size=None, floor=None):
+        release.wait(10)
+        ra_min, ra_max, dec_min, dec_max = tile_cache.tile_bounds(key, size)
+        inside = ((stars["ra"] >= ra_min) & (stars["ra"] < ra_max) &
+                  (stars["dec"] >= dec_min) & (stars["dec"] < dec_max))
+        return tile_cache.take_columns(stars, inside)
+
+    monkeypatch.setattr(tile_cache, "fetch_tile", fetch_tile)
+    catalog.reset()
+    body = {"ex_ra": 90, "ex_dec": -20, "ex_distance": 50, "ra": 20, "dec": 20, "mode": "cartesian"}
+
+    async def post():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/api/v1/star/skyview/exoplanet/", json=body)
+
+    try:
+        # the archive is not queried while holding the catalog lock or inside the request
+        response = asyncio.run(post())
+        assert response.status_code == 503 and response.headers["retry-after"]
+        release.set()
+        assert len(catalog.get_catalog(wait=True)) == len(stars["ra"])
+        assert asyncio.run(post()).status_code == 200
+    finally:
+        release.set()
+        catalog.reset()
@@ -0,0 +1,72 @@
+import asyncio
+import gzip
+
+import httpx
+import numpy as np
+import pytest
+
+import api.star as star
+from api import compression, config
+from main import app
+
+EXOPLANET_VIEW = {"ex_ra": 90, "ex_dec": -20, "ex_distance": 0.9, "ra": 20, "dec": 20}
+
+
+@pytest.fixture
+def large_skyview(monkeypatch):
+    n = 3000
+
+    def skyview(*args, **kwargs):
+        rng = np.random.default_rng(0)
+        return {"name": np.array(["Gaia DR2 {}".format(i) for i in range(n)]), "ra": rng.uniform(0, 360, n),
+                "dec": rng.uniform(-90, 90, n), "brightness": rng.uniform(2, 18, n), "bv": rng.uniform(0, 2, n)}
+
+    monkeypatch.setattr(star, "get_skyview_from_exoplanet", skyview)
+    star.skyview_cache.clear()
+    yield
+    star.skyview_cache.clear()
+
+
+async def post(headers, path="/api/v1/star/skyview/exoplanet/"):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await client.post(path, json=EXOPLANET_VIEW, headers=headers)
+
+
+@pytest.mark.parametrize("thread_min_size", [0, 10 ** 9])
+def test_skyview_is_gzipped(large_skyview, monkeypatch, thread_min_size):
+    monkeypatch.setattr(config, "COMPRESSION_THREAD_MIN_SIZE", thread_min_size)
+    plain = asyncio.run(post({"Accept-Encoding": "identity"}))
+    compressed = asyncio.run(post({"Accept-Encoding": "gzip"}))
+    assert "content-encoding" not in plain.headers
+    assert compressed.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in compressed.headers["vary"]
+    assert int(compressed.headers["content-length"]) < len(plain.content) / 2
+    assert compressed.json() == plain.json()
+
+
+def test_small_and_encoded_bodies_pass_through(monkeypatch):
+    async def get(path):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get(path, headers={"Accept-Encoding": "gzip"})
+
+    stats = asyncio.run(get("/api/v1/star/cache/stats"))
+    assert "content-encoding" not in stats.headers
+
+    # precompressed by the exoplanet router, must not be compressed twice
+    monkeypatch.setattr(config, "COMPRESSION_MIN_SIZE", 1)
+    planets = asyncio.run(get("/api/v1/exoplanet/all"))
+    assert planets.headers["content-encoding"] == "gzip"
+    assert planets.json()
+
+
+def test_choose_encoding(monkeypatch):
+    monkeypatch.setattr(compression, "brotli", None)
+    monkeypatch.setattr(compression, "zstandard", None)
+    encodings = compression.available_encodings()
+    assert encodings == ["gzip"]
+    assert compression.choose_encoding("br, gzip;q=0.5", encodings) == "gzip"
+    assert compression.choose_encoding("gzip;q=0", encodings) is None
+    assert compression.choose_encoding("*", encodings) == "gzip"
+    assert gzip.decompress(compression.compress(b"stars" * 100, "gzip")) == b"stars" * 100
@@ -0,0 +1,89 @@
+import asyncio
+
+import httpx
+import numpy as np
+import pytest
+
+from api import catalog, config, constellation_store
+from main import app
+
+URL = "/api/v1/constellations/"
+
+
+@pytest.fixture
+def store(store_dir, archive_calls, tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "CONSTELLATION_DB", str(tmp_path / "constellations.sqlite3"))
+    yield store_dir[1]
+    constellation_store.get_store().close()
+
+
+def request(method, url, **kwargs):
+    async def send():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.request(method, url, **kwargs)
+
+    return asyncio.run(send())
+
+
+def test_find_source_ids(store):
+    star_catalog = catalog.get_catalog()
+    source_ids = np.asarray(star_catalog.columns["source_id"])
+    wanted = np.concatenate([source_ids[[17, 3, 4000, 17]], [5]])
+    rows = star_catalog.find(wanted)
+    assert rows[:4].tolist() == [17, 3, 4000, 17] and rows[4] == -1
+    # the permutation persisted by the store agrees with a fresh one
+    assert np.array_equal(star_catalog.source_order, np.argsort(source_ids, kind="stable"))
+    assert catalog.Catalog({"source_id": source_ids[:0]}, np.zeros((0, 3))).find([1]).tolist() == [-1]
+
+
+def test_save_list_and_delete(store):
+    ids = store["source_id"]
+    edges = [[int(ids[0]), "Gaia DR2 {}".format(ids[1])], [str(ids[1]), int(ids[2])]]
+    response = request("POST", URL, json={"planet": "TRAPPIST-1 e", "name": "Kettle", "author": "ana",
+                                          "edges": edges})
+    assert response.status_code == 201
+    saved = response.json()
+    assert saved["stars"]["source_id"] == ids[:3].tolist()
+    assert saved["stars"]["name"][1] == "Gaia DR2 {}".format(ids[1])
+    np.testing.assert_allclose(saved["stars"]["ra"], store["ra"][:3], atol=1e-6)
+    assert saved["edges"] == [[0, 1], [1, 2]]
+
+    request("POST", URL, json={"planet": "TRAPPIST-1 e", "name": "Private", "shared": False, "edges": edges})
+    request("POST", URL, json={"planet": "Proxima b", "name": "Other", "edges": edges})
+    listed = request("GET", URL, params={"planet": "TRAPPIST-1 e"}).json()
+    assert [c["name"] for c in listed["constellations"]] == ["Kettle"]
+    assert request("GET", URL + str(saved["id"])).json() == saved
+
+    response = request("POST", URL, json={"planet": "TRAPPIST-1 e", "name": "Bad",
+                                          "edges": [[int(ids[0]), 5], [int(ids[1]), "HR 9999"]]})
+    assert response.status_code == 400 and response.json()["stars"] == [5, "HR 9999"]
+    assert request("POST", URL, json={"planet": "TRAPPIST-1 e", "name": "Bad", "edges": [["Vega", 1]]}
+                   ).status_code == 400
+    assert request("POST", URL, json={"planet": "TRAPPIST-1 e", "name": "Bad", "edges": []}).status_code == 400
+
+    assert request("DELETE", URL + str(saved["id"])).status_code == 204
+    assert request("GET", URL + str(saved["id"])).status_code == 404
+
+
+def test_export_import(store, tmp_path):
+    ids = store["source_id"]
+    for name in ("A", "B"):
+        request("POST", URL, json={"planet": "TRAPPIST-1 e", "name": name, "edges": [[int(ids[5]), int(ids[6])]]})
+    exported = request("GET", URL + "export", params={"planet": "TRAPPIST-1 e"})
+    assert exported.headers["content-type"] == "application/x-ndjson"
+    lines = exported.text.splitlines()
+    assert len(lines) == 2
+
+    # command line roundtrip into another database keeps everything but the ids
+    (tmp_path / "export.jsonl").write_text(exported.text)
+    copy = str(tmp_path / "copy.sqlite3")
+    constellation_store.main(["--db", copy, "import", str(tmp_path / "export.jsonl")])
+    constellation_store.main(["--db", copy, "export", str(tmp_path / "copy.jsonl")])
+    copied = (tmp_path / "copy.jsonl").read_text().splitlines()
+    assert [line.split(',"planet"')[1] for line in copied] == [line.split(',"planet"')[1] for line in lines]
+
+    response = request("POST", URL + "import", content=exported.content)
+    assert response.json() == {"imported": 2}
+    assert len(request("GET", URL, params={"planet": "TRAPPIST-1 e"}).json()["constellations"]) == 4
+    assert request("POST", URL + "import", content=b'{"planet": 1}\n').status_code == 400
@@ -1,14 +1,17 @@
 import api.data_api as test_data_api
-import matplotlib.pyplot as plt 
 import os
 
 test_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), "images")
 
+
 def test_view_from_earth(print_result=True, show_plot=False):
+    import matplotlib.pyplot as plt
+
     print("Test view from earth")
     # Test case 1
     ra, dec = 20, 20
     star_info = test_data_api.get_skyview_from_earth(ra, dec)
+    assert 0 < len(star_info["name"]) <= 50
     if print_result:
         print("Test case 1:")
         print("ra:", ra, ", dec:", dec)
@@ -28,6 +31,7 @@ def test_view_from_earth(print_result=True, show_plot=False):
     # Test case 2
     ra, dec = 40, 0
     star_info = test_data_api.get_skyview_from_earth(ra, dec)
+    assert 0 < len(star_info["name"]) <= 50
     if print_result:
         print("Test case 2:")
         print("ra:", ra, ", dec:", dec)
@@ -47,11 +51,14 @@ def test_view_from_earth(print_result=True, show_plot=False):
 
 
 def test_view_from_exoplanet(print_result=True, show_plot=False):
+    import matplotlib.pyplot as plt
+
     # Test case 1
     ra, dec = 20, 20
     exo_ra, exo_dec = 90, -20
     exo_distance = 0.9
     star_info = test_data_api.get_skyview_from_exoplanet(exo_ra, exo_dec, exo_distance, ra, dec)
+    assert 0 < len(star_info["name"]) <= 3000
     if print_result:
         print("Test case 1:")
         print("ra:", ra, ", dec:", dec)
@@ -61,9 +68,9 @@ def test_view_from_exoplanet(print_result=True, show_plot=False):
         print()
     
     if show_plot:
-        plt.scatter(star_info["x"], star_info["y"], c=star_info["distance"], cmap='viridis')
-        plt.xlabel("x")
-        plt.ylabel("y")
+        plt.scatter(star_info["ra"], star_info["dec"], c=star_info["distance"], cmap='viridis')
+        plt.xlabel("ra")
+        plt.ylabel("dec")
         plt.colorbar(label="distance")
         
         plt.savefig(os.path.join(test_directory, "view_from_exoplanet_1.png")) 
@@ -74,6 +81,7 @@ def test_view_from_exoplanet(print_result=True, show_plot=False):
     exo_ra, exo_dec = 30, 30
     exo_distance = 1.0
     star_info = test_data_api.get_skyview_from_exoplanet(exo_ra, exo_dec, exo_distance, ra, dec)
+    assert 0 < len(star_info["name"]) <= 3000
     
     if print_result:
         print("Test case 2:")
@@ -84,9 +92,9 @@ def test_view_from_exoplanet(print_result=True, show_plot=False):
         print()
         
     if show_plot:
-        plt.scatter(star_info["x"], star_info["y"], c=star_info["distance"], cmap='viridis')
-        plt.xlabel("x")
-        plt.ylabel("y")
+        plt.scatter(star_info["ra"], star_info["dec"], c=star_info["distance"], cmap='viridis')
+        plt.xlabel("ra")
+        plt.ylabel("dec")
         plt.colorbar(label="distance")
         
         plt.savefig(os.path.join(test_directory, "view_from_exoplanet_2.png"))
@@ -0,0 +1,70 @@
+import asyncio
+import json
+
+import httpx
+import numpy as np
+import pytest
+
+import api.star as star
+from api import encoding
+from main import app
+
+SKYVIEW = {
+    "name": np.array(["Gaia DR2 1", "Gaia DR2 2", "Gaia DR2 3"]),
+    "ra": np.array([10.5, 20.25, 30.0]),
+    "dec": np.array([-5.0, 0.0, 5.0]),
+    "brightness": np.array([3.5, 7.25, 11.0]),
+    "bv": np.array([0.5, np.nan, 1.5]),
+}
+
+
+def test_negotiate():
+    assert encoding.negotiate(None) == encoding.JSON
+    assert encoding.negotiate("*/*") == encoding.JSON
+    assert encoding.negotiate(encoding.FLOAT32) == encoding.FLOAT32
+    assert encoding.negotiate("application/json;q=0.5, application/vnd.exosky.columnar+json") == encoding.COLUMNAR_JSON
+    assert encoding.negotiate("text/html") is None
+
+
+def test_columnar_json():
+    body = json.loads(encoding.encode_columnar_json(SKYVIEW))
+    assert body["count"] == 3
+    assert body["columns"]["ra"] == [10.5, 20.25, 30.0]
+    assert body["columns"]["bv"] == [0.5, None, 1.5]
+    assert body["columns"]["name"][2] == "Gaia DR2 3"
+
+
+def test_float32_layout():
+    body = encoding.encode_float32(SKYVIEW)
+    values = np.frombuffer(body[:3 * 4 * 4], dtype="<f4").reshape(4, 3)
+    assert np.allclose(values[0], SKYVIEW["ra"])
+    assert np.allclose(values[2], SKYVIEW["brightness"])
+    assert body[3 * 4 * 4:].decode("utf-8").split("\n") == list(SKYVIEW["name"])
+
+
+def test_legacy_json_is_unchanged():
+    stars = encoding.legacy_stars(SKYVIEW)
+    assert stars[0] == {"name": "Gaia DR2 1", "ra": "10.5", "dec": "-5.0", "vmag": "3.5", "bv": "0.5"}
+
+
+@pytest.mark.parametrize("accept, status, media_type", [
+    (encoding.FLOAT32, 200, encoding.FLOAT32),
+    (encoding.COLUMNAR_JSON, 200, encoding.COLUMNAR_JSON),
+    ("text/html", 406, "application/json"),
+])
+def test_skyview_content_negotiation(monkeypatch, accept, status, media_type):
+    monkeypatch.setattr(star, "get_skyview_from_earth", lambda *args: SKYVIEW)
+    star.skyview_cache.clear()
+
+    async def request():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/api/v1/star/skyview/earth/", json={"ra": 20, "dec": 0},
+                                     headers={"Accept": accept})
+
+    response = asyncio.run(request())
+    star.skyview_cache.clear()
+    assert response.status_code == status
+    assert response.headers["content-type"].startswith(media_type)
+    if media_type == encoding.FLOAT32:
+        assert response.headers["x-exosky-count"] == "3"
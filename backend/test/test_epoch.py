@@ -0,0 +1,88 @@
+import asyncio
+
+import httpx
+import numpy as np
+import pytest
+
+import api.data_api as data_api
+from api import catalog, epoch, planet_sky
+from api.catalog import heliocentric_xyz
+from main import app
+
+FRAMES_URL = "/api/v1/star/skyview/exoplanet/frames"
+
+
+@pytest.fixture
+def sky(seeded_tile_cache, archive_calls):
+    catalog.reset()
+    planet_sky.invalidate()
+    yield
+    catalog.reset()
+
+
+def test_proper_motion_from_the_sun():
+    columns = {"ra": np.array([40.0, 200.0]), "dec": np.array([30.0, -60.0]), "parallax": np.array([100.0, 20.0]),
+               "pmra": np.array([1000.0, -300.0]), "pmdec": np.array([-500.0, np.nan]),
+               "radial_velocity": np.array([np.nan, 40.0]), "phot_g_mean_mag": np.array([5.0, 8.0])}
+    xyz = heliocentric_xyz(columns["ra"], columns["dec"], columns["parallax"])
+    years = np.array([0, 10, 100])
+    ra, dec, mag = epoch.sky_frames((0, 0, 0), xyz, epoch.velocities(columns), columns["phot_g_mean_mag"],
+                                    1000 / columns["parallax"], years)
+    assert ra.shape == dec.shape == mag.shape == (3, 2)
+
+    # seen from the sun, stars move by their proper motion (mas/yr, pmra includes cos(dec))
+    d_ra = (ra[:, 0] - ra[0, 0]) * np.cos(np.radians(30)) * 3.6e6
+    d_dec = (dec[:, 0] - dec[0, 0]) * 3.6e6
+    np.testing.assert_allclose(d_ra[1:], 1000 * years[1:], rtol=5e-3)
+    np.testing.assert_allclose(d_dec[1:], -500 * years[1:], rtol=5e-3)
+    np.testing.assert_allclose(mag[0], columns["phot_g_mean_mag"], atol=1e-4)
+    # a receding star fades, missing values count as no motion
+    assert mag[2, 1] > mag[1, 1] > mag[0, 1]
+    np.testing.assert_allclose(dec[:, 1], dec[0, 1], atol=1e-3)
+
+
+def test_frames_endpoint(sky):
+    view = {"ex_ra": 90, "ex_dec": -20, "ex_distance": 0.9, "ra": 20, "dec": 20, "fovy_w": 40, "fovy_h": 30,
+            "n_stars": 200, "start": 0, "end": 50000, "frames": 6}
+
+    async def post(body, accept=None):
+        transport = httpx.ASGITransport(app=app)
+        headers = {"accept": accept} if accept else {}
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post(FRAMES_URL, json=body, headers=headers)
+
+    response = asyncio.run(post(view))
+    assert response.status_code == 200
+    body = response.json()
+    assert body["count"] == 200 and body["frames"] == 6
+    assert body["epochs"] == [2015.5, 12015.5, 22015.5, 32015.5, 42015.5, 52015.5]
+    assert len(body["ra"]) == 6 and len(body["vmag"][5]) == 200
+
+    # the first frame is the skyview at the reference epoch
+    skyview = data_api.get_skyview_from_exoplanet(90, -20, 0.9, 20, 20, 40, 30, 200, mode="cartesian")
+    assert body["columns"]["name"] == skyview["name"].tolist()
+    np.testing.assert_allclose(body["ra"][0], skyview["ra"], atol=1e-3)
+    np.testing.assert_allclose(body["vmag"][0], skyview["brightness"], atol=1e-3)
+    assert not np.allclose(body["dec"][5], body["dec"][0], atol=1e-3)
+
+    response = asyncio.run(post(view, "application/vnd.exosky.float32"))
+    assert response.headers["x-exosky-frames"] == "6"
+    values = np.frombuffer(response.content[:4 * (6 + 3 * 6 * 200 + 200)], dtype="<f4")
+    np.testing.assert_allclose(values[6:6 + 1200].reshape(6, 200), body["ra"], atol=1e-4)
+    assert response.content[4 * len(values):].decode().split("\n") == body["columns"]["name"]
+
+    assert asyncio.run(post(dict(view, frames=0))).status_code == 400
+    assert asyncio.run(post(dict(view, frames=1000, n_stars=50000))).status_code == 400
+
+
+def test_frames_skip_stars_without_parallax(make_stars, monkeypatch):
+    stars = make_stars(2000, seed=5)
+    stars["parallax"][:1000:2] = 0
+    stars["parallax"][1:1000:2] = -2
+    star_catalog = catalog.Catalog(stars, heliocentric_xyz(stars["ra"], stars["dec"], stars["parallax"]))
+    monkeypatch.setattr(catalog, "get_catalog", lambda wait=False: star_catalog)
+
+    frames = data_api.get_frames_from_exoplanet(90, -20, 0.9, 20, 20, 60, 60, 500, years=(0, 1000))
+    valid = set(stars["DESIGNATION"][1000:])
+    assert 0 < len(frames["name"]) and set(frames["name"]) <= valid
+    assert np.isfinite(frames["ra"]).all() and np.isfinite(frames["brightness"]).all()
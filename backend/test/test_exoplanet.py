@@ -0,0 +1,60 @@
+import asyncio
+import gzip
+import json
+import os
+import threading
+
+import httpx
+
+from api import exoplanet
+from main import app
+
+
+async def get_all(headers=None):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await client.get("/api/v1/exoplanet/all", headers=headers or {})
+
+
+def test_all_is_revalidated_with_etag():
+    first = asyncio.run(get_all({"Accept-Encoding": "identity"}))
+    assert first.status_code == 200
+    assert "content-encoding" not in first.headers
+    planets = first.json()
+    assert planets[0].keys() == {"pl_name", "hostname", "pl_orbper", "sy_dist", "ra", "dec"}
+
+    etag = first.headers["etag"]
+    assert asyncio.run(get_all({"If-None-Match": etag})).status_code == 304
+    assert asyncio.run(get_all({"If-Modified-Since": first.headers["last-modified"]})).status_code == 304
+    assert asyncio.run(get_all({"If-None-Match": '"other"'})).status_code == 200
+
+
+def test_all_is_precompressed():
+    asyncio.run(get_all())
+    response = exoplanet._all_response
+    assert json.loads(gzip.decompress(response.encoded["gzip"])) == json.loads(response.body)
+    assert response.encoding("gzip, deflate") == "gzip"
+    assert response.encoding("gzip;q=0, identity") is None
+    assert response.encoding(None) is None
+
+
+def test_csv_change_reloads(tmp_path, monkeypatch):
+    csv_path = tmp_path / "Exoplanet.csv"
+    csv_path.write_text(open(exoplanet.EXOPLANET_CSV).read())
+    monkeypatch.setattr(exoplanet, "EXOPLANET_CSV", str(csv_path))
+
+    before = asyncio.run(get_all())
+    csv_path.write_text(csv_path.read_text().replace("11 Com b", "11 Com c"))
+    os.utime(csv_path, (1, 1))
+    after = asyncio.run(get_all())
+    assert after.headers["etag"] != before.headers["etag"]
+    assert "11 Com c" in [planet["pl_name"] for planet in after.json()]
+
+
+def test_concurrent_loads_do_not_duplicate():
+    threads = [threading.Thread(target=exoplanet.load_exoplanets) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(exoplanet.exoplanet_list) == len(exoplanet.read_exoplanets())
@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+from api import config, lod, tile_cache
+from api.spatial_index import SkyIndex
+
+
+@pytest.fixture(scope="module")
+def index():
+    from test.conftest import synthetic_stars
+    return SkyIndex.build(synthetic_stars(50000, seed=11))
+
+
+def test_box_area():
+    assert lod.box_area(0, 360, -90, 90) == pytest.approx(lod.SKY_AREA)
+    assert lod.box_area(350, 370, -90, 90) == pytest.approx(lod.SKY_AREA / 18)
+
+
+def test_wide_views_read_shallow_tiers(index):
+    wide = lod.mag_tiers(index, lod.SKY_AREA, 3000)
+    narrow = lod.mag_tiers(index, 4, 3000)
+    assert wide[0] is not None and wide[0] < max(config.LOD_MAG_TIERS)
+    assert narrow == [None]
+
+
+@pytest.mark.parametrize("box, n_stars", [((0, 360, -90, 90), 3000), ((10, 50, -20, 20), 500),
+                                          ((-5, 5, 80, 100), 200), ((100, 102, 0, 2), 50)])
+def test_query_index_matches_full_depth(index, box, n_stars):
+    expected = index.query_box(*box, parallax_min=1, n_stars=n_stars)
+    result = lod.query_index(index, *box, n_stars, parallax_min=1)
+    assert np.array_equal(result["source_id"], expected["source_id"])
+
+
+def test_tile_tier_follows_field_of_view(seeded_tile_cache, archive_calls):
+    assert lod.tile_tier(lod.SKY_AREA, 3000) == 90
+    assert lod.tile_tier(lod.box_area(0, 20, 0, 20), 3000) == config.TILE_SIZE_DEG
+
+    columns = lod.query_tiles(0, 360, -90, 90, 3000)
+    assert len(columns["ra"]) == 3000
+    assert np.all(np.diff(columns["phot_g_mean_mag"]) >= 0)
+    assert tile_cache.get_stats()["hits"] == tile_cache.tile_count(90)
+
+
+def test_skyview_dict_sizes():
+    from api.data_api import skyview_dict
+
+    def sizes(mag):
+        return skyview_dict(["x"] * len(mag), mag, mag, mag, mag, mag, mag)["size"].tolist()
+
+    assert sizes([]) == []
+    assert sizes([7.5]) == [20.0]
+    assert sizes([4.0, 4.0, 4.0]) == [20.0, 20.0, 20.0]
+    assert sizes([2.0, 4.0, 6.0]) == [20.0, 10.0, 0.0]
+
+
+@pytest.mark.parametrize("mode", ["proxy", "cartesian"])
+def test_tiny_and_single_star_views(seeded_tile_cache, archive_calls, mode):
+    import asyncio
+
+    import httpx
+
+    import api.star as star
+    from api import catalog
+    from main import app
+
+    catalog.reset()
+    star.skyview_cache.clear()
+    view = {"ex_ra": 90, "ex_dec": -20, "ex_distance": 0.9, "ra": 20, "dec": 20, "mode": mode}
+
+    async def post(url, body):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post(url, json=body)
+
+    tiny = dict(view, fovy_w=0.01, fovy_h=0.01)
+    response = asyncio.run(post("/api/v1/star/skyview/exoplanet/", tiny))
+    assert response.status_code == 200 and response.json() == {"stars": []}
+    batch = {"ex_ra": 90, "ex_dec": -20, "ex_distance": 0.9, "mode": mode,
+             "views": [{"ra": 20, "dec": 20, "fovy_w": 0.01, "fovy_h": 0.01}, {"ra": 20, "dec": 20, "n_stars": 1}]}
+    response = asyncio.run(post("/api/v1/star/skyview/exoplanet/batch", batch))
+    assert response.status_code == 200
+    empty, single = response.json()["views"]
+    assert empty["stars"] == [] and len(single["stars"]) == 1
+
+    single = star.get_skyview_from_exoplanet(90, -20, 0.9, 20, 20, 40, 40, 1, mode=mode)
+    assert single["size"].tolist() == [20.0]
+    star.skyview_cache.clear()
+    catalog.reset()
@@ -0,0 +1,89 @@
+import asyncio
+
+import httpx
+import pytest
+
+import api.star as star
+from api import config, metrics, tile_cache
+from main import app
+
+EXOPLANET_VIEW = {"ex_ra": 90, "ex_dec": -20, "ex_distance": 0.9, "ra": 20, "dec": 20}
+
+
+async def request(method, path, **kwargs):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await client.request(method, path, **kwargs)
+
+
+def sample(text, name):
+    for line in text.splitlines():
+        if line.startswith(name + " "):
+            return float(line.split()[-1])
+    return None
+
+
+@pytest.fixture
+def clear_skyview_cache():
+    star.skyview_cache.clear()
+    yield
+    star.skyview_cache.clear()
+
+
+def test_histogram_render():
+    histogram = metrics.Histogram("test_seconds", "test", "stage", buckets=(0.1, 1))
+    histogram.observe(0.05, "a")
+    histogram.observe(0.5, "a")
+    histogram.observe(5, "a")
+    lines = histogram.render()
+    assert 'test_seconds_bucket{stage="a",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{stage="a",le="1"} 2' in lines
+    assert 'test_seconds_bucket{stage="a",le="+Inf"} 3' in lines
+    assert 'test_seconds_count{stage="a"} 3' in lines
+
+
+def test_server_timing_sums_stages():
+    assert metrics.server_timing([("query", 0.001), ("encode", 0.002), ("query", 0.003)]) == \
+        "query;dur=4.00, encode;dur=2.00"
+
+
+def test_skyview_stages_and_server_timing(seeded_tile_cache, archive_calls, monkeypatch,
+                                          clear_skyview_cache):
+    monkeypatch.setattr(config, "SERVER_TIMING", True)
+    response = asyncio.run(request("POST", "/api/v1/star/skyview/exoplanet/", json=EXOPLANET_VIEW))
+    assert response.status_code == 200
+    stages = [part.split(";")[0] for part in response.headers["server-timing"].split(", ")]
+    for stage in ("query", "skyview", "encode", "total"):
+        assert stage in stages
+
+    text = asyncio.run(request("GET", "/api/v1/metrics")).text
+    assert 'exosky_stage_seconds_count{stage="query"}' in text
+    assert 'exosky_skyview_stars_count{route="exoplanet"}' in text
+    assert 'exosky_request_seconds_count{route="/api/v1/star/skyview/exoplanet/"}' in text
+    assert 'exosky_responses_total{status="200"}' in text
+
+
+def test_server_timing_off_by_default(monkeypatch):
+    monkeypatch.setattr(config, "SERVER_TIMING", False)
+    response = asyncio.run(request("GET", "/api/v1/exoplanet/all"))
+    assert "server-timing" not in response.headers
+
+
+def test_archive_counters(tile_cache_dir, monkeypatch):
+    def fetch_tile(key, size=None, floor=None):
+        if key == (1, 3):
+            raise IOError("archive down")
+        return tile_cache.empty_columns()
+
+    monkeypatch.setattr(tile_cache, "fetch_tile", fetch_tile)
+    before = metrics.render()
+    queries = sample(before, "exosky_archive_queries_total") or 0
+    errors = sample(before, "exosky_archive_errors_total") or 0
+
+    tile_cache.load_tile((0, 3))
+    with pytest.raises(IOError):
+        tile_cache.load_tile((1, 3))
+
+    after = metrics.render()
+    assert sample(after, "exosky_archive_queries_total") == queries + 2
+    assert sample(after, "exosky_archive_errors_total") == errors + 1
@@ -0,0 +1,70 @@
+import asyncio
+
+import httpx
+import numpy as np
+import pytest
+
+from api.planet_catalog import COLUMNS, TEXT_COLUMNS, PlanetCatalog
+from main import app
+
+
+@pytest.fixture(scope="module")
+def planets():
+    rng = np.random.default_rng(5)
+    n = 5000
+    columns = {name: rng.uniform(0, 100, n) for name in COLUMNS if name not in TEXT_COLUMNS}
+    columns.update({name: np.array([""] * n) for name in TEXT_COLUMNS})
+    columns["pl_name"] = np.array(["planet {}".format(i) for i in range(n)])
+    columns["hostname"] = np.array(["{} {}".format(rng.choice(["Kepler", "HD", "TOI"]), i) for i in range(n)])
+    columns["pl_rade"][rng.random(n) < 0.3] = np.nan
+    columns["ra"] = rng.uniform(0, 360, n)
+    columns["dec"] = np.degrees(np.arcsin(rng.uniform(-1, 1, n)))
+    return PlanetCatalog(columns)
+
+
+def test_filters_match_scan(planets):
+    c = planets.columns
+    total, index = planets.query(ranges={"sy_dist": (10, 40), "pl_rade": (None, 50)}, host="kep")
+    expected = np.flatnonzero((c["sy_dist"] >= 10) & (c["sy_dist"] <= 40) & (c["pl_rade"] <= 50) &
+                              np.char.startswith(c["hostname"], "Kepler"))
+    assert total == len(expected)
+    assert sorted(index) == sorted(expected)
+
+
+def test_sort_and_pages(planets):
+    total, first = planets.query(sort="pl_rade", descending=True, limit=10)
+    _, second = planets.query(sort="pl_rade", descending=True, offset=10, limit=10)
+    values = planets.columns["pl_rade"][np.concatenate([first, second])]
+    assert total == len(planets)
+    assert np.all(np.diff(values) <= 0)
+    _, last = planets.query(sort="pl_rade", descending=True, offset=total - 5)
+    assert np.all(np.isnan(planets.columns["pl_rade"][last]))
+
+
+def test_nearest(planets):
+    index, separation = planets.nearest(120, -30, 5)
+    c = planets.columns
+    cos = (np.sin(np.radians(c["dec"])) * np.sin(np.radians(-30)) +
+           np.cos(np.radians(c["dec"])) * np.cos(np.radians(-30)) * np.cos(np.radians(c["ra"] - 120)))
+    assert list(index) == list(np.argsort(-cos)[:5])
+    assert np.all(np.diff(separation) >= 0)
+
+
+def test_routes():
+    async def get(path):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get(path)
+
+    response = asyncio.run(get("/api/v1/exoplanet/search?max_distance=100&sort=sy_dist&limit=2"
+                               "&fields=pl_name,sy_dist"))
+    assert response.status_code == 200
+    body = response.json()
+    assert body["total"] > 2 and len(body["exoplanets"]) == 2
+    assert body["exoplanets"][0].keys() == {"pl_name", "sy_dist"}
+    assert body["exoplanets"][0]["sy_dist"] <= body["exoplanets"][1]["sy_dist"] <= 100
+
+    response = asyncio.run(get("/api/v1/exoplanet/nearest?ra=185.2&dec=17.8"))
+    assert response.json()["exoplanets"][0]["pl_name"] == "11 Com b"
+
+    assert asyncio.run(get("/api/v1/exoplanet/search?sort=bogus")).status_code == 400
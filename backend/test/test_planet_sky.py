@@ -0,0 +1,113 @@
+import os
+import threading
+
+import numpy as np
+
+import api.data_api as data_api
+from api import planet_sky
+from api.exoplanet import Exoplanet
+
+
+def test_find_planet_from_csv():
+    planet = planet_sky.find_planet(185.1787793, 17.7932516, 93.1846)
+    assert planet.pl_name == "11 Com b"
+    assert planet_sky.find_planet(1, 2, 3) is None
+
+
+def test_skyview_uses_precomputed_sky(store_dir, monkeypatch):
+    planet_sky.invalidate()
+    builds = []
+    build = planet_sky.build_planet_sky
+    monkeypatch.setattr(planet_sky, "build_planet_sky", lambda planet: builds.append(planet) or build(planet))
+
+    direct = data_api.get_skyview_from_exoplanet(185.1787793, 17.7932516, 93.1846000 + 1e-3, 40, 10,
+                                                 fovy_w=60, fovy_h=40, n_stars=50, mode="cartesian")
+    assert builds == []
+
+    threads = [threading.Thread(target=data_api.get_skyview_from_exoplanet,
+                                args=(185.1787793, 17.7932516, 93.1846, 40, 10),
+                                kwargs={"mode": "cartesian"}) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(builds) == 1
+
+    cached = data_api.get_skyview_from_exoplanet(185.1787793, 17.7932516, 93.1846, 40, 10,
+                                                 fovy_w=60, fovy_h=40, n_stars=50, mode="cartesian")
+    assert len(builds) == 1
+    assert list(cached["name"][:10]) == list(direct["name"][:10])
+    assert np.allclose(cached["distance"][:10], direct["distance"][:10], rtol=1e-3)
+    planet_sky.invalidate()
+
+
+def test_planet_sky_is_bounded(store_dir, monkeypatch):
+    monkeypatch.setattr(planet_sky.config, "PLANET_SKY_STARS", 100)
+    sky = planet_sky.build_planet_sky(Exoplanet("test b", "test", "1", "20", "10", "-5"))
+    assert len(sky) == 100
+    columns = sky.query(0, 0, 400, 400)
+    assert np.all(np.diff(columns["phot_g_mean_mag"]) >= 0)
+
+
+def test_csv_change_invalidates(store_dir, tmp_path, monkeypatch):
+    from api import exoplanet
+
+    csv_path = tmp_path / "Exoplanet.csv"
+    csv_path.write_text(open(exoplanet.EXOPLANET_CSV).read())
+    monkeypatch.setattr(exoplanet, "EXOPLANET_CSV", str(csv_path))
+    planet_sky.invalidate()
+
+    planet = planet_sky.find_planet(185.1787793, 17.7932516, 93.1846)
+    sky = planet_sky.get_planet_sky(planet)
+    assert planet_sky.get_planet_sky(planet) is sky
+
+    csv_path.write_text(csv_path.read_text().replace("11 Com b", "11 Com c"))
+    os.utime(csv_path, (1, 1))
+    planet = planet_sky.find_planet(185.1787793, 17.7932516, 93.1846)
+    assert planet.pl_name == "11 Com c"
+    assert planet_sky.get_planet_sky(planet) is not sky
+    planet_sky.invalidate()
+
+
+def test_proxy_mode_uses_precomputed_sky(store_dir, monkeypatch):
+    from api import catalog
+
+    planet_sky.invalidate()
+    proxy = data_api.get_skyview_from_exoplanet(185.1787793, 17.7932516, 93.1846, 40, 10,
+                                                fovy_w=60, fovy_h=40, n_stars=50, mode="proxy")
+    cartesian = data_api.get_skyview_from_exoplanet(185.1787793, 17.7932516, 93.1846, 40, 10,
+                                                    fovy_w=60, fovy_h=40, n_stars=50, mode="cartesian")
+    assert [sky.name for sky in planet_sky.skies().values()] == ["11 Com"]
+    assert list(proxy["name"]) == list(cartesian["name"])
+
+    # while the catalog is loading, proxy mode answers with the earth view approximation
+    planet_sky.invalidate()
+
+    def loading(wait=False):
+        raise catalog.CatalogLoading()
+
+    monkeypatch.setattr(catalog, "get_catalog", loading)
+    fallback = data_api.get_skyview_from_exoplanet(185.1787793, 17.7932516, 93.1846, 40, 10,
+                                                   fovy_w=60, fovy_h=40, n_stars=50, mode="proxy")
+    assert 0 < len(fallback["name"]) <= 50
+    planet_sky.invalidate()
+
+
+def test_systems_share_bounded_skies(monkeypatch):
+    monkeypatch.setattr(planet_sky.config, "PLANET_SKY_ENTRIES", 2)
+    builds = []
+    monkeypatch.setattr(planet_sky, "build_planet_sky",
+                        lambda planet: builds.append(planet.pl_name) or planet_sky.PlanetSky(planet.hostname, None))
+    planet_sky.invalidate()
+
+    b = Exoplanet("TOI-1 b", "TOI-1", "1", "20", "10", "-5")
+    c = Exoplanet("TOI-1 c", "TOI-1", "3", "20", "10", "-5")
+    assert planet_sky.get_planet_sky(b) is planet_sky.get_planet_sky(c)
+    assert builds == ["TOI-1 b"]
+
+    for i in range(2):
+        planet_sky.get_planet_sky(Exoplanet("X-{} b".format(i), "X-{}".format(i), "1", "20", str(20 + i), "0"))
+    assert [sky.name for sky in planet_sky.skies().values()] == ["X-0", "X-1"]
+    planet_sky.get_planet_sky(c)
+    assert builds[-1] == "TOI-1 c" and len(planet_sky.skies()) == 2
+    planet_sky.invalidate()
@@ -0,0 +1,99 @@
+import asyncio
+import struct
+import zlib
+
+import httpx
+import numpy as np
+import pytest
+
+import api.star as star
+from api import render
+from main import app
+
+RENDER_URL = "/api/v1/star/render/exoplanet?ex_ra=90&ex_dec=-20&ex_distance=0.9&ra=20&dec=20"
+
+
+def decode_png(data):
+    """
+    Decode the PNGs written by render.encode_png (8 bit RGB, no filters).
+    """
+    assert data[:8] == b"\x89PNG\r\n\x1a\n"
+    position, idat = 8, b""
+    while position < len(data):
+        length, kind = struct.unpack(">I4s", data[position:position + 8])
+        body = data[position + 8:position + 8 + length]
+        if kind == b"IHDR":
+            width, height = struct.unpack(">II", body[:8])
+        elif kind == b"IDAT":
+            idat += body
+        position += 12 + length
+    rows = np.frombuffer(zlib.decompress(idat), dtype=np.uint8).reshape(height, width * 3 + 1)
+    return rows[:, 1:].reshape(height, width, 3)
+
+
+async def get(url, **kwargs):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await client.get(url, **kwargs)
+
+
+@pytest.fixture
+def clear_render_cache():
+    star.render_cache.clear()
+    yield
+    star.render_cache.clear()
+
+
+def test_bv_to_rgb_matches_frontend():
+    colors = render.bv_to_rgb([-1.0, 0.0, 0.65, 1.6, np.nan])
+    np.testing.assert_allclose(colors[0], [0.61, 0.7, 1.0])
+    np.testing.assert_allclose(colors[1], [0.83, 0.87, 1.0])
+    np.testing.assert_allclose(colors[3], [1.0, 0.82, 0.63 - 0.6 * (0.1 / 0.44)**2])
+    np.testing.assert_allclose(colors[4], colors[2])
+
+
+def test_star_lands_where_projected():
+    pixels = render.rasterize([20, 25, 200], [20, 20, 20], [0, 3, 0], [0.6, 0.6, 0.6], 20, 20, 60, 200, 100)
+    assert pixels.shape == (100, 200, 3)
+    # the view center is the corner shared by the four middle pixels
+    y, x = np.unravel_index(np.argmax(pixels.sum(axis=2)), pixels.shape[:2])
+    assert x in (99, 100) and y in (49, 50)
+    # east is to the left, the star behind the observer is not drawn
+    x, _, visible = render.project([25, 200], [20, 20], 20, 20, 60, 200, 100)
+    assert x[0] < 100
+    assert not visible[1]
+    assert pixels.sum() > 0 and pixels[:, 150:].sum() == 0
+
+
+def test_encode_png_round_trip():
+    pixels = np.random.default_rng(0).integers(0, 256, (7, 5, 3), dtype=np.uint8)
+    np.testing.assert_array_equal(decode_png(render.encode_png(pixels)), pixels)
+
+
+def test_render_endpoint(seeded_tile_cache, archive_calls, clear_render_cache):
+    response = asyncio.run(get(RENDER_URL + "&width=320&height=180"))
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/png"
+    assert "max-age" in response.headers["cache-control"]
+    pixels = decode_png(response.content)
+    assert pixels.shape == (180, 320, 3)
+    assert pixels.max() > 0
+
+    # a nearby direction snaps to the same grid point and is served from the cache
+    response = asyncio.run(get(RENDER_URL.replace("ra=20", "ra=20.1") + "&width=320&height=180"))
+    assert response.status_code == 200
+    assert star.render_cache.get_stats()["hits"] == 1
+
+
+@pytest.mark.skipif(render.Image is None, reason="Pillow is not installed")
+def test_render_endpoint_webp(seeded_tile_cache, archive_calls, clear_render_cache):
+    response = asyncio.run(get(RENDER_URL + "&width=64&height=64",
+                               headers={"Accept": "image/avif,image/webp,image/*,*/*;q=0.8"}))
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/webp"
+    assert response.content[:4] == b"RIFF" and response.content[8:12] == b"WEBP"
+
+
+def test_render_endpoint_rejects_bad_parameters():
+    for query in ("&width=0", "&fov=170", "&format=gif", "&mode=magic"):
+        assert asyncio.run(get(RENDER_URL + query)).status_code == 400
@@ -0,0 +1,111 @@
+import warnings
+
+import numpy as np
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+with warnings.catch_warnings():
+    # the test client warns about its httpx backend, the app does not use it
+    warnings.simplefilter("ignore")
+    from starlette.testclient import TestClient
+
+import api.data_api as data_api
+from api import catalog, config, planet_sky, session
+from main import app
+
+SESSION_URL = "/api/v1/star/session/exoplanet"
+OPEN = {"ex_ra": 90, "ex_dec": -20, "ex_distance": 0.9, "ra": 20, "dec": 20, "fovy_w": 40, "fovy_h": 30,
+        "n_stars": 300}
+
+
+@pytest.fixture
+def sky(seeded_tile_cache, archive_calls):
+    catalog.reset()
+    planet_sky.invalidate()
+    session.clear_catalog_views()
+    yield
+    catalog.reset()
+    session.clear_catalog_views()
+
+
+def apply(screen, reply):
+    """
+    Client side of the protocol: the stars on screen by session id.
+    """
+    for star_id in reply["leave"]:
+        del screen[star_id]
+    columns = reply["enter"]["columns"]
+    for i, star_id in enumerate(columns["id"]):
+        assert star_id not in screen
+        screen[star_id] = (columns["name"][i], columns["ra"][i], columns["dec"][i])
+    assert len(screen) == reply["count"]
+
+
+def test_deltas_rebuild_the_view(sky):
+    screen = {}
+    with TestClient(app).websocket_connect(SESSION_URL) as ws:
+        ws.send_json(OPEN)
+        first = ws.receive_json()
+        apply(screen, first)
+        assert first["leave"] == [] and first["count"] == 300
+
+        for seq, ra in enumerate((22, 25, 60, 25), start=1):
+            ws.send_json({"ra": ra, "seq": seq})
+            reply = ws.receive_json()
+            assert reply["seq"] == seq
+            assert reply["view"] == {"ra": ra, "dec": 20, "fovy_w": 40, "fovy_h": 30}
+            apply(screen, reply)
+
+            # the stars on screen are those of a full skyview of the same camera
+            expected = data_api.get_skyview_from_exoplanet(90, -20, 0.9, ra, 20, 40, 30, 300, mode="cartesian")
+            names = sorted(screen.values())
+            assert [name for name, _, _ in names] == sorted(expected["name"])
+            order = np.argsort(expected["name"])
+            np.testing.assert_allclose([ra for _, ra, _ in names], expected["ra"][order])
+            if ra == 22:
+                # a small pan only sends the few stars that came into view
+                assert 0 < reply["enter"]["count"] < 100
+    assert len(session.sessions) == 0
+
+
+def test_invalid_messages(sky):
+    client = TestClient(app)
+    with client.websocket_connect(SESSION_URL) as ws:
+        ws.send_json(dict(OPEN, ex_distance=None))
+        assert ws.receive_json() == {"error": "Invalid parameters"}
+        with pytest.raises(WebSocketDisconnect) as closed:
+            ws.receive_json()
+        assert closed.value.code == 1008
+
+    with client.websocket_connect(SESSION_URL) as ws:
+        ws.send_json(OPEN)
+        ws.receive_json()
+        ws.send_json({"fovy_w": 500})
+        assert "error" in ws.receive_json()
+        # the session is still usable
+        ws.send_json({"ra": 21, "seq": 7})
+        assert ws.receive_json()["seq"] == 7
+
+
+def test_idle_and_evicted_sessions_close(sky, monkeypatch):
+    client = TestClient(app)
+    monkeypatch.setattr(config, "SESSION_IDLE_TIMEOUT", 0.2)
+    with client.websocket_connect(SESSION_URL) as ws:
+        ws.send_json(OPEN)
+        ws.receive_json()
+        with pytest.raises(WebSocketDisconnect) as closed:
+            ws.receive_json()
+        assert closed.value.code == 1001
+
+    monkeypatch.setattr(config, "SESSION_IDLE_TIMEOUT", 30)
+    monkeypatch.setattr(config, "SESSION_MAX", 1)
+    with client.websocket_connect(SESSION_URL) as first:
+        first.send_json(OPEN)
+        first.receive_json()
+        with client.websocket_connect(SESSION_URL) as second:
+            second.send_json(OPEN)
+            second.receive_json()
+            with pytest.raises(WebSocketDisconnect) as closed:
+                first.receive_json()
+            assert closed.value.code == 1001
+            assert len(session.sessions) == 1
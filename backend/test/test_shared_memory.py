@@ -0,0 +1,96 @@
+import shutil
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+import api.data_api as data_api
+from api import catalog, config, exoplanet, planet_sky, shared_memory, tile_cache
+
+
+@pytest.fixture
+def shared_state():
+    """
+    Undo the shared tiles, catalog and skies installed by a test, then drop its segments.
+    """
+    segments = []
+    yield segments
+    tile_cache.share_tiles({})
+    catalog.reset()
+    planet_sky.invalidate()
+    for segment in segments:
+        segment.close()
+    for segment in segments:
+        try:
+            segment.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def test_round_trip(shared_state):
+    arrays = {
+        "a/ra": np.linspace(0, 1, 5),
+        "a/source_id": np.arange(5, dtype=np.int64),
+        "a/DESIGNATION": np.array(["Gaia DR2 1", "Gaia DR2 22"]),
+        "xyz": np.ones((3, 3), dtype=np.float32),
+    }
+    created = shared_memory.SharedArrays.create(arrays, {"note": "test"})
+    attached = shared_memory.SharedArrays.attach(created.name)
+    shared_state += [attached, created]
+
+    assert attached.meta == {"note": "test"}
+    for key, values in arrays.items():
+        assert attached.arrays[key].dtype == values.dtype
+        np.testing.assert_array_equal(attached.arrays[key], values)
+        assert not attached.arrays[key].flags.writeable
+    assert sorted(attached.group("a")) == ["DESIGNATION", "ra", "source_id"]
+
+
+def test_segment_outlives_worker(shared_state):
+    created = shared_memory.SharedArrays.create({"values": np.arange(1000, dtype=np.float64)})
+    shared_state.append(created)
+    script = ("from api.shared_memory import SharedArrays\n"
+              "print(SharedArrays.attach({!r}).arrays['values'].sum())".format(created.name))
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True,
+                            cwd=config.BACKEND_DIR)
+    assert float(result.stdout) == 499500
+    # the worker exiting does not unlink the segment
+    attached = shared_memory.SharedArrays.attach(created.name)
+    shared_state.insert(0, attached)
+    assert attached.arrays["values"][-1] == 999
+
+
+def test_skyviews_from_shared_star_data(seeded_tile_cache, archive_calls, monkeypatch, shared_state):
+    monkeypatch.setattr(config, "SKYVIEW_MODE", "cartesian")
+    monkeypatch.setattr(config, "PLANET_SKY_WARM", True)
+    monkeypatch.setattr(config, "PLANET_SKY_STARS", 2000)
+    catalog.reset()
+    planet_sky.invalidate()
+    exoplanet.load_exoplanets()
+    planet = exoplanet.exoplanet_list[0]
+    planet_view = (float(planet.ra), float(planet.dec), float(planet.sy_dist), 20, 20)
+    expected_planet = data_api.get_skyview_from_exoplanet(*planet_view)
+    expected_other = data_api.get_skyview_from_exoplanet(90, -20, 0.9, 20, 20)
+    expected_earth = data_api.get_skyview_from_earth(40, 0)
+
+    created = shared_memory.publish()
+    shared_state.append(created)
+    assert created.meta["catalog"]
+    assert planet.hostname in [sky["name"] for sky in created.meta["skies"]]
+
+    attached = shared_memory.SharedArrays.attach(created.name)
+    shared_state.insert(0, attached)
+    shared_memory.install(attached)
+    # everything is served from the segment, even with the disk cache gone
+    shutil.rmtree(config.TILE_CACHE_DIR)
+    tile_cache.clear_memory()
+    assert not catalog.get_catalog().xyz.flags.writeable
+
+    for view, expected in ((planet_view, expected_planet), ((90, -20, 0.9, 20, 20), expected_other)):
+        star_info = data_api.get_skyview_from_exoplanet(*view)
+        np.testing.assert_array_equal(star_info["name"], expected["name"])
+        np.testing.assert_allclose(star_info["ra"], expected["ra"])
+    star_info = data_api.get_skyview_from_earth(40, 0)
+    np.testing.assert_array_equal(star_info["name"], expected_earth["name"])
+    assert archive_calls == []
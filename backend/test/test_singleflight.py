@@ -0,0 +1,53 @@
+import asyncio
+
+from api.singleflight import SingleFlightCache, quantize
+
+
+def test_quantize():
+    assert quantize(20.26, 0.5) == 20.5
+    assert quantize(-0.2, 0.5) == 0
+    assert quantize(1.234, 0) == 1.234
+
+
+def test_ttl_and_lru(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr("api.singleflight.time.monotonic", lambda: clock[0])
+    cache = SingleFlightCache(ttl=10, max_entries=2)
+    calls = []
+
+    async def compute(key):
+        calls.append(key)
+        return key * 2
+
+    async def get(key):
+        return await cache.task(key, lambda: compute(key))
+
+    async def scenario():
+        assert await get(1) == 2
+        assert await get(1) == 2
+        await get(2)
+        await get(3)
+        await get(1)
+        clock[0] += 11
+        await get(1)
+
+    asyncio.run(scenario())
+    assert calls == [1, 2, 3, 1, 1]
+    assert cache.get_stats()["hits"] == 1
+
+
+def test_failures_are_not_cached():
+    cache = SingleFlightCache(ttl=10, max_entries=2)
+
+    async def fail():
+        raise ValueError("archive down")
+
+    async def scenario():
+        for _ in range(2):
+            try:
+                await cache.task("key", fail)
+            except ValueError:
+                pass
+
+    asyncio.run(scenario())
+    assert cache.get_stats()["misses"] == 2
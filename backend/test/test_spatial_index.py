@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from api.spatial_index import SkyIndex, cell_of, normalize_box, unit_vectors
+
+
+def brute_force_cone(stars, ra, dec, radius):
+    vectors = unit_vectors(stars["ra"], stars["dec"])
+    return vectors @ unit_vectors(ra, dec) >= np.cos(np.radians(radius))
+
+
+@pytest.fixture(scope="module")
+def index():
+    from test.conftest import synthetic_stars
+    stars = synthetic_stars(50000, seed=7)
+    return stars, SkyIndex.build(stars)
+
+
+def test_cells_cover_sphere():
+    vectors = unit_vectors(np.random.default_rng(1).uniform(0, 360, 10000),
+                           np.random.default_rng(2).uniform(-90, 90, 10000))
+    cells = cell_of(vectors, 8)
+    assert cells.min() >= 0 and cells.max() < 6 * 64
+
+
+@pytest.mark.parametrize("ra, dec, radius", [(10, 10, 5), (0.5, 0, 3), (200, 89, 4), (300, -90, 10), (45, 20, 120)])
+def test_query_cone(index, ra, dec, radius):
+    stars, sky = index
+    result = sky.query_cone(ra, dec, radius)
+    expected = brute_force_cone(stars, ra, dec, radius)
+    assert sorted(result["source_id"]) == sorted(stars["source_id"][expected])
+    assert np.all(np.diff(result["phot_g_mean_mag"]) >= 0)
+
+
+def test_query_cone_brightness_and_distance(index):
+    stars, sky = index
+    result = sky.query_cone(120, -30, 20, mag_max=8, distance_max=100)
+    expected = (brute_force_cone(stars, 120, -30, 20) & (stars["phot_g_mean_mag"] <= 8) &
+                (stars["parallax"] > 10))
+    assert sorted(result["source_id"]) == sorted(stars["source_id"][expected])
+
+
+@pytest.mark.parametrize("box", [(-20, 20, -10, 10), (340, 380, -10, 10), (100, 140, 70, 110), (0, 400, -90, 90)])
+def test_query_box_wraparound_and_poles(index, box):
+    stars, sky = index
+    ra_start, ra_width, dec_min, dec_max = normalize_box(*box)
+    result = sky.query_box(*box)
+    in_ra = ((stars["ra"] - ra_start) % 360 <= ra_width) if ra_width < 360 else True
+    expected = in_ra & (stars["dec"] >= dec_min) & (stars["dec"] <= dec_max)
+    assert len(result["ra"]) > 0
+    assert sorted(result["source_id"]) == sorted(stars["source_id"][expected])
+
+
+def test_query_box_limit(index):
+    stars, sky = index
+    result = sky.query_box(10, 50, -20, 20, parallax_min=20, n_stars=10)
+    assert len(result["ra"]) == 10
+    assert np.all(result["parallax"] > 20)
+
+
+@pytest.mark.parametrize("box", [(-20, 20, -10, 10), (0, 400, -90, 90)])
+def test_iter_box_is_brightness_ordered(index, box):
+    stars, sky = index
+    chunks = list(sky.iter_box(*box, parallax_min=2, chunk_size=500))
+    assert all(len(chunk["ra"]) == 500 for chunk in chunks[:-1])
+    mag = np.concatenate([chunk["phot_g_mean_mag"] for chunk in chunks])
+    assert np.all(np.diff(mag) >= 0)
+    expected = sky.query_box(*box, parallax_min=2)
+    expected_ids = expected["source_id"][np.isfinite(expected["phot_g_mean_mag"])]
+    assert sorted(np.concatenate([chunk["source_id"] for chunk in chunks])) == sorted(expected_ids)
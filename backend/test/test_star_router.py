@@ -0,0 +1,223 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+import api.star as star
+from api import config
+from main import app
+
+EXOPLANET_VIEW = {"ex_ra": 90, "ex_dec": -20, "ex_distance": 0.9, "ra": 20, "dec": 20}
+
+
+def slow_skyview(*args, **kwargs):
+    time.sleep(0.3)
+    return {"name": ["Gaia DR2 1"], "ra": [1.0], "dec": [2.0], "brightness": [3.0], "bv": [0.5]}
+
+
+async def post_and_list():
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        finished = []
+
+        async def skyview():
+            response = await client.post("/api/v1/star/skyview/exoplanet/", json=EXOPLANET_VIEW)
+            finished.append("skyview")
+            return response
+
+        async def exoplanets():
+            await asyncio.sleep(0.05)
+            response = await client.get("/api/v1/exoplanet/all")
+            finished.append("exoplanets")
+            return response
+
+        responses = await asyncio.gather(skyview(), exoplanets())
+        return responses, finished
+
+
+@pytest.fixture
+def slow_archive(monkeypatch):
+    calls = []
+
+    def skyview(*args, **kwargs):
+        calls.append(args)
+        return slow_skyview()
+
+    monkeypatch.setattr(star, "get_skyview_from_exoplanet", skyview)
+    star.skyview_cache.clear()
+    yield calls
+    star.skyview_cache.clear()
+
+
+def test_skyview_does_not_block_event_loop(slow_archive):
+    (skyview, exoplanets), finished = asyncio.run(post_and_list())
+    assert skyview.status_code == 200
+    assert skyview.json()["stars"][0] == {"name": "Gaia DR2 1", "ra": "1.0", "dec": "2.0",
+                                          "vmag": "3.0", "bv": "0.5"}
+    assert exoplanets.status_code == 200
+    assert finished == ["exoplanets", "skyview"]
+
+
+def test_skyview_timeout(slow_archive, monkeypatch):
+    monkeypatch.setattr(config, "SKYVIEW_TIMEOUT", 0.05)
+    (skyview, _), _ = asyncio.run(post_and_list())
+    assert skyview.status_code == 504
+
+
+def test_skyview_overload(slow_archive, monkeypatch):
+    monkeypatch.setattr(config, "SKYVIEW_MAX_PENDING", 0)
+    (skyview, _), _ = asyncio.run(post_and_list())
+    assert skyview.status_code == 503
+
+
+def test_disconnect_abandons_call():
+    from api.executor import ClientDisconnected, run_blocking
+
+    class GoneRequest:
+        async def is_disconnected(self):
+            return True
+
+    with pytest.raises(ClientDisconnected):
+        asyncio.run(run_blocking(GoneRequest(), time.sleep, 0.3))
+
+
+def test_identical_requests_are_coalesced(slow_archive):
+    async def burst():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            views = [dict(EXOPLANET_VIEW, ra=20 + 0.01 * i) for i in range(8)]
+            responses = await asyncio.gather(*[client.post("/api/v1/star/skyview/exoplanet/", json=view)
+                                               for view in views])
+            responses.append(await client.post("/api/v1/star/skyview/exoplanet/", json=EXOPLANET_VIEW))
+            stats = (await client.get("/api/v1/star/cache/stats")).json()
+            return responses, stats
+
+    responses, stats = asyncio.run(burst())
+    assert all(response.status_code == 200 for response in responses)
+    assert len(slow_archive) == 1
+    assert stats["skyview"]["misses"] == 1
+    assert stats["skyview"]["coalesced"] == 7
+    assert stats["skyview"]["hits"] == 1
+
+
+def test_nearby_fields_of_view_share_a_computation(slow_archive):
+    async def burst():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            views = [dict(EXOPLANET_VIEW, fovy_w=40 + 0.1 * i, fovy_h=30 - 0.1 * i) for i in range(2)]
+            return await asyncio.gather(*[client.post("/api/v1/star/skyview/exoplanet/", json=view)
+                                          for view in views])
+
+    responses = asyncio.run(burst())
+    assert all(response.status_code == 200 for response in responses)
+    assert len(slow_archive) == 1
+    assert slow_archive[0][5:7] == (40.0, 30.0)
+    assert star.skyview_cache.get_stats()["coalesced"] == 1
+
+
+def test_earth_stream_chunks(store_dir, monkeypatch):
+    import json
+
+    import numpy as np
+
+    monkeypatch.setattr(config, "SKYVIEW_STREAM_CHUNK", 100)
+
+    async def stream(accept):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/api/v1/star/skyview/earth/stream", headers={"Accept": accept},
+                                     json={"ra": 40, "dec": 10, "n_stars": 150})
+
+    response = asyncio.run(stream("*/*"))
+    assert response.headers["content-type"] == "application/x-ndjson"
+    chunks = [json.loads(line) for line in response.text.splitlines()]
+    assert [chunk["count"] for chunk in chunks] == [100, 50]
+    vmag = [v for chunk in chunks for v in chunk["columns"]["vmag"]]
+    assert vmag == sorted(vmag)
+
+    response = asyncio.run(stream("application/vnd.exosky.float32"))
+    body, counts, first = response.content, [], None
+    while body:
+        count, names_length = np.frombuffer(body[:8], dtype="<u4")
+        columns = np.frombuffer(body[8:8 + 16 * count], dtype="<f4").reshape(4, count)
+        if first is None:
+            first = columns[2]
+        counts.append(int(count))
+        body = body[8 + 16 * count + names_length:]
+    assert counts == [100, 50]
+    assert np.allclose(first, vmag[:100])
+
+
+def test_batch_shares_catalog_view(store_dir, monkeypatch):
+    import api.data_api as data_api
+
+    calls = []
+    catalog_view_from = data_api.catalog_view_from
+
+    def counting_view_from(*args):
+        calls.append(args)
+        return catalog_view_from(*args)
+
+    monkeypatch.setattr(data_api, "catalog_view_from", counting_view_from)
+    star.skyview_cache.clear()
+    body = dict(EXOPLANET_VIEW, mode="cartesian", n_stars=100, fovy_w=30, fovy_h=30,
+                views=[{"ra": 20, "dec": 20}, {"ra": 50, "dec": -10, "n_stars": 10}, {"ra": 20, "dec": 20}],
+                cube_map=True)
+    del body["ra"], body["dec"]
+
+    async def post():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            batch = await client.post("/api/v1/star/skyview/exoplanet/batch", json=body)
+            single = await client.post("/api/v1/star/skyview/exoplanet/",
+                                       json=dict(EXOPLANET_VIEW, mode="cartesian", n_stars=10,
+                                                 fovy_w=30, fovy_h=30, ra=50, dec=-10))
+            return batch, single
+
+    batch, single = asyncio.run(post())
+    star.skyview_cache.clear()
+    assert batch.status_code == 200
+    views = batch.json()["views"]
+    assert len(views) == 9
+    assert len(calls) == 2  # once for the batch, once for the single view
+    assert views[0] == views[2]
+    assert len(views[0]["stars"]) == 100
+    assert views[1]["stars"] == single.json()["stars"]
+    assert [view["face"] for view in views[3:]] == ["+ra0", "+ra90", "+ra180", "+ra270", "north", "south"]
+
+
+def test_streams_follow_field_of_view(store_dir):
+    import json
+
+    import numpy as np
+
+    async def stream(url, body):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post(url, json=body)
+
+    def stars(response):
+        return [star for line in response.text.splitlines() for star in zip(*[
+            json.loads(line)["columns"][name] for name in ("ra", "dec")])]
+
+    view = {"ra": 40, "dec": 10, "fovy_w": 30, "fovy_h": 16}
+    earth = stars(asyncio.run(stream("/api/v1/star/skyview/earth/stream", view)))
+    assert earth and all(abs(ra - 40) <= 15 and abs(dec - 10) <= 8 for ra, dec in earth)
+
+    exoplanet = dict(view, ex_ra=90, ex_dec=-20, ex_distance=50, fovy_w=20, fovy_h=20)
+    sky = stars(asyncio.run(stream("/api/v1/star/skyview/exoplanet/stream", exoplanet)))
+    assert sky and all(abs(ra - 40) <= 10 and abs(dec - 10) <= 10 for ra, dec in sky)
+    response = asyncio.run(stream("/api/v1/star/skyview/exoplanet/stream", dict(exoplanet, mode="proxy")))
+    assert response.status_code == 400
+
+    # the earth view keeps fractional directions and its own field of view
+    star.skyview_cache.clear()
+    response = asyncio.run(stream("/api/v1/star/skyview/earth/", dict(view, ra=40.5, n_stars=5)))
+    from api.data_api import angular_distance
+
+    _, catalog = store_dir
+    inside = (np.abs(catalog["ra"] - 40.5) <= 15) & (np.abs(catalog["dec"] - 10) <= 8)
+    nearest = np.argsort(angular_distance(40.5, 10, catalog["ra"][inside], catalog["dec"][inside]))[:5]
+    assert [s["name"] for s in response.json()["stars"]] == catalog["DESIGNATION"][inside][nearest].tolist()
+    star.skyview_cache.clear()
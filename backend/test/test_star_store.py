@@ -0,0 +1,31 @@
+import numpy as np
+
+import api.data_api as data_api
+from api import star_store
+
+
+def test_ingest_layout(store_dir):
+    out, stars = store_dir
+    store = star_store.get_store()
+    assert len(store) == len(stars["ra"])
+    assert isinstance(store.columns["dec"], np.memmap)
+    assert store.index.offsets[-1] == len(store)
+    assert np.all(np.diff(store.index.offsets) >= 0)
+
+
+def test_query_box_matches_brute_force(store_dir):
+    out, stars = store_dir
+    columns = star_store.get_store().query_box(100, 160, -20, 35, parallax_min=5, n_stars=None)
+    expected = ((stars["ra"] >= 100) & (stars["ra"] <= 160) & (stars["dec"] >= -20) &
+                (stars["dec"] <= 35) & (stars["parallax"] > 5))
+    assert sorted(columns["source_id"]) == sorted(stars["source_id"][expected])
+    assert np.all(np.diff(columns["phot_g_mean_mag"]) >= 0)
+    assert columns["DESIGNATION"][0].startswith("Gaia DR2 ")
+
+
+def test_skyview_from_store(store_dir, archive_calls):
+    star_info = data_api.get_skyview_from_exoplanet(90, -20, 0.9, 20, 20)
+    assert 0 < len(star_info["name"]) <= 3000
+    star_info = data_api.get_skyview_from_earth(40, 0)
+    assert 0 < len(star_info["name"]) <= 50
+    assert archive_calls == []
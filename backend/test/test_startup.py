@@ -0,0 +1,38 @@
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_import_skips_heavy_modules():
+    code = ("import sys, main; "
+            "print(','.join(m for m in ('astropy', 'astroquery', 'matplotlib', 'pandas') if m in sys.modules))")
+    env = dict(os.environ, EXOSKY_ENABLE_TEST_ROUTES="0")
+    output = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    assert output.strip() == ""
+
+
+def test_exoplanets_loaded_on_startup(monkeypatch):
+    import asyncio
+
+    import httpx
+
+    from api import config, exoplanet
+    from main import app, lifespan
+
+    monkeypatch.setattr(config, "CATALOG_PRELOAD", False)
+    monkeypatch.setattr(exoplanet, "_all_response", None)
+    monkeypatch.setattr(exoplanet, "_csv_mtime", None)
+
+    async def start_and_list():
+        async with lifespan(app):
+            assert exoplanet._all_response is not None
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await client.get("/api/v1/exoplanet/all")
+
+    response = asyncio.run(start_and_list())
+    assert response.status_code == 200
+    assert len(response.json()) == len(exoplanet.exoplanet_list) > 0
@@ -0,0 +1,85 @@
+import os
+
+import numpy as np
+
+import api.data_api as data_api
+from api import config, tile_cache
+
+
+def test_tile_key_and_bounds():
+    key = tile_cache.tile_key(359.9, 90)
+    ra_min, ra_max, dec_min, dec_max = tile_cache.tile_bounds(key)
+    assert ra_min <= 359.9 < ra_max
+    assert dec_min < 90 <= dec_max
+    assert tile_cache.tile_key(-10, 0) == tile_cache.tile_key(350, 0)
+
+
+def test_skyview_from_seeded_cache(seeded_tile_cache, archive_calls):
+    star_info = data_api.get_skyview_from_exoplanet(90, -20, 0.9, 20, 20)
+    assert archive_calls == []
+    assert tile_cache.get_stats()["misses"] == 0
+    assert tile_cache.get_stats()["hits"] > 0
+    assert 0 < len(star_info["name"]) <= 3000
+
+    star_info = data_api.get_skyview_from_earth(40, 0)
+    assert archive_calls == []
+    assert 0 < len(star_info["name"]) <= 50
+    assert np.all(np.diff(star_info["distance"]) >= 0)
+    assert np.all(np.abs(np.array(star_info["dec"])) <= 20)
+
+
+def test_query_box_filters(seeded_tile_cache, archive_calls):
+    stars = seeded_tile_cache
+    columns = tile_cache.query_box(10, 50, -30, 10, parallax_min=10)
+    expected = ((stars["ra"] >= 10) & (stars["ra"] <= 50) & (stars["dec"] >= -30) &
+                (stars["dec"] <= 10) & (stars["parallax"] > 10))
+    assert len(columns["ra"]) == expected.sum()
+    assert np.all(np.diff(columns["phot_g_mean_mag"]) >= 0)
+
+    columns = tile_cache.query_box(10, 50, -30, 10, n_stars=5)
+    assert len(columns["ra"]) == 5
+
+
+def test_iter_box_walks_bands(seeded_tile_cache, archive_calls):
+    for box in ((100, 200, -40, 30), (340, 380, -20, 50)):
+        expected = tile_cache.query_box(*box, parallax_min=5)
+        chunks = list(tile_cache.iter_box(*box, parallax_min=5, chunk_size=100))
+        assert len(chunks) > 3 and all(len(chunk["ra"]) <= 100 for chunk in chunks)
+        walked = tile_cache.concat_columns(chunks)
+        np.testing.assert_array_equal(walked["source_id"], expected["source_id"])
+    assert archive_calls == []
+
+
+def test_miss_fetches_once(tile_cache_dir, monkeypatch, make_stars):
+    calls = []
+
+    def fetch_tile(key, size=None, floor=None):
+        calls.append(key)
+        return tile_cache.empty_columns()
+
+    monkeypatch.setattr(tile_cache, "fetch_tile", fetch_tile)
+    tile_cache.query_box(0, 10, 0, 10)
+    tile_cache.clear_memory()
+    tile_cache.query_box(0, 10, 0, 10)
+    assert calls == [(0, 3)]
+    assert tile_cache.get_stats() == {"hits": 1, "misses": 1, "evictions": 0}
+
+
+def test_eviction(tile_cache_dir, monkeypatch, make_stars):
+    stars = make_stars(1000)
+    tile_cache.store_tile((0, 0), stars)
+    size = os.path.getsize(os.path.join(tile_cache.cache_dir(), "0_0.npz"))
+    monkeypatch.setattr(config, "TILE_CACHE_MAX_BYTES", int(size * 2.5))
+
+    tile_cache.store_tile((1, 0), stars)
+    tile_cache.store_tile((2, 0), stars)
+    assert tile_cache.get_stats()["evictions"] == 1
+    assert sorted(os.listdir(tile_cache.cache_dir())) == ["1_0.npz", "2_0.npz"]
+
+
+def test_query_box_wraps_ra(seeded_tile_cache, archive_calls):
+    stars = seeded_tile_cache
+    columns = tile_cache.query_box(-20, 20, -10, 10)
+    expected = (((stars["ra"] >= 340) | (stars["ra"] <= 20)) &
+                (stars["dec"] >= -10) & (stars["dec"] <= 10))
+    assert sorted(columns["source_id"]) == sorted(stars["source_id"][expected])
@@ -0,0 +1,48 @@
+import math
+
+import numpy as np
+import pytest
+
+import api.data_api as data_api
+
+
+def test_xyz_round_trip_arrays():
+    ra = np.array([0.0, 45.0, 359.0, 180.0])
+    dec = np.array([0.0, 30.0, -60.0, 89.0])
+    x, y, z = data_api.ra_dec_to_xyz(ra, dec, np.array([1.0, 2.0, 3.0, 4.0]))
+    ra2, dec2 = data_api.xyz_to_ra_dec(x, y, z)
+    assert np.allclose(ra2, ra)
+    assert np.allclose(dec2, dec)
+
+
+def test_exoplanet_view_matches_scalar_path(make_stars):
+    stars = make_stars(2000)
+    field = np.flatnonzero(stars["ra"] < 40)[:200]
+    stars = {name: values[field] for name, values in stars.items()}
+    distance = 1000 / stars["parallax"]
+    ra_values, dec_values, new_distance = data_api.exoplanet_view(
+        90, -20, 12, 20, 20, stars["ra"], stars["dec"], distance)
+
+    for i in range(0, len(field), 17):
+        x, y, z = data_api.get_relative_pos(90, -20, 12, stars["ra"][i], stars["dec"][i], distance[i])
+        assert math.isclose(new_distance[i], math.sqrt(x**2 + y**2 + z**2))
+        assert math.isclose(ra_values[i], 20 + stars["ra"][i] - np.mean(stars["ra"]))
+    assert np.allclose(data_api.bv_color_index(stars["phot_bp_mean_mag"], stars["phot_rp_mean_mag"]),
+                       0.751 * (stars["phot_bp_mean_mag"] - stars["phot_rp_mean_mag"]))
+
+
+@pytest.mark.parametrize("ra", [0, 5, 359])
+def test_exoplanet_view_across_ra_zero(make_stars, ra):
+    stars = make_stars(5000)
+    inside = np.abs((stars["ra"] - ra + 180) % 360 - 180) < 10
+    ra_values, _, _ = data_api.exoplanet_view(90, -20, 12, ra, 0, stars["ra"][inside], stars["dec"][inside],
+                                              1000 / stars["parallax"][inside])
+    assert np.all(np.abs(ra_values - ra) < 12)
+    assert abs(np.mean(ra_values) - ra) < 1e-9
+
+
+def test_proxy_view_across_ra_zero(seeded_tile_cache, archive_calls):
+    for ra in (0, 359):
+        view = data_api.get_skyview_from_exoplanet(123.4, 10, 15, ra, 0, 20, 20, n_stars=200, mode="proxy")
+        assert len(view["ra"]) > 100
+        assert np.all(np.abs(view["ra"] - ra) < 12)